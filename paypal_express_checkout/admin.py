@@ -1,8 +1,22 @@
 """Admins for the models of the ``paypal_express_checkout`` app."""
 import django
 from django.contrib import admin
+from django.db.models import (
+    Case,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils.translation import ugettext_lazy as _
 
 from . import models
+from .changelist import LargeTableAdminMixin
+from .export import export_response
 
 
 try:
@@ -13,6 +27,25 @@ except AttributeError:
 username_field = getattr(user_model, 'USERNAME_FIELD', 'username')
 
 
+def export_csv(modeladmin, request, queryset):
+    return export_response(queryset, 'csv')
+
+
+def export_jsonl(modeladmin, request, queryset):
+    return export_response(queryset, 'jsonl')
+
+
+export_csv.short_description = _('Export selected as CSV')
+export_jsonl.short_description = _('Export selected as JSON lines')
+
+
+class ErrorBucketAdmin(admin.ModelAdmin):
+    """Custom admin for the ``ErrorBucket`` model."""
+    list_display = ['minute', 'api_url', 'error_code', 'count', 'last_seen']
+    list_filter = ['error_code']
+    date_hierarchy = 'minute'
+
+
 class ItemAdmin(admin.ModelAdmin):
     """Custom admin for the ``Item`` model."""
     list_display = ['name', 'description_short', 'value']
@@ -22,31 +55,44 @@ class ItemAdmin(admin.ModelAdmin):
         return '{0}...'.format(obj.description[:50])
 
 
-class PaymentTransactionAdmin(admin.ModelAdmin):
+class PaymentTransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Custom admin for the ``PaymentTransaction`` model."""
+    actions = [export_csv, export_jsonl]
     list_display = [
         'creation_date', 'date', 'user', 'user_email', 'transaction_id',
         'value', 'status',
     ]
     search_fields = [
-        'transaction_id', 'status', 'user__email', 'user__' + username_field]
+        'transaction_id', 'correlation_id', 'status', 'user__email',
+        'user__' + username_field]
     date_hierarchy = 'creation_date'
+    keyset_ordering = ['-creation_date', '-pk']
     list_filter = ['status']
+    list_select_related = ['user']
     raw_id_fields = ['user', ]
 
     def user_email(self, obj):
         return obj.user.email
+    user_email.admin_order_field = 'user__email'
 
 
 class PaymentTransactionErrorAdmin(admin.ModelAdmin):
     """Custom admin for the ``PaymentTransactionError`` model."""
+    actions = [export_csv, export_jsonl]
     list_display = [
         # FIXME 'transaction_id'
         'date', 'user', 'user_email', 'response_short',
     ]
+    list_select_related = ['user']
+    raw_id_fields = ['bucket']
+
+    def get_queryset(self, request):
+        qs = super(PaymentTransactionErrorAdmin, self).get_queryset(request)
+        return qs.defer('request_data')
 
     def user_email(self, obj):
         return obj.user.email
+    user_email.admin_order_field = 'user__email'
 
     def response_short(self, obj):
         return '{0}...'.format(obj.response[:50])
@@ -55,8 +101,9 @@ class PaymentTransactionErrorAdmin(admin.ModelAdmin):
         return obj.transaction_id
 
 
-class PurchasedItemAdmin(admin.ModelAdmin):
+class PurchasedItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Custom admin for the ``PurchasedItem`` model."""
+    actions = [export_csv, export_jsonl]
     list_display = [
         'identifier', 'date', 'user', 'user_email', 'transaction', 'item',
         'price', 'quantity', 'subtotal', 'total', 'status',
@@ -65,29 +112,44 @@ class PurchasedItemAdmin(admin.ModelAdmin):
         'identifier', 'transaction__status', 'item', ]
     search_fields = [
         'transaction__transaction_id', 'user__email', ]
+    list_select_related = ['transaction', 'user', 'item']
     raw_id_fields = ['user', 'transaction', ]
 
+    def get_queryset(self, request):
+        qs = super(PurchasedItemAdmin, self).get_queryset(request)
+        # the price at the time of the purchase or else the current value of
+        # the item, like the old per row calculation
+        price = Case(
+            When(Q(price__isnull=True) | Q(price=0), then=Coalesce(
+                'item__value', Value(0), output_field=DecimalField())),
+            default=F('price'),
+            output_field=FloatField(),
+        )
+        return qs.annotate(_subtotal=ExpressionWrapper(
+            price * F('quantity'), output_field=FloatField()))
+
     def date(self, obj):
         return obj.transaction.date
+    date.admin_order_field = 'transaction__date'
 
     def status(self, obj):
         return obj.transaction.status
+    status.admin_order_field = 'transaction__status'
 
     def subtotal(self, obj):
-        price = 0
-        if obj.item is not None:
-            price = obj.item.value
-        if obj.price:
-            price = obj.price
-        return price * obj.quantity
+        return obj._subtotal
+    subtotal.admin_order_field = '_subtotal'
 
     def total(self, obj):
         return obj.transaction.value
+    total.admin_order_field = 'transaction__value'
 
     def user_email(self, obj):
         return obj.user.email
+    user_email.admin_order_field = 'user__email'
 
 
+admin.site.register(models.ErrorBucket, ErrorBucketAdmin)
 admin.site.register(models.Item, ItemAdmin)
 admin.site.register(models.PaymentTransaction, PaymentTransactionAdmin)
 admin.site.register(
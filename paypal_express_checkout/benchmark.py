@@ -0,0 +1,184 @@
+"""
+Benchmark of the checkout -> confirm -> IPN lifecycle.
+
+Runs simulated customers through ``SetExpressCheckoutView``,
+``DoExpressCheckoutView`` and ``IPNListenerView`` with the Django test client
+against a ``FakePayPalServer`` and reports latencies and queries per step.
+
+"""
+import math
+import threading
+import time
+from decimal import Decimal
+from multiprocessing.pool import ThreadPool
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from . import __version__
+from .fake_paypal import FakePayPalServer
+from .models import Item, PaymentTransaction
+from .transport import get_transport
+
+
+STEPS = ['checkout', 'confirm', 'ipn']
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank ``percent`` percentile of ``values``."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(index, 0)]
+
+
+class CheckoutBenchmark(object):
+    """
+    Runs ``customers`` simulated purchases and collects the measurements.
+
+    :param customers: The number of simulated customers.
+    :param concurrency: The number of customers running at the same time.
+      Keep this at ``1`` for SQLite.
+    :param api_url: The URL of a running fake PayPal server. If ``None``, a
+      ``FakePayPalServer`` is started in-process.
+    :param server_options: Keyword arguments for the in-process
+      ``FakePayPalServer``, e.g. ``latency``.
+
+    ``PAYPAL_API_URL`` is overridden with ``override_settings`` during the
+    run, so never run a benchmark in a process that serves real customers.
+
+    """
+    def __init__(self, customers=100, concurrency=1, api_url=None,
+                 server_options=None):
+        self.customers = customers
+        self.concurrency = concurrency
+        self.api_url = api_url
+        self.server_options = server_options or {}
+        self.measurements = dict((step, []) for step in STEPS)
+        self.lock = threading.Lock()
+
+    def setup(self):
+        """
+        Creates the item and the users needed for the run.
+
+        Existing ones are reused, so that runs can share a kept database.
+
+        """
+        self.item = Item.objects.get_or_create(
+            name='Benchmark item', defaults={
+                'description': 'Benchmark item', 'value': Decimal('10.00')})[0]
+        user_model = get_user_model()
+        self.users = [
+            user_model.objects.get_or_create(**{
+                user_model.USERNAME_FIELD: 'paypal-benchmark-{0}'.format(i),
+            })[0] for i in range(self.customers)]
+
+    def get_client(self, user):
+        client = Client()
+        if hasattr(client, 'force_login'):
+            client.force_login(user)
+        else:  # pragma: no cover
+            user.set_password('benchmark')
+            user.save()
+            client.login(**{
+                user.USERNAME_FIELD: user.get_username(),
+                'password': 'benchmark'})
+        return client
+
+    def measure(self, step, func, *args, **kwargs):
+        """Calls ``func`` and records its duration and query count."""
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            response = func(*args, **kwargs)
+            duration = time.time() - start
+        ok = response.status_code in (200, 302) and (
+            response.status_code != 302 or
+            reverse('paypal_error') not in response['Location'])
+        with self.lock:
+            self.measurements[step].append(
+                (duration, len(queries.captured_queries), ok))
+        return response
+
+    def run_customer(self, user):
+        try:
+            client = self.get_client(user)
+            self.measure(
+                'checkout', client.post, reverse('paypal_checkout'),
+                {'item': self.item.pk, 'quantity': 1})
+            transaction = PaymentTransaction.objects.filter(
+                user=user).order_by('-pk').first()
+            if transaction is None:
+                return
+            self.measure(
+                'confirm', client.post, reverse('paypal_confirm'),
+                {'token': transaction.transaction_id,
+                 'PayerID': 'BENCHMARK'})
+            transaction = PaymentTransaction.objects.get(pk=transaction.pk)
+            self.measure(
+                'ipn', Client().post, reverse('ipn_listener'),
+                {'txn_id': transaction.transaction_id,
+                 'payment_status': 'Completed',
+                 'ipn_track_id': 'benchmark{0}'.format(transaction.pk)})
+        finally:
+            if self.concurrency > 1:
+                connection.close()
+
+    def run(self):
+        """Runs the benchmark and returns the report dictionary."""
+        self.setup()
+        server = None
+        api_url = self.api_url
+        if api_url is None:
+            options = dict(self.server_options, send_ipn=False)
+            server = FakePayPalServer(**options).start()
+            api_url = server.url
+        try:
+            with override_settings(PAYPAL_API_URL=api_url):
+                start = time.time()
+                if self.concurrency > 1:
+                    pool = ThreadPool(self.concurrency)
+                    pool.map(self.run_customer, self.users)
+                    pool.close()
+                else:
+                    for user in self.users:
+                        self.run_customer(user)
+                duration = time.time() - start
+        finally:
+            if server is not None:
+                # drop the kept-alive connections to the stopped server
+                get_transport().close()
+                server.stop()
+        return self.get_report(duration)
+
+    def get_step_report(self, measurements):
+        durations = [duration * 1000 for duration, q, ok in measurements]
+        queries = [query_count for d, query_count, ok in measurements]
+        return {
+            'count': len(measurements),
+            'errors': len([ok for d, q, ok in measurements if not ok]),
+            'mean_ms': sum(durations) / len(durations) if durations else None,
+            'p50_ms': percentile(durations, 50),
+            'p95_ms': percentile(durations, 95),
+            'p99_ms': percentile(durations, 99),
+            'queries_mean': (
+                float(sum(queries)) / len(queries) if queries else None),
+            'queries_max': max(queries) if queries else None,
+        }
+
+    def get_report(self, duration):
+        return {
+            'version': __version__,
+            'database': connection.vendor,
+            'customers': self.customers,
+            'concurrency': self.concurrency,
+            'fake_server': self.server_options,
+            'duration_s': duration,
+            'checkouts_per_s': self.customers / duration if duration else None,
+            'steps': dict(
+                (step, self.get_step_report(self.measurements[step]))
+                for step in STEPS),
+        }
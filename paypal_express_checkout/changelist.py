@@ -0,0 +1,277 @@
+"""
+Admin changelist helpers for tables with millions of rows.
+
+They are used by the admins of this app if ``PAYPAL_ADMIN_LARGE_TABLES`` is
+set:
+
+* ``ApproximateCountPaginator`` takes the row count of unfiltered lists from
+  the database statistics instead of running ``COUNT(*)``.
+* ``KeysetChangeList`` pages through the default ordering with a cursor
+  (``WHERE (creation_date, id) < (...)``) instead of ``OFFSET``. Rows
+  without a ``creation_date`` follow on the last pages.
+* The date hierarchy is replaced by a date list filter, which does not need
+  to find the distinct dates of the whole table.
+
+"""
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.encoding import force_text
+from django.utils.functional import cached_property
+
+from . import settings
+
+
+CURSOR_VAR = 'cursor'
+
+
+def get_table_estimate(model, using='default'):
+    """
+    Returns the estimated number of rows of the table of ``model``.
+
+    The estimate is read from the statistics of PostgreSQL and MySQL. Returns
+    ``None`` for other databases or if there are no statistics yet.
+
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql = (
+            'SELECT table_rows FROM information_schema.tables'
+            ' WHERE table_schema = DATABASE() AND table_name = %s')
+        params = [table]
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Uses the estimated table size as count of unfiltered querysets.
+
+    Estimates below ``PAYPAL_ADMIN_APPROXIMATE_COUNT_THRESHOLD`` are replaced
+    by an exact count, because counting small tables is cheap.
+
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = get_table_estimate(
+                self.object_list.model, self.object_list.db)
+            if (estimate is not None and
+                    estimate >= settings.ADMIN_APPROXIMATE_COUNT_THRESHOLD):
+                return estimate
+        return super(ApproximateCountPaginator, self).count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages through the ``keyset_ordering`` of the admin with a cursor.
+
+    The cursor holds the ordering values of the last row of the current page,
+    and the next page is selected with a ``WHERE`` on these values, which
+    can use an index no matter how deep the page is. Lists ordered by a
+    column header fall back to the usual page numbers.
+
+    """
+    def __init__(self, request, model, list_display, list_display_links,
+                 list_filter, date_hierarchy, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.next_cursor = None
+        self.keyset = False
+        super(KeysetChangeList, self).__init__(
+            request, model, list_display, list_display_links, list_filter,
+            None, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super(KeysetChangeList, self).get_filters_params(
+            params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # changing the filters or the ordering starts at the first page
+        new_params = new_params or {}
+        if CURSOR_VAR not in new_params:
+            remove = list(remove or []) + [CURSOR_VAR]
+        return super(KeysetChangeList, self).get_query_string(
+            new_params, remove)
+
+    def get_keyset_fields(self):
+        """Returns a list of ``(field_name, descending)`` tuples."""
+        return [
+            (name.lstrip('-'), name.startswith('-'))
+            for name in self.model_admin.keyset_ordering]
+
+    def get_field_value(self, obj, name):
+        if name == 'pk':
+            return obj.pk
+        return getattr(obj, name)
+
+    def to_python(self, name, value):
+        if name == 'pk':
+            return self.lookup_opts.pk.to_python(value)
+        field = self.lookup_opts.get_field(name)
+        if field.null and value == '':
+            return None
+        return field.to_python(value)
+
+    def get_nullable_field(self):
+        """
+        Returns the name of the first keyset field if it allows ``NULL``.
+
+        The rows where it is ``NULL`` are listed after all others, ordered
+        by the remaining keyset fields, no matter where the database sorts
+        ``NULL``. The remaining fields must not be nullable.
+
+        """
+        name = self.get_keyset_fields()[0][0]
+        if name != 'pk' and self.lookup_opts.get_field(name).null:
+            return name
+        return None
+
+    def make_cursor(self, obj):
+        values = []
+        for name, descending in self.get_keyset_fields():
+            value = self.get_field_value(obj, name)
+            if value is None:
+                value = ''
+            elif hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(force_text(value))
+        return '|'.join(values)
+
+    def parse_cursor(self, cursor):
+        """Returns the list of keyset values stored in ``cursor``."""
+        fields = self.get_keyset_fields()
+        values = cursor.split('|')
+        if len(values) != len(fields):
+            raise IncorrectLookupParameters
+        try:
+            return [
+                self.to_python(name, value)
+                for (name, descending), value in zip(fields, values)]
+        except ValidationError:
+            raise IncorrectLookupParameters
+
+    def get_cursor_filter(self, fields, values):
+        """Returns the ``Q`` selecting the rows after ``values``."""
+        query = Q()
+        equal = Q()
+        for (name, descending), value in zip(fields, values):
+            lookup = '{0}__{1}'.format(name, 'lt' if descending else 'gt')
+            query |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return query
+
+    def get_keyset_rows(self, limit):
+        """
+        Returns up to ``limit`` rows after the cursor.
+
+        If the first keyset field is nullable, the rows where it is set and
+        the rows where it is ``NULL`` are fetched with separate queries, so
+        that both can use an index.
+
+        """
+        fields = self.get_keyset_fields()
+        values = self.parse_cursor(self.cursor) if self.cursor else None
+        nullable = self.get_nullable_field()
+        rows = []
+        if values is None or values[0] is not None:
+            queryset = self.queryset
+            if nullable:
+                queryset = queryset.filter(
+                    **{'{0}__isnull'.format(nullable): False})
+            if values:
+                queryset = queryset.filter(
+                    self.get_cursor_filter(fields, values))
+            rows = list(queryset[:limit])
+        if nullable and len(rows) < limit:
+            queryset = self.queryset.filter(
+                **{'{0}__isnull'.format(nullable): True}).order_by(
+                    *self.model_admin.keyset_ordering[1:])
+            if values and values[0] is None:
+                queryset = queryset.filter(
+                    self.get_cursor_filter(fields[1:], values[1:]))
+            rows.extend(queryset[:limit - len(rows)])
+        return rows
+
+    def get_results(self, request):
+        if ORDER_VAR in self.params or self.show_all:
+            return super(KeysetChangeList, self).get_results(request)
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page)
+        rows = self.get_keyset_rows(self.list_per_page + 1)
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_cursor = self.make_cursor(rows[-1])
+        self.keyset = True
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = paginator
+
+    def first_page_url(self):
+        return self.get_query_string()
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class LargeTableAdminMixin(object):
+    """
+    Switches an admin to the helpers of this module if
+    ``PAYPAL_ADMIN_LARGE_TABLES`` is set.
+
+    ``keyset_ordering`` is the default ordering used for keyset pagination.
+    It has to end with the primary key, so that it is unique.
+
+    """
+    change_list_template = (
+        'admin/paypal_express_checkout/keyset_change_list.html')
+    keyset_ordering = ['-pk']
+
+    @property
+    def show_full_result_count(self):
+        return not settings.ADMIN_LARGE_TABLES
+
+    def get_changelist(self, request, **kwargs):
+        if settings.ADMIN_LARGE_TABLES:
+            return KeysetChangeList
+        return super(LargeTableAdminMixin, self).get_changelist(
+            request, **kwargs)
+
+    def get_list_filter(self, request):
+        list_filter = super(LargeTableAdminMixin, self).get_list_filter(
+            request)
+        if settings.ADMIN_LARGE_TABLES and self.date_hierarchy:
+            list_filter = [self.date_hierarchy] + list(list_filter)
+        return list_filter
+
+    def get_ordering(self, request):
+        if settings.ADMIN_LARGE_TABLES:
+            return self.keyset_ordering
+        return super(LargeTableAdminMixin, self).get_ordering(request)
+
+    def get_paginator(self, request, queryset, per_page, *args, **kwargs):
+        if settings.ADMIN_LARGE_TABLES:
+            return ApproximateCountPaginator(
+                queryset, per_page, *args, **kwargs)
+        return super(LargeTableAdminMixin, self).get_paginator(
+            request, queryset, per_page, *args, **kwargs)
@@ -0,0 +1,140 @@
+"""Circuit breaker for calls to the PayPal API."""
+import time
+import urllib2
+
+from django.core.cache import caches
+
+from . import settings
+from .transport import HTTPStatusError
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling PayPal after repeated failures.
+
+    The state lives in the Django cache, so that all processes using the same
+    cache share one circuit. With a ``LocMemCache`` every process has its own
+    circuit.
+
+    * ``closed``: Calls are made. Failures are counted in a fixed window of
+      ``window`` seconds. Once ``failure_threshold`` failures are reached, the
+      circuit opens.
+    * ``open``: Calls fail fast without touching the network for
+      ``reset_timeout`` seconds.
+    * ``half-open``: Up to ``probes`` calls per ``reset_timeout`` are let
+      through. A successful probe closes the circuit, a failed one opens it
+      again.
+
+    :param name: Distinguishes several circuits in the same cache.
+    :param enabled: If ``False``, every call is allowed and nothing is
+      recorded.
+
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name='paypal', enabled=None, failure_threshold=None,
+                 window=None, reset_timeout=None, probes=None,
+                 cache_alias=None):
+        self.name = name
+        self.enabled = (
+            settings.CIRCUIT_BREAKER_ENABLED if enabled is None else enabled)
+        self.failure_threshold = (
+            failure_threshold or settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+        self.window = window or settings.CIRCUIT_BREAKER_WINDOW
+        self.reset_timeout = (
+            reset_timeout or settings.CIRCUIT_BREAKER_RESET_TIMEOUT)
+        self.probes = probes or settings.CIRCUIT_BREAKER_PROBES
+        self.cache = caches[cache_alias or settings.CIRCUIT_BREAKER_CACHE]
+
+    def get_key(self, suffix):
+        return 'paypal_express_checkout:circuit:{0}:{1}'.format(
+            self.name, suffix)
+
+    def _incr(self, key, timeout):
+        """Increments a counter that expires after ``timeout`` seconds."""
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # the key expired between add and incr
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def _open(self):
+        self.cache.set(self.get_key('opened_at'), time.time(), None)
+        self.cache.delete_many([
+            self.get_key('failures'), self.get_key('probes')])
+
+    def get_state(self, opened_at=None):
+        """Returns ``closed``, ``open`` or ``half-open``."""
+        if opened_at is None:
+            opened_at = self.cache.get(self.get_key('opened_at'))
+        if opened_at is None:
+            return self.CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow_request(self):
+        """Returns ``True`` if a call to PayPal may be made right now."""
+        if not self.enabled:
+            return True
+        state = self.get_state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        return (
+            self._incr(self.get_key('probes'), self.reset_timeout) <=
+            self.probes)
+
+    def is_failure(self, exception):
+        """
+        Returns ``True`` if ``exception`` means that PayPal is unavailable.
+
+        Network errors and 5xx answers are failures. A 4xx answer is caused
+        by the request, so it does not count.
+
+        """
+        if isinstance(exception, HTTPStatusError):
+            return exception.status >= 500
+        if isinstance(exception, urllib2.HTTPError):
+            return exception.code >= 500
+        return True
+
+    def record_success(self):
+        """Closes the circuit if it is not closed already."""
+        if not self.enabled:
+            return
+        if self.get_state() != self.CLOSED:
+            self.reset()
+
+    def record_failure(self):
+        """Counts a failure and opens the circuit if necessary."""
+        if not self.enabled:
+            return
+        if self.get_state() != self.CLOSED:
+            self._open()
+            return
+        failures = self._incr(self.get_key('failures'), self.window)
+        if failures >= self.failure_threshold:
+            self._open()
+
+    def reset(self):
+        """Closes the circuit and forgets all recorded failures."""
+        self.cache.delete_many([
+            self.get_key('opened_at'), self.get_key('failures'),
+            self.get_key('probes')])
+
+    def get_status(self):
+        """Returns a dictionary describing the circuit for monitoring."""
+        opened_at = self.cache.get(self.get_key('opened_at'))
+        return {
+            'name': self.name,
+            'enabled': self.enabled,
+            'state': self.get_state(opened_at),
+            'failures': self.cache.get(self.get_key('failures'), 0),
+            'opened_at': opened_at,
+        }
@@ -0,0 +1,160 @@
+"""A client for the PayPal NVP API."""
+import httplib
+import os
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from . import metrics, profiling, settings
+from .circuit_breaker import CircuitBreaker
+from .retry import RetryPolicy
+from .transport import get_transport
+from .utils import urlencode
+
+
+#: The exceptions that are raised if PayPal could not be reached.
+CALL_ERRORS = (
+    urllib2.HTTPError,
+    urllib2.URLError,
+    httplib.HTTPException,
+    socket.error,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling PayPal while the circuit breaker is open."""
+    pass
+
+
+#: The ``ACK`` values counted by ``paypal_api_requests_total``.
+ACK_OUTCOMES = (
+    'Success', 'SuccessWithWarning', 'Failure', 'FailureWithWarning')
+
+
+def get_error_code(error):
+    """
+    Returns a short code for the error of a failed call.
+
+    :param error: The parsed response of a ``Failure``, whose first
+      ``L_ERRORCODE0`` is returned, or one of ``CALL_ERRORS``, for which the
+      HTTP status or the name of the exception is returned.
+
+    """
+    if isinstance(error, dict):
+        return error.get('L_ERRORCODE0', ['unknown'])[0]
+    status = getattr(error, 'code', None) or getattr(error, 'status', None)
+    if status:
+        return 'HTTP {0}'.format(status)
+    if isinstance(error, urllib2.URLError) and isinstance(
+            error.reason, Exception):
+        error = error.reason
+    if isinstance(error, Exception):
+        return type(error).__name__
+    return 'unknown'
+
+
+class PayPalClient(object):
+    """
+    Encodes NVP requests, posts them to PayPal and decodes the responses.
+
+    :param transport: The transport to use. Defaults to ``get_transport()``.
+    :param retry_policy: The ``RetryPolicy`` for failed calls.
+    :param circuit_breaker: The ``CircuitBreaker`` guarding the API.
+
+    """
+    def __init__(self, transport=None, retry_policy=None,
+                 circuit_breaker=None):
+        self.transport = transport or get_transport()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def call(self, api_url, post_data):
+        """
+        Posts ``post_data`` to ``api_url`` and returns the parsed response.
+
+        The response is parsed with ``urlparse.parse_qs``, so every value is a
+        list. Raises ``CircuitOpenError`` if the circuit breaker is open and
+        one of ``CALL_ERRORS`` if PayPal could not be reached.
+
+        """
+        labels = {'method': post_data.get('METHOD', '')}
+        if not self.circuit_breaker.allow_request():
+            metrics.increment(
+                'paypal_api_requests_total',
+                dict(labels, outcome='circuit_open'))
+            raise CircuitOpenError(api_url)
+        retry = self.retry_policy.is_retryable(post_data)
+        data = urlencode(post_data)
+        start = time.time()
+        try:
+            response = self.retry_policy.call(
+                self.transport.post, api_url, data, retry=retry)
+        except CALL_ERRORS as ex:
+            if self.circuit_breaker.is_failure(ex):
+                self.circuit_breaker.record_failure()
+            else:
+                # PayPal answered, it just rejected the request
+                self.circuit_breaker.record_success()
+            metrics.increment(
+                'paypal_api_requests_total',
+                dict(labels, outcome=metrics.get_error_outcome(ex)))
+            raise
+        finally:
+            duration = time.time() - start
+            metrics.observe(
+                'paypal_api_request_duration_seconds', duration, labels)
+            profiling.add_paypal_time(duration)
+        self.circuit_breaker.record_success()
+        parsed_response = urlparse.parse_qs(response)
+        ack = parsed_response.get('ACK', [''])[0]
+        metrics.increment('paypal_api_requests_total', dict(
+            labels, outcome=ack if ack in ACK_OUTCOMES else 'unknown'))
+        return parsed_response
+
+    def call_async(self, api_url, post_data, callback=None):
+        """
+        Makes the same call as ``call`` on a background thread.
+
+        Returns a ``multiprocessing.pool.AsyncResult``. Its ``get()`` method
+        returns the parsed response or raises the exception of ``call``.
+        ``callback`` is called with the parsed response on success.
+
+        """
+        return get_thread_pool().apply_async(
+            self.call, (api_url, post_data), callback=callback)
+
+    def call_many(self, calls):
+        """
+        Makes all ``(api_url, post_data)`` calls concurrently.
+
+        Returns the ``AsyncResult`` objects in the order of ``calls``.
+
+        """
+        return [
+            self.call_async(api_url, post_data)
+            for api_url, post_data in calls]
+
+
+_thread_pool = None
+_thread_pool_pid = None
+_thread_pool_lock = threading.Lock()
+
+
+def get_thread_pool():
+    """
+    Returns the thread pool of the current process used by ``call_async``.
+
+    Its size is taken from the ``PAYPAL_CLIENT_THREADS`` setting and limits
+    the number of PayPal calls a process has in flight.
+
+    """
+    global _thread_pool, _thread_pool_pid
+    pid = os.getpid()
+    with _thread_pool_lock:
+        if _thread_pool is None or _thread_pool_pid != pid:
+            _thread_pool = ThreadPool(settings.CLIENT_THREADS)
+            _thread_pool_pid = pid
+        return _thread_pool
@@ -39,6 +39,66 @@ STATUS_CHOICES = (
     (PAYMENT_STATUS['voided'], 'Voided'),
 )
 
+# The statuses a transaction may change to from each status. IPNs that would
+# change the status in any other way are ignored, e.g. a late ``Pending`` IPN
+# after ``Completed``.
+
+PAYMENT_STATUS_TRANSITIONS = {
+    PAYMENT_STATUS['checkout']: (
+        PAYMENT_STATUS['pending'],
+        PAYMENT_STATUS['canceled'],
+        PAYMENT_STATUS['created'],
+        PAYMENT_STATUS['processed'],
+        PAYMENT_STATUS['completed'],
+        PAYMENT_STATUS['denied'],
+        PAYMENT_STATUS['expired'],
+        PAYMENT_STATUS['failed'],
+        PAYMENT_STATUS['voided'],
+    ),
+    # PayPal sends a ``Pending`` IPN after ``DoExpressCheckoutPayment``
+    PAYMENT_STATUS['pending']: (
+        PAYMENT_STATUS['pending'],
+        PAYMENT_STATUS['canceled'],
+        PAYMENT_STATUS['processed'],
+        PAYMENT_STATUS['completed'],
+        PAYMENT_STATUS['denied'],
+        PAYMENT_STATUS['expired'],
+        PAYMENT_STATUS['failed'],
+        PAYMENT_STATUS['voided'],
+    ),
+    PAYMENT_STATUS['created']: (
+        PAYMENT_STATUS['pending'],
+        PAYMENT_STATUS['processed'],
+        PAYMENT_STATUS['completed'],
+        PAYMENT_STATUS['denied'],
+        PAYMENT_STATUS['expired'],
+        PAYMENT_STATUS['failed'],
+        PAYMENT_STATUS['voided'],
+    ),
+    PAYMENT_STATUS['processed']: (
+        PAYMENT_STATUS['pending'],
+        PAYMENT_STATUS['completed'],
+        PAYMENT_STATUS['denied'],
+        PAYMENT_STATUS['failed'],
+        PAYMENT_STATUS['voided'],
+    ),
+    PAYMENT_STATUS['completed']: (
+        PAYMENT_STATUS['refunded'],
+        PAYMENT_STATUS['reversed'],
+    ),
+    PAYMENT_STATUS['reversed']: (
+        PAYMENT_STATUS['canceled_Reversal'],
+    ),
+    PAYMENT_STATUS['canceled_Reversal']: (
+        PAYMENT_STATUS['refunded'],
+        PAYMENT_STATUS['reversed'],
+    ),
+    # every partial refund sends another ``Refunded`` IPN
+    PAYMENT_STATUS['refunded']: (
+        PAYMENT_STATUS['refunded'],
+    ),
+}
+
 
 PAYPAL_DEFAULTS = {
     'USER': settings.PAYPAL_USER,
@@ -48,6 +108,10 @@ PAYPAL_DEFAULTS = {
     'PAYMENTREQUEST_0_PAYMENTACTION': 'Sale',
 }
 
+# The fields of PAYPAL_DEFAULTS that must not be stored.
+
+CREDENTIAL_FIELDS = ('USER', 'PWD', 'SIGNATURE')
+
 if settings.SALE_DESCRIPTION:
     PAYPAL_DEFAULTS.update({
         'PAYMENTREQUEST_0_DESC': settings.SALE_DESCRIPTION})
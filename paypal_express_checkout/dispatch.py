@@ -0,0 +1,254 @@
+"""
+Runs signal receivers on thread or process pools.
+
+Receivers connected with ``connect_async`` or ``async_receiver`` are not
+called while the signal is sent. They are submitted to a pool once the
+current database transaction has been committed, so that e.g. the IPN view
+answers PayPal without waiting for them. On Django 1.8, which has no
+``on_commit``, they are submitted right away.
+
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.db import close_old_connections, connections
+
+from . import settings
+
+try:
+    from django.db.transaction import on_commit
+except ImportError:  # Django < 1.9
+    def on_commit(func, using=None):
+        func()
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_receiver_path(receiver):
+    return '{0}.{1}'.format(receiver.__module__, receiver.__name__)
+
+
+def call_receiver(receiver, sender, kwargs):
+    """
+    Calls ``receiver`` and logs instead of raising its exceptions.
+
+    Returns ``True`` if the receiver succeeded.
+
+    """
+    try:
+        receiver(sender=sender, **kwargs)
+    except Exception:
+        logger.exception('Signal receiver {0} failed.'.format(
+            get_receiver_path(receiver)))
+        return False
+    return True
+
+
+def run_receiver(receiver, sender, kwargs):
+    """
+    Calls ``receiver`` on a pool worker.
+
+    Like Django does around every request, the database connections of the
+    worker are closed before and after the call if they are broken or
+    exceeded ``CONN_MAX_AGE``.
+
+    """
+    close_old_connections()
+    try:
+        return call_receiver(receiver, sender, kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_pickled_receiver(payload):
+    """
+    Unpickles the arguments of ``run_receiver`` on a process pool worker and
+    calls it.
+
+    Never raises, not even if the receiver cannot be imported or the
+    database connections cannot be closed, because the pool of Python 2 only
+    reports successful calls back and the slot of the call would be lost.
+
+    """
+    try:
+        return run_receiver(*pickle.loads(payload))
+    except Exception:
+        logger.exception('Could not run signal receiver.')
+        return False
+
+
+_inherited_connections = []
+
+
+def init_worker():
+    """
+    Drops the database connections a process pool worker inherited.
+
+    The connection objects are kept referenced, because closing or garbage
+    collecting them would also close the connections of the parent process.
+
+    """
+    for connection in connections.all():
+        _inherited_connections.append(connection.connection)
+        connection.connection = None
+
+
+class SyncExecutor(object):
+    """Calls the receivers right away, in the current thread."""
+    def submit(self, receiver, sender, kwargs):
+        call_receiver(receiver, sender, kwargs)
+
+
+class PoolExecutor(object):
+    """
+    Submits receivers to a pool with at most ``max_pending`` waiting calls.
+
+    If the pool is busy, the receiver is called in the current thread
+    instead, which slows the sender down rather than letting the queue grow
+    without limit.
+
+    """
+    def __init__(self, pool, max_pending):
+        self.pool = pool
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def prepare(self, receiver, sender, kwargs):
+        """Returns the arguments for ``call_receiver``."""
+        return receiver, sender, kwargs
+
+    def release(self, result=None):
+        self.slots.release()
+
+    def apply_async(self, args):
+        """Runs ``run_receiver`` with ``args`` on the pool."""
+        def run():
+            try:
+                run_receiver(*args)
+            finally:
+                self.release()
+        self.pool.apply_async(run)
+
+    def submit(self, receiver, sender, kwargs):
+        if not self.slots.acquire(False):
+            logger.warning(
+                'Signal receiver pool is busy, calling {0} inline.'.format(
+                    get_receiver_path(receiver)))
+            call_receiver(receiver, sender, kwargs)
+            return
+        try:
+            self.apply_async(self.prepare(receiver, sender, kwargs))
+        except Exception:
+            self.slots.release()
+            logger.exception('Could not submit signal receiver {0}.'.format(
+                get_receiver_path(receiver)))
+
+
+class ProcessPoolExecutor(PoolExecutor):
+    """
+    Runs receivers in worker processes.
+
+    Receivers, senders and signal arguments have to be picklable. Senders
+    that are instances, like the IPN view, are replaced by their class and
+    the ``signal`` argument is not passed on.
+
+    """
+    def prepare(self, receiver, sender, kwargs):
+        """Returns the arguments for ``run_pickled_receiver``."""
+        if not isinstance(sender, type):
+            sender = type(sender)
+        kwargs = dict(
+            (key, value) for key, value in kwargs.items() if key != 'signal')
+        # fail here, where the error can be logged, and not in the pool
+        return (pickle.dumps(
+            (receiver, sender, kwargs), pickle.HIGHEST_PROTOCOL), )
+
+    def apply_async(self, args):
+        # the slots live in this process, so the pool has to report back
+        self.pool.apply_async(
+            run_pickled_receiver, args, callback=self.release)
+
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+def create_executor(name):
+    if name == 'sync':
+        return SyncExecutor()
+    if name == 'thread':
+        return PoolExecutor(
+            ThreadPool(settings.SIGNAL_THREADS), settings.SIGNAL_MAX_PENDING)
+    if name == 'process':
+        return ProcessPoolExecutor(
+            multiprocessing.Pool(
+                settings.SIGNAL_PROCESSES, initializer=init_worker),
+            settings.SIGNAL_MAX_PENDING)
+    raise ValueError('Unknown signal executor: {0}'.format(name))
+
+
+def get_executor(name):
+    """
+    Returns the executor ``sync``, ``thread`` or ``process`` of the current
+    process.
+
+    """
+    global _executors, _executors_pid
+    pid = os.getpid()
+    with _executors_lock:
+        if _executors_pid != pid:
+            _executors = {}
+            _executors_pid = pid
+        if name not in _executors:
+            _executors[name] = create_executor(name)
+        return _executors[name]
+
+
+def connect_async(signal, receiver, executor=None, sender=None,
+                  dispatch_uid=None):
+    """
+    Connects ``receiver`` to ``signal`` to run on an executor after commit.
+
+    The executor is taken from ``PAYPAL_SIGNAL_EXECUTORS`` by the dotted
+    path of the receiver, then from the ``executor`` argument, then from
+    ``PAYPAL_SIGNAL_EXECUTOR``. Returns the proxy connected to the signal.
+
+    :param signal: The signal, e.g. ``payment_completed``.
+    :param receiver: A module level function taking ``sender`` and the
+      keyword arguments of the signal.
+    :param executor: ``sync``, ``thread`` or ``process``.
+
+    """
+    path = get_receiver_path(receiver)
+    executor = settings.SIGNAL_EXECUTORS.get(
+        path, executor or settings.SIGNAL_EXECUTOR)
+
+    def proxy(sender, **kwargs):
+        on_commit(lambda: get_executor(executor).submit(
+            receiver, sender, kwargs))
+
+    signal.connect(
+        proxy, sender=sender, weak=False, dispatch_uid=dispatch_uid or path)
+    return proxy
+
+
+def async_receiver(signal, **kwargs):
+    """
+    Like ``django.dispatch.receiver``, but connects with ``connect_async``.
+
+    ::
+
+        @async_receiver(payment_completed, executor='process')
+        def send_receipt(sender, transaction, **kwargs):
+            ...
+
+    """
+    def _decorator(receiver):
+        connect_async(signal, receiver, **kwargs)
+        return receiver
+    return _decorator
@@ -0,0 +1,180 @@
+"""
+Streaming CSV and JSON lines exports of the models of this app.
+
+Rows are read in chunks of primary keys (``WHERE id > last_id ORDER BY id
+LIMIT chunk_size``) and written one line at a time, so the memory used does
+not grow with the number of exported rows.
+
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.encoding import force_text
+from django.utils.timezone import make_aware
+
+from .models import PaymentTransaction, PaymentTransactionError, PurchasedItem
+
+
+#: The exported columns of every model. Request data of errors is left out,
+#: because it contains the API credentials.
+EXPORT_FIELDS = {
+    PaymentTransaction: [
+        'id', 'transaction_id', 'creation_date', 'date', 'user_id', 'value',
+        'currency', 'status', 'correlation_id',
+    ],
+    PurchasedItem: [
+        'id', 'transaction__transaction_id', 'transaction__creation_date',
+        'transaction__status', 'user_id', 'identifier', 'item_id',
+        'item__name', 'price', 'quantity',
+    ],
+    PaymentTransactionError: [
+        'id', 'date', 'user_id', 'transaction__transaction_id',
+        'paypal_api_url', 'response',
+    ],
+}
+
+#: The fields used by the ``date_from``/``date_to`` and ``status`` filters.
+DATE_FIELDS = {
+    PaymentTransaction: 'creation_date',
+    PurchasedItem: 'transaction__creation_date',
+    PaymentTransactionError: 'date',
+}
+
+STATUS_FIELDS = {
+    PaymentTransaction: 'status',
+    PurchasedItem: 'transaction__status',
+    PaymentTransactionError: 'transaction__status',
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def get_day_start(day):
+    """Returns the first moment of ``day`` in the current time zone."""
+    value = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        value = make_aware(value)
+    return value
+
+
+def to_date(value):
+    """
+    Returns ``value`` as a ``date``, parsing ISO formatted strings.
+
+    Raises ``ValueError`` for strings that are not a date, so that a
+    malformed bound never exports the whole table.
+
+    """
+    if isinstance(value, basestring) and value:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(
+                'Invalid date, use YYYY-MM-DD: {0}'.format(value))
+        return date
+    return value
+
+
+def filter_queryset(queryset, date_from=None, date_to=None, status=None,
+                    identifier=None):
+    """
+    Filters ``queryset`` for an export.
+
+    :param date_from: Only rows of this day or later. A ``date`` or an ISO
+      formatted string.
+    :param date_to: Only rows of this day or earlier.
+
+    Raises ``ValueError`` if ``date_from`` or ``date_to`` is not a date.
+    :param status: Only rows of transactions with this status.
+    :param identifier: Only purchased items with this identifier, or
+      transactions containing such an item.
+
+    """
+    model = queryset.model
+    date_from = to_date(date_from)
+    date_to = to_date(date_to)
+    # compare with datetimes, so that an index on the field can be used
+    if date_from:
+        queryset = queryset.filter(**{
+            '{0}__gte'.format(DATE_FIELDS[model]): get_day_start(date_from)})
+    if date_to:
+        queryset = queryset.filter(**{
+            '{0}__lt'.format(DATE_FIELDS[model]): get_day_start(
+                date_to + timedelta(days=1))})
+    if status:
+        queryset = queryset.filter(**{STATUS_FIELDS[model]: status})
+    if identifier:
+        items = PurchasedItem.objects.filter(identifier=identifier)
+        if model is PurchasedItem:
+            queryset = queryset.filter(identifier=identifier)
+        elif model is PaymentTransaction:
+            queryset = queryset.filter(pk__in=items.values('transaction'))
+        else:
+            queryset = queryset.filter(
+                transaction__in=items.values('transaction'))
+    return queryset
+
+
+def iterate_rows(queryset, fields, chunk_size=1000):
+    """Yields the ``fields`` of every row of ``queryset`` as tuples."""
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last_pk = rows[-1][0]
+
+
+class Echo(object):
+    """A file-like object that returns what is written to it."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    """Yields the CSV lines of ``rows``, starting with a header line."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            '' if value is None else force_text(value).encode('utf-8')
+            for value in row])
+
+
+def jsonl_lines(rows, fields):
+    """Yields one JSON object per row."""
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(queryset, export_format='csv', chunk_size=1000):
+    """Yields the lines of the export of ``queryset``."""
+    fields = EXPORT_FIELDS[queryset.model]
+    rows = iterate_rows(queryset, fields, chunk_size)
+    if export_format == 'jsonl':
+        return jsonl_lines(rows, fields)
+    return csv_lines(rows, fields)
+
+
+def export_response(queryset, export_format='csv', filename=None):
+    """Returns a ``StreamingHttpResponse`` with the export of ``queryset``."""
+    response = StreamingHttpResponse(
+        export_lines(queryset, export_format),
+        content_type=FORMATS[export_format])
+    filename = filename or '{0}.{1}'.format(
+        queryset.model._meta.model_name, export_format)
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+        filename)
+    return response
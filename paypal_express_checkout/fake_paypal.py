@@ -0,0 +1,232 @@
+"""
+A local stand-in for the PayPal NVP API, meant for load tests and benchmarks.
+
+Point ``PAYPAL_API_URL`` at a running ``FakePayPalServer`` (for example via
+``./manage.py paypal_fake_server``) and the checkout flow will talk to it
+instead of PayPal.
+
+"""
+import logging
+import random
+import string
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+
+
+def random_id(length=17, prefix=''):
+    """Returns an upper case alphanumeric id like the ones PayPal uses."""
+    return prefix + ''.join(
+        random.choice(string.ascii_uppercase + string.digits)
+        for i in range(length))
+
+
+class FakePayPalRequestHandler(BaseHTTPRequestHandler):
+    """Answers NVP API calls and IPN validation requests."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        status, response = self.server.handle_request_body(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class FakePayPalServer(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server that behaves like the PayPal NVP API.
+
+    It answers ``SetExpressCheckout``, ``GetExpressCheckoutDetails`` and
+    ``DoExpressCheckoutPayment`` and posts a ``Completed`` IPN to the
+    ``PAYMENTREQUEST_0_NOTIFYURL`` of every successful payment. Requests with
+    ``cmd=_notify-validate`` are answered with ``ipn_verification``.
+
+    :param address: The ``(host, port)`` tuple to listen on. Use port ``0``
+      to pick a free port.
+    :param latency: Seconds every response is delayed.
+    :param jitter: Up to this many seconds are randomly added to ``latency``.
+    :param error_rate: Share of requests (0..1) answered with HTTP 500.
+    :param failure_rate: Share of API calls (0..1) answered with
+      ``ACK=Failure``.
+    :param ipn_delay: Seconds to wait before posting an IPN.
+    :param send_ipn: Set to ``False`` to never post IPNs.
+    :param ipn_verification: The answer to IPN verification requests.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0, jitter=0,
+                 error_rate=0, failure_rate=0, ipn_delay=0, send_ipn=True,
+                 ipn_verification='VERIFIED'):
+        HTTPServer.__init__(self, address, FakePayPalRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.ipn_delay = ipn_delay
+        self.send_ipn = send_ipn
+        self.ipn_verification = ipn_verification
+        self.checkouts = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """The URL to use as ``PAYPAL_API_URL``."""
+        return 'http://{0}:{1}/nvp'.format(*self.server_address)
+
+    def start(self):
+        """Serves requests on a daemon thread and returns the server."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def handle_request_body(self, body):
+        """Returns a tuple of ``(http_status, response_body)``."""
+        data = dict(
+            (key, values[0]) for key, values in
+            urlparse.parse_qs(body, keep_blank_values=True).items())
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.error_rate:
+            with self.lock:
+                self.calls['http_error'] += 1
+            return 500, 'Internal Server Error'
+        if data.get('cmd') == '_notify-validate':
+            with self.lock:
+                self.calls['_notify-validate'] += 1
+            return 200, self.ipn_verification
+        method = data.get('METHOD', '')
+        with self.lock:
+            self.calls[method] += 1
+        if random.random() < self.failure_rate:
+            response = self.failure(
+                '10001', 'Internal Error', 'Injected failure.')
+        else:
+            handler = getattr(self, 'handle_{0}'.format(method), None)
+            if handler is None:
+                response = self.failure(
+                    '81002', 'Unspecified Method',
+                    'Method Specified is not Supported')
+            else:
+                response = handler(data)
+        return 200, urllib.urlencode(response)
+
+    def success(self, **kwargs):
+        """Returns the common fields of a successful response."""
+        kwargs.update({
+            'ACK': 'Success',
+            'TIMESTAMP': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'CORRELATIONID': random_id(13).lower(),
+            'VERSION': '91.0',
+        })
+        return kwargs
+
+    def failure(self, code, short_message, long_message):
+        """Returns the fields of an ``ACK=Failure`` response."""
+        return {
+            'ACK': 'Failure',
+            'L_ERRORCODE0': code,
+            'L_SHORTMESSAGE0': short_message,
+            'L_LONGMESSAGE0': long_message,
+            'L_SEVERITYCODE0': 'Error',
+        }
+
+    def handle_SetExpressCheckout(self, data):
+        token = random_id(17, prefix='EC-')
+        with self.lock:
+            self.checkouts[token] = {
+                'amount': data.get('PAYMENTREQUEST_0_AMT', '0'),
+                'currency': data.get('PAYMENTREQUEST_0_CURRENCYCODE', 'USD'),
+                'payer_id': random_id(13),
+            }
+        return self.success(TOKEN=token)
+
+    def handle_GetExpressCheckoutDetails(self, data):
+        checkout = self.checkouts.get(data.get('TOKEN'))
+        if checkout is None:
+            return self.invalid_token()
+        return self.success(
+            TOKEN=data['TOKEN'],
+            CHECKOUTSTATUS='PaymentActionNotInitiated',
+            PAYERID=checkout['payer_id'],
+            PAYMENTREQUEST_0_AMT=checkout['amount'],
+            PAYMENTREQUEST_0_CURRENCYCODE=checkout['currency'],
+        )
+
+    def handle_DoExpressCheckoutPayment(self, data):
+        checkout = self.checkouts.get(data.get('TOKEN'))
+        if checkout is None:
+            return self.invalid_token()
+        transaction_id = random_id(17)
+        amount = data.get('PAYMENTREQUEST_0_AMT', checkout['amount'])
+        currency = data.get(
+            'PAYMENTREQUEST_0_CURRENCYCODE', checkout['currency'])
+        notify_url = data.get('PAYMENTREQUEST_0_NOTIFYURL')
+        if self.send_ipn and notify_url:
+            timer = threading.Timer(
+                self.ipn_delay, self.post_ipn, args=(
+                    notify_url, self.build_ipn(
+                        transaction_id, amount, currency)))
+            timer.daemon = True
+            timer.start()
+        return self.success(
+            TOKEN=data['TOKEN'],
+            PAYMENTINFO_0_TRANSACTIONID=transaction_id,
+            PAYMENTINFO_0_PAYMENTSTATUS='Completed',
+            PAYMENTINFO_0_AMT=amount,
+            PAYMENTINFO_0_CURRENCYCODE=currency,
+            PAYMENTINFO_0_ACK='Success',
+        )
+
+    def invalid_token(self):
+        return self.failure('10410', 'Invalid token', 'Invalid token.')
+
+    def build_ipn(self, transaction_id, amount, currency,
+                  payment_status='Completed'):
+        """Returns the POST data of an IPN for the given payment."""
+        return {
+            'txn_id': transaction_id,
+            'txn_type': 'express_checkout',
+            'payment_status': payment_status,
+            'mc_gross': amount,
+            'mc_currency': currency,
+            'ipn_track_id': random_id(13).lower(),
+        }
+
+    def post_ipn(self, notify_url, data):
+        """Posts an IPN to ``notify_url``."""
+        with self.lock:
+            self.calls['ipn'] += 1
+        try:
+            urllib2.urlopen(
+                notify_url, data=urllib.urlencode(data), timeout=10).read()
+        except Exception as ex:
+            with self.lock:
+                self.calls['ipn_error'] += 1
+            logger.warning('Posting IPN to {0} failed: {1!r}'.format(
+                notify_url, ex))
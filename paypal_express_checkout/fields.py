@@ -0,0 +1,63 @@
+"""Custom model fields for the ``paypal_express_checkout`` app."""
+import base64
+import zlib
+
+from django.db import models
+from django.utils.encoding import force_text
+
+from . import settings
+
+
+#: Marks values that are stored compressed.
+COMPRESSED_PREFIX = 'zlib:'
+
+TRUNCATED_SUFFIX = u'[truncated]'
+
+
+def compress_text(value, max_length=None):
+    """
+    Returns ``value`` zlib compressed and base64 encoded, behind
+    ``COMPRESSED_PREFIX``.
+
+    Values longer than ``max_length`` characters are truncated first. Short
+    values that would not get smaller are returned as they are.
+
+    """
+    if value is None:
+        return None
+    value = force_text(value)
+    if max_length and len(value) > max_length:
+        value = value[:max_length] + TRUNCATED_SUFFIX
+    compressed = COMPRESSED_PREFIX + base64.b64encode(
+        zlib.compress(value.encode('utf-8')))
+    if len(compressed) < len(value) or value.startswith(COMPRESSED_PREFIX):
+        return compressed
+    return value
+
+
+def decompress_text(value):
+    """Reverses ``compress_text``. Other values are returned unchanged."""
+    if value is None or not value.startswith(COMPRESSED_PREFIX):
+        return value
+    return zlib.decompress(
+        base64.b64decode(value[len(COMPRESSED_PREFIX):])).decode('utf-8')
+
+
+class CompressedTextField(models.TextField):
+    """
+    A ``TextField`` that is stored compressed.
+
+    Values are capped to ``PAYPAL_PAYLOAD_MAX_LENGTH`` characters and
+    compressed with ``compress_text`` when they are saved, and decompressed
+    when they are loaded. Uncompressed values in the database, e.g. from
+    before a ``TextField`` was changed to this field, are read as they are.
+    Lookups other than ``exact`` and ``isnull`` do not work on the compressed
+    values.
+
+    """
+    def from_db_value(self, value, expression, connection, context):
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super(CompressedTextField, self).get_prep_value(value)
+        return compress_text(value, settings.PAYLOAD_MAX_LENGTH)
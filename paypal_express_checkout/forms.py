@@ -1,27 +1,42 @@
 """Forms for the ``paypal_express_checkout`` app."""
-import httplib
 import logging
-import urllib2
-import urlparse
 
 from django import forms
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
+from django.db.transaction import atomic
 from django.http import Http404
 from django.shortcuts import redirect
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 
+from . import metrics, profiling, tracing
+from .circuit_breaker import CircuitBreaker
+from .client import (
+    CALL_ERRORS,
+    CircuitOpenError,
+    PayPalClient,
+    get_error_code,
+)
 from .constants import PAYMENT_STATUS, PAYPAL_DEFAULTS
 from .models import (
+    DailyRevenue,
+    ErrorBucket,
     Item,
     PaymentTransaction,
     PaymentTransactionError,
     PurchasedItem,
 )
-from .settings import API_URL, LOGIN_URL
-from .utils import urlencode
+from .retry import RetryPolicy
+from .settings import (
+    API_URL,
+    ERROR_LOGGING,
+    LOGIN_URL,
+    RETRY_IDEMPOTENCY_KEY,
+    REVENUE_ROLLUP,
+)
+from .utils import strip_credentials, urlencode
 
 
 logger = logging.getLogger(__name__)
@@ -42,26 +57,57 @@ class PayPalFormMixin(object):
         :param transaction: If you already have a transaction, pass it into
           this method so that it can be logged in case of an error.
 
+        Transient failures are retried according to ``get_retry_policy``, if
+        the API operation is safe to repeat. Returns ``None`` if the call
+        failed or if the circuit breaker is open. In the latter case, PayPal
+        is not called and no error is logged.
+
         """
-        data = urlencode(post_data)
-        try:
-            response = urllib2.urlopen(api_url, data=data)
-        except (
-                urllib2.HTTPError,
-                urllib2.URLError,
-                httplib.HTTPException) as ex:
-            self.log_error(
-                ex, api_url=api_url, request_data=data,
-                transaction=transaction)
-        else:
-            parsed_response = urlparse.parse_qs(response.read())
-            return parsed_response
+        tags = {'method': post_data.get('METHOD')}
+        if transaction is not None:
+            tags['token'] = transaction.transaction_id
+        with tracing.span('call_paypal', **tags) as span:
+            try:
+                response = self.get_client().call(api_url, post_data)
+            except CircuitOpenError as ex:
+                span.error = repr(ex)
+                logger.warning(
+                    'PayPal circuit breaker is open, not calling {0}'.format(
+                        api_url))
+            except CALL_ERRORS as ex:
+                span.error = repr(ex)
+                self.log_error(
+                    ex, api_url=api_url, request_data=urlencode(post_data),
+                    transaction=transaction)
+            else:
+                span.set_tag('ack', response.get('ACK', [None])[0])
+                return response
+
+    def get_api_url(self):
+        """
+        Returns the URL of the PayPal NVP API.
+
+        The setting is read on every call, so that ``override_settings``
+        applies to it.
+
+        """
+        return getattr(settings, 'PAYPAL_API_URL', API_URL)
 
     def get_cancel_url(self):
         """Returns the paypal cancel url."""
         return settings.HOSTNAME + reverse(
             'paypal_canceled', kwargs=self.get_url_kwargs())
 
+    def get_circuit_breaker(self):
+        """Returns the ``CircuitBreaker`` guarding the PayPal API."""
+        return CircuitBreaker()
+
+    def get_client(self):
+        """Returns the ``PayPalClient`` used by ``call_paypal``."""
+        return PayPalClient(
+            retry_policy=self.get_retry_policy(),
+            circuit_breaker=self.get_circuit_breaker())
+
     def get_error_url(self):
         """Returns the url of the payment error page."""
         return reverse('paypal_error')
@@ -75,6 +121,10 @@ class PayPalFormMixin(object):
         return settings.HOSTNAME + reverse(
             'paypal_confirm', kwargs=self.get_url_kwargs())
 
+    def get_retry_policy(self):
+        """Returns the ``RetryPolicy`` used for calls to the PayPal API."""
+        return RetryPolicy()
+
     def get_success_url(self):
         """Returns the url of the payment success page."""
         return reverse('paypal_success')
@@ -84,16 +134,28 @@ class PayPalFormMixin(object):
         """
         Saves error information as a ``PaymentTransactionError`` object.
 
+        If ``PAYPAL_ERROR_LOGGING`` is ``buckets``, the error is counted in
+        its ``ErrorBucket`` and only the first ``PAYPAL_ERROR_SAMPLES`` errors
+        of a bucket are saved. Returns ``None`` for the others.
+
         :param error_message: The message of the exception or response string
           from PayPal.
 
         """
+        metrics.increment('paypal_errors_total')
+        bucket = None
+        if ERROR_LOGGING == 'buckets':
+            bucket = ErrorBucket.objects.record(
+                api_url, get_error_code(error_message))
+            if bucket is None:
+                return None
         payment_error = PaymentTransactionError()
         payment_error.user = self.user
         payment_error.response = error_message
         payment_error.paypal_api_url = api_url
-        payment_error.request_data = request_data
+        payment_error.request_data = strip_credentials(request_data)
         payment_error.transaction = transaction
+        payment_error.bucket = bucket
         payment_error.save()
         return payment_error
 
@@ -103,6 +165,10 @@ class DoExpressCheckoutForm(PayPalFormMixin, forms.Form):
     Takes the input from the ``DoExpressCheckoutView``, validates it and
     takes care of the PayPal API operations.
 
+    :param user: The user making the purchase
+    :param transaction: The ``PaymentTransaction`` belonging to the token, if
+      the caller has already fetched it. Otherwise it is looked up.
+
     """
     token = forms.CharField()
 
@@ -110,17 +176,28 @@ class DoExpressCheckoutForm(PayPalFormMixin, forms.Form):
 
     def __init__(self, user, *args, **kwargs):
         self.user = user
+        transaction = kwargs.pop('transaction', None)
         super(DoExpressCheckoutForm, self).__init__(*args, **kwargs)
+        if transaction is not None:
+            self.transaction = transaction
+            return
         try:
             self.transaction = PaymentTransaction.objects.get(
                 user=user, transaction_id=self.data['token'])
         except PaymentTransaction.DoesNotExist:
             raise Http404
 
-    def get_post_data(self):
-        """Creates the post data dictionary to send to PayPal."""
-        post_data = PAYPAL_DEFAULTS.copy()
-        items = self.transaction.purchaseditem_set.all()
+    def get_currency(self):
+        """
+        Returns the currency of the transaction.
+
+        Transactions created before the currency was stored on them fall back
+        to the currency of their first purchased item.
+
+        """
+        if self.transaction.currency:
+            return self.transaction.currency
+        items = self.transaction.purchaseditem_set.select_related('item')[:1]
         currency = None
         if len(items) != 0:
             if getattr(items[0].item, 'currency', None) is not None:
@@ -128,8 +205,12 @@ class DoExpressCheckoutForm(PayPalFormMixin, forms.Form):
             elif getattr(
                     items[0].content_object, 'currency', None) is not None:
                 currency = items[0].content_object.currency
-        if not currency:
-            currency = CURRENCYCODE
+        return currency or CURRENCYCODE
+
+    def get_post_data(self):
+        """Creates the post data dictionary to send to PayPal."""
+        post_data = PAYPAL_DEFAULTS.copy()
+        currency = self.get_currency()
         post_data.update({
             'METHOD': 'DoExpressCheckoutPayment',
             'TOKEN': self.transaction.transaction_id,
@@ -138,30 +219,60 @@ class DoExpressCheckoutForm(PayPalFormMixin, forms.Form):
             'PAYMENTREQUEST_0_NOTIFYURL': self.get_notify_url(),
             'PAYMENTREQUEST_0_CURRENCYCODE': currency,
         })
+        if RETRY_IDEMPOTENCY_KEY:
+            # The token is unique per checkout, so PayPal will not charge the
+            # customer twice if a retried call reaches it more than once.
+            post_data['MSGSUBID'] = self.transaction.transaction_id
         return post_data
 
+    def save_status(self, status):
+        """
+        Saves the transaction and changes its status to ``status``.
+
+        The status is changed with ``PaymentTransaction.transition``, so a
+        status an IPN has set in the meantime is not overwritten. Returns
+        ``True`` if the status was changed.
+
+        """
+        update_fields = [
+            field.name for field in self.transaction._meta.concrete_fields
+            if not field.primary_key and field.name != 'status']
+        self.transaction.save(update_fields=update_fields)
+        return self.transaction.transition(status, source='do_checkout')
+
     def do_checkout(self):
         """Calls PayPal to make the 'DoExpressCheckoutPayment' procedure."""
-        post_data = self.get_post_data()
-        api_url = API_URL
-        parsed_response = self.call_paypal(api_url, post_data)
-        if parsed_response.get('ACK')[0] == 'Success':
-            transaction_id = parsed_response.get(
-                'PAYMENTINFO_0_TRANSACTIONID')[0]
-            self.transaction.transaction_id = transaction_id
-            self.transaction.status = PAYMENT_STATUS['pending']
-            self.transaction.save()
-            return redirect(self.get_success_url())
-        elif parsed_response.get('ACK')[0] == 'Failure':
-            self.transaction.status = PAYMENT_STATUS['canceled']
-            self.transaction.save()
-            # we have to do urlencode here to make the post data more readable
-            # in the error log
-            post_data_encoded = urlencode(post_data)
-            self.log_error(
-                parsed_response, api_url, request_data=post_data_encoded,
-                transaction=self.transaction)
-            return redirect(self.get_error_url())
+        with tracing.span(
+                'do_checkout', self.transaction.correlation_id,
+                token=self.transaction.transaction_id) as span:
+            # transactions from before correlation ids are saved with the
+            # one of this span
+            self.transaction.correlation_id = span.correlation_id
+            profiling.annotate(
+                transaction_id=self.transaction.transaction_id,
+                correlation_id=span.correlation_id)
+            post_data = self.get_post_data()
+            api_url = self.get_api_url()
+            parsed_response = self.call_paypal(
+                api_url, post_data, transaction=self.transaction)
+            if parsed_response is None:
+                return redirect(self.get_error_url())
+            if parsed_response.get('ACK')[0] == 'Success':
+                transaction_id = parsed_response.get(
+                    'PAYMENTINFO_0_TRANSACTIONID')[0]
+                self.transaction.transaction_id = transaction_id
+                span.set_tag('transaction_id', transaction_id)
+                self.save_status(PAYMENT_STATUS['pending'])
+                return redirect(self.get_success_url())
+            elif parsed_response.get('ACK')[0] == 'Failure':
+                self.save_status(PAYMENT_STATUS['canceled'])
+                # we have to do urlencode here to make the post data more
+                # readable in the error log
+                post_data_encoded = urlencode(post_data)
+                self.log_error(
+                    parsed_response, api_url, request_data=post_data_encoded,
+                    transaction=self.transaction)
+                return redirect(self.get_error_url())
 
 
 class SetExpressCheckoutFormMixin(PayPalFormMixin, forms.Form):
@@ -261,6 +372,39 @@ class SetExpressCheckoutFormMixin(PayPalFormMixin, forms.Form):
         })
         return post_data
 
+    def get_purchased_items(self, transaction, item_quantity_list):
+        """
+        Returns unsaved ``PurchasedItem`` objects for the given transaction.
+
+        They are saved with a single ``bulk_create``, so ``save()`` is not
+        called and no ``post_save`` signals are sent for them. Content types
+        are resolved once per model.
+
+        """
+        content_types = {}
+        purchased_items = []
+        for item, quantity, content_object in item_quantity_list:
+            if not quantity:
+                continue
+            purchased_item = PurchasedItem(
+                user=self.user,
+                transaction=transaction,
+                quantity=quantity,
+                price=item.value,
+                identifier=item.identifier,
+            )
+            if content_object:
+                model = type(content_object)
+                if model not in content_types:
+                    content_types[model] = ContentType.objects.get_for_model(
+                        content_object)
+                purchased_item.object_id = content_object.pk
+                purchased_item.content_type = content_types[model]
+            if item.pk:
+                purchased_item.item = item
+            purchased_items.append(purchased_item)
+        return purchased_items
+
     def get_url_kwargs(self):
         """Provide additional url kwargs, by overriding this method."""
         return {}
@@ -286,55 +430,48 @@ class SetExpressCheckoutFormMixin(PayPalFormMixin, forms.Form):
         :param items: A list of ``Item`` objects.
 
         """
-        item_quantity_list = self.get_items_and_quantities()
-        post_data = self.get_post_data(item_quantity_list)
-        api_url = API_URL
-
-        # making the post to paypal and handling the results
-        parsed_response = self.call_paypal(api_url, post_data)
-        if parsed_response.get('ACK')[0] == 'Success':
-            token = parsed_response.get('TOKEN')[0]
-            transaction = PaymentTransaction(
-                user=self.user,
-                date=now(),
-                transaction_id=token,
-                value=post_data['PAYMENTREQUEST_0_AMT'],
-                status=PAYMENT_STATUS['checkout'],
-                content_object=self.get_content_object(),
-            )
-            transaction.save()
-            self.post_transaction_save(transaction, item_quantity_list)
-            for item, quantity, content_object in item_quantity_list:
-                if not quantity:
-                    continue
-                purchased_item_kwargs = {
-                    'user': self.user,
-                    'transaction': transaction,
-                    'quantity': quantity,
-                    'price': item.value,
-                    'identifier': item.identifier,
-                }
-
-                if content_object:
-                    purchased_item_kwargs.update({
-                        'object_id': content_object.pk,
-                        'content_type': ContentType.objects.get_for_model(
-                            content_object),
-                    })
-
-                if item.pk:
-                    purchased_item_kwargs.update({'item': item, })
-
-                PurchasedItem.objects.create(**purchased_item_kwargs)
-            if self.redirect:
-                return redirect(LOGIN_URL + token)
-            return LOGIN_URL + token
-        elif parsed_response.get('ACK')[0] == 'Failure':
-            post_data_encoded = urlencode(post_data)
-            self.log_error(
-                parsed_response, api_url=api_url,
-                request_data=post_data_encoded)
-            return redirect(self.get_error_url())
+        with tracing.span('set_checkout') as span:
+            item_quantity_list = self.get_items_and_quantities()
+            post_data = self.get_post_data(item_quantity_list)
+            api_url = self.get_api_url()
+
+            # making the post to paypal and handling the results
+            parsed_response = self.call_paypal(api_url, post_data)
+            if parsed_response is None:
+                return redirect(self.get_error_url())
+            if parsed_response.get('ACK')[0] == 'Success':
+                token = parsed_response.get('TOKEN')[0]
+                span.set_tag('token', token)
+                profiling.annotate(
+                    transaction_id=token, correlation_id=span.correlation_id)
+                transaction = PaymentTransaction(
+                    user=self.user,
+                    date=now(),
+                    transaction_id=token,
+                    value=post_data['PAYMENTREQUEST_0_AMT'],
+                    currency=post_data['PAYMENTREQUEST_0_CURRENCYCODE'],
+                    status=PAYMENT_STATUS['checkout'],
+                    content_object=self.get_content_object(),
+                    correlation_id=span.correlation_id,
+                )
+                with atomic():
+                    transaction.save()
+                    transaction.add_status_event('set_checkout')
+                    self.post_transaction_save(transaction, item_quantity_list)
+                    PurchasedItem.objects.bulk_create(self.get_purchased_items(
+                        transaction, item_quantity_list))
+                    if REVENUE_ROLLUP:
+                        DailyRevenue.objects.record_transitions(
+                            [(transaction, None)])
+                if self.redirect:
+                    return redirect(LOGIN_URL + token)
+                return LOGIN_URL + token
+            elif parsed_response.get('ACK')[0] == 'Failure':
+                post_data_encoded = urlencode(post_data)
+                self.log_error(
+                    parsed_response, api_url=api_url,
+                    request_data=post_data_encoded)
+                return redirect(self.get_error_url())
 
 
 class SetExpressCheckoutItemForm(SetExpressCheckoutFormMixin):
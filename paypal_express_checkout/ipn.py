@@ -0,0 +1,296 @@
+"""Processing of PayPal instant payment notifications (IPN)."""
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from . import profiling, settings, tracing
+from .constants import PAYMENT_STATUS
+from .models import PaymentTransaction, QueuedIPN, ReceivedIPN
+from .signals import payment_completed, payment_status_updated
+from .transport import get_transport
+from .utils import delete_in_batches
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidIPN(Exception):
+    """Raised if PayPal does not confirm that it sent an IPN."""
+    pass
+
+
+class IPNVerifier(object):
+    """
+    Verifies IPNs by posting them back to PayPal's ``_notify-validate``.
+
+    The postback uses the pooled transport, so it usually reuses a kept-alive
+    connection. Verified messages are remembered in the Django cache for
+    ``cache_timeout`` seconds, so that resends of the same IPN do not trigger
+    another postback.
+
+    :param url: The verification URL. Defaults to
+      ``PAYPAL_IPN_VERIFY_URL``.
+    :param transport: The transport to use. Defaults to ``get_transport()``.
+    :param timeout: Seconds to wait for PayPal's answer.
+
+    """
+    def __init__(self, url=None, transport=None, timeout=None,
+                 cache_alias=None, cache_timeout=None):
+        self.url = url or settings.IPN_VERIFY_URL
+        self.transport = transport or get_transport()
+        self.timeout = timeout or settings.IPN_VERIFY_TIMEOUT
+        self.cache = caches[cache_alias or settings.IPN_VERIFY_CACHE]
+        self.cache_timeout = cache_timeout or settings.IPN_VERIFY_CACHE_TIMEOUT
+
+    def get_key(self, body):
+        return 'paypal_express_checkout:ipn_verified:{0}'.format(
+            hashlib.sha1(body).hexdigest())
+
+    def verify(self, body):
+        """
+        Returns ``True`` if PayPal confirms that it sent the IPN ``body``.
+
+        ``body`` is the raw, urlencoded POST body of the IPN. Raises one of
+        ``client.CALL_ERRORS`` if PayPal could not be reached.
+
+        """
+        key = self.get_key(body)
+        if self.cache.get(key):
+            return True
+        start = time.time()
+        try:
+            response = self.transport.post(
+                self.url, 'cmd=_notify-validate&' + body,
+                timeout=self.timeout)
+        finally:
+            profiling.add_paypal_time(time.time() - start)
+        if response.strip() != 'VERIFIED':
+            return False
+        self.cache.set(key, True, self.cache_timeout)
+        return True
+
+
+def get_transaction_id(data):
+    """Returns the id of the transaction the IPN ``data`` refers to."""
+    # In case of a refund, we will not create a new transaction. We will
+    # alter the status of the original transaction instead.
+    if data.get('payment_status') == PAYMENT_STATUS['refunded']:
+        return data.get('parent_txn_id')
+    return data.get('txn_id')
+
+
+def apply_ipn(payment_transaction, data):
+    """
+    Sets the status of ``payment_transaction`` to the one of the IPN.
+
+    Returns ``False`` if the transaction may not change to the status of the
+    IPN, e.g. for a ``Pending`` IPN that arrives after the ``Completed`` one.
+
+    :param payment_transaction: The ``PaymentTransaction`` the IPN refers to.
+    :param data: The POST data of the IPN.
+
+    """
+    payment_status = data.get('payment_status')
+    previous_status = payment_transaction.status
+    if not payment_transaction.transition(payment_status, source='ipn'):
+        logger.warning(
+            'Ignoring IPN for transaction {0}: {1} is not allowed after'
+            ' {2}.'.format(payment_transaction.transaction_id, payment_status,
+                           previous_status))
+        return False
+    return True
+
+
+def send_ipn_signals(payment_transaction, data, sender):
+    """
+    Sends ``payment_completed`` and ``payment_status_updated`` for an
+    applied IPN.
+
+    """
+    if data.get('payment_status') == PAYMENT_STATUS['completed']:
+        payment_completed.send(sender, transaction=payment_transaction)
+    payment_status_updated.send(sender, transaction=payment_transaction)
+
+
+def record_ipn(data):
+    """
+    Remembers the IPN ``data`` and returns ``True`` if it is new.
+
+    Returns ``False`` if the same message has been recorded before.
+
+    """
+    try:
+        with atomic():
+            ReceivedIPN.objects.create(
+                txn_id=data.get('txn_id') or '',
+                payment_status=data.get('payment_status') or '',
+                ipn_track_id=data.get('ipn_track_id') or '',
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def handle_ipn(payment_transaction, data, sender, send_signals=True):
+    """
+    Applies the IPN ``data`` unless it is a repeated delivery.
+
+    The IPN is recorded in the same database transaction, so that it will be
+    accepted again if applying it fails. Returns ``True`` if it was applied.
+
+    The signals are sent after that database transaction, so a failing
+    receiver does not undo the IPN. Pass ``send_signals=False`` to send them
+    yourself with ``send_ipn_signals``, e.g. after an outer transaction.
+
+    The IPN is traced as an ``ipn`` span with the correlation id of the
+    transaction.
+
+    """
+    with tracing.span(
+            'ipn', payment_transaction.correlation_id,
+            token=payment_transaction.transaction_id,
+            txn_id=data.get('txn_id'),
+            payment_status=data.get('payment_status')) as span:
+        profiling.annotate(
+            transaction_id=payment_transaction.transaction_id,
+            correlation_id=span.correlation_id)
+        with atomic():
+            if not record_ipn(data):
+                logger.info(
+                    'Ignoring repeated IPN for transaction {0}.'.format(
+                        data.get('txn_id')))
+                applied = False
+            else:
+                applied = apply_ipn(payment_transaction, data)
+        span.set_tag('applied', applied)
+        if applied and send_signals:
+            send_ipn_signals(payment_transaction, data, sender)
+        return applied
+
+
+def enqueue_ipn(request):
+    """
+    Stores the IPN of ``request`` for later processing.
+
+    Transaction ids longer than ``QueuedIPN.transaction_id`` are truncated.
+    No transaction has such an id, so the IPN is given up on later.
+
+    """
+    # the raw body has to be read before request.POST consumes it
+    data = request.body
+    max_length = QueuedIPN._meta.get_field('transaction_id').max_length
+    transaction_id = get_transaction_id(request.POST) or ''
+    if len(transaction_id) > max_length:
+        logger.warning('Queueing IPN with an invalid transaction id {0!r}.'
+                       .format(transaction_id))
+    return QueuedIPN.objects.create(
+        transaction_id=transaction_id[:max_length],
+        data=data,
+    )
+
+
+def get_retry_delay(attempts):
+    """Returns the delay before the next attempt as a ``timedelta``."""
+    return timedelta(seconds=min(
+        settings.IPN_QUEUE_RETRY_DELAY * 2 ** (attempts - 1), 3600))
+
+
+def process_queued_ipn(message):
+    """
+    Applies a single ``QueuedIPN`` and marks it as processed.
+
+    Raises ``PaymentTransaction.DoesNotExist`` if the transaction is not
+    known (yet) and ``InvalidIPN`` if ``PAYPAL_IPN_VERIFY`` is set and PayPal
+    does not confirm the IPN.
+
+    The signals are sent once the IPN is marked as processed, so receivers
+    are never called twice for the same IPN. Errors of receivers are logged.
+
+    """
+    if settings.IPN_VERIFY and not IPNVerifier().verify(
+            message.get_body()):
+        raise InvalidIPN(message.pk)
+    data = message.get_data()
+    with atomic():
+        payment_transaction = PaymentTransaction.objects.get(
+            transaction_id=message.transaction_id)
+        applied = handle_ipn(
+            payment_transaction, data, sender=message, send_signals=False)
+        QueuedIPN.objects.filter(pk=message.pk).update(
+            processed=now(), attempts=message.attempts + 1, error='')
+    if applied:
+        try:
+            send_ipn_signals(payment_transaction, data, sender=message)
+        except Exception:
+            logger.exception(
+                'A signal receiver failed for IPN {0}.'.format(message.pk))
+
+
+def process_ipn_queue(batch_size=100, max_attempts=None):
+    """
+    Processes the next batch of waiting IPNs in the order they arrived.
+
+    IPNs of a transaction are never processed while an earlier IPN of the same
+    transaction is still waiting for a retry. Failed IPNs are retried with
+    exponential backoff and given up on after ``max_attempts``.
+
+    Returns the number of IPNs that have been attempted.
+
+    """
+    max_attempts = max_attempts or settings.IPN_QUEUE_MAX_ATTEMPTS
+    current_time = now()
+    waiting = QueuedIPN.objects.filter(processed__isnull=True)
+    blocked = set(waiting.filter(
+        next_attempt__gt=current_time).values_list(
+            'transaction_id', flat=True))
+    messages = list(waiting.exclude(
+        next_attempt__gt=current_time).exclude(
+            transaction_id__in=blocked).order_by('pk')[:batch_size])
+    attempted = 0
+    for message in messages:
+        if message.transaction_id in blocked:
+            continue
+        attempted += 1
+        try:
+            process_queued_ipn(message)
+        except Exception as ex:
+            blocked.add(message.transaction_id)
+            attempts = message.attempts + 1
+            update_kwargs = {'attempts': attempts, 'error': repr(ex)}
+            if attempts >= max_attempts or isinstance(ex, InvalidIPN):
+                logger.error('Giving up on IPN {0}: {1!r}'.format(
+                    message.pk, ex))
+                update_kwargs['processed'] = now()
+            else:
+                logger.warning('Processing IPN {0} failed: {1!r}'.format(
+                    message.pk, ex))
+                update_kwargs['next_attempt'] = (
+                    now() + get_retry_delay(attempts))
+            QueuedIPN.objects.filter(pk=message.pk).update(**update_kwargs)
+    return attempted
+
+
+def prune_ipns(days=None, batch_size=1000):
+    """
+    Deletes received and processed queued IPNs older than ``days``.
+
+    ``days`` defaults to ``PAYPAL_IPN_RETENTION_DAYS``. Repeated deliveries
+    of a pruned IPN are not detected any more, so keep the retention longer
+    than the period PayPal retries IPNs in. Returns the number of deleted
+    objects.
+
+    """
+    if days is None:
+        days = settings.IPN_RETENTION_DAYS
+    before = now() - timedelta(days=days)
+    return (
+        delete_in_batches(ReceivedIPN.objects.filter(
+            received__lt=before), batch_size) +
+        delete_in_batches(QueuedIPN.objects.filter(
+            processed__lt=before), batch_size))
@@ -0,0 +1,61 @@
+"""Benchmarks the checkout -> confirm -> IPN lifecycle."""
+import json
+
+from django.db import connection
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from ...benchmark import CheckoutBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs simulated customers through checkout, confirm and IPN against a'
+        ' fake PayPal server in a fresh test database and prints the results'
+        ' as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Customers running at the same time. Use 1 for SQLite.')
+        parser.add_argument(
+            '--api-url', dest='api_url', default=None,
+            help='URL of a running fake PayPal server. By default one is'
+                 ' started in-process.')
+        parser.add_argument(
+            '--latency', type=float, default=0,
+            help='Latency of the in-process fake PayPal server in seconds.')
+        parser.add_argument(
+            '--output', default=None,
+            help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument(
+            '--keepdb', action='store_true', dest='keepdb', default=False,
+            help='Keep the test database after the run.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb'])
+        try:
+            report = CheckoutBenchmark(
+                customers=options['customers'],
+                concurrency=options['concurrency'],
+                api_url=options['api_url'],
+                server_options={'latency': options['latency']},
+            ).run()
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
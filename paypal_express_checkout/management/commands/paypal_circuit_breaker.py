@@ -0,0 +1,21 @@
+"""Shows or resets the state of the PayPal circuit breaker."""
+import json
+
+from django.core.management.base import BaseCommand
+
+from ...circuit_breaker import CircuitBreaker
+
+
+class Command(BaseCommand):
+    help = 'Prints the state of the PayPal circuit breaker as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', dest='reset', default=False,
+            help='Closes the circuit and forgets all recorded failures.')
+
+    def handle(self, *args, **options):
+        circuit_breaker = CircuitBreaker()
+        if options['reset']:
+            circuit_breaker.reset()
+        self.stdout.write(json.dumps(circuit_breaker.get_status()))
@@ -0,0 +1,58 @@
+"""Exports transactions, purchased items or errors as CSV or JSON lines."""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...export import FORMATS, export_lines, filter_queryset
+from ...models import (
+    PaymentTransaction,
+    PaymentTransactionError,
+    PurchasedItem,
+)
+
+
+MODELS = {
+    'transactions': PaymentTransaction,
+    'items': PurchasedItem,
+    'errors': PaymentTransactionError,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams an export of transactions, purchased items or errors to'
+        ' stdout or a file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS.keys()))
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS.keys()), default='csv',
+            dest='export_format')
+        parser.add_argument('--output', help='Defaults to stdout.')
+        parser.add_argument(
+            '--from', dest='date_from', help='First day, as YYYY-MM-DD.')
+        parser.add_argument(
+            '--to', dest='date_to', help='Last day, as YYYY-MM-DD.')
+        parser.add_argument('--status')
+        parser.add_argument('--identifier')
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000, dest='chunk_size')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['model']]
+        if options['identifier'] and model is PaymentTransactionError:
+            raise CommandError('Errors cannot be filtered by identifier.')
+        try:
+            queryset = filter_queryset(
+                model.objects.all(), date_from=options['date_from'],
+                date_to=options['date_to'], status=options['status'],
+                identifier=options['identifier'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        lines = export_lines(
+            queryset, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for line in lines:
+                    output.write(line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,51 @@
+"""Runs a local stand-in for the PayPal NVP API."""
+from django.core.management.base import BaseCommand
+
+from ...fake_paypal import FakePayPalServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a fake PayPal NVP server. Set PAYPAL_API_URL to the printed URL'
+        ' to send all PayPal calls to it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8010)
+        parser.add_argument(
+            '--latency', type=float, default=0,
+            help='Seconds every response is delayed.')
+        parser.add_argument(
+            '--jitter', type=float, default=0,
+            help='Up to this many seconds are randomly added to the latency.')
+        parser.add_argument(
+            '--error-rate', type=float, default=0, dest='error_rate',
+            help='Share of requests (0..1) answered with HTTP 500.')
+        parser.add_argument(
+            '--failure-rate', type=float, default=0, dest='failure_rate',
+            help='Share of API calls (0..1) answered with ACK=Failure.')
+        parser.add_argument(
+            '--ipn-delay', type=float, default=0, dest='ipn_delay',
+            help='Seconds to wait before posting an IPN.')
+        parser.add_argument(
+            '--no-ipn', action='store_false', dest='send_ipn', default=True,
+            help='Do not post IPNs.')
+
+    def handle(self, *args, **options):
+        server = FakePayPalServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            failure_rate=options['failure_rate'],
+            ipn_delay=options['ipn_delay'],
+            send_ipn=options['send_ipn'],
+        )
+        self.stdout.write('Fake PayPal API listening on {0}'.format(
+            server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,41 @@
+"""Processes IPNs that have been queued by the IPN listener."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...ipn import process_ipn_queue
+
+
+class Command(BaseCommand):
+    help = (
+        'Processes queued IPNs in the order they were received. Use with'
+        ' PAYPAL_IPN_MODE = "queue". Run only one worker at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100, dest='batch_size')
+        parser.add_argument(
+            '--max-attempts', type=int, default=None, dest='max_attempts',
+            help='Give up on an IPN after this many failed attempts.')
+        parser.add_argument(
+            '--loop', action='store_true', dest='loop', default=False,
+            help='Keep polling for new IPNs instead of exiting once the'
+                 ' queue is drained.')
+        parser.add_argument(
+            '--sleep', type=float, default=1,
+            help='Seconds to wait between polls in --loop mode.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            count = process_ipn_queue(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'])
+            total += count
+            if count:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Processed {0} IPNs.'.format(total))
@@ -0,0 +1,23 @@
+"""Deletes old error buckets and logged errors."""
+from django.core.management.base import BaseCommand
+
+from ...models import ErrorBucket
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the error buckets and logged errors that are older than'
+        ' PAYPAL_ERROR_RETENTION_DAYS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Overrides PAYPAL_ERROR_RETENTION_DAYS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, dest='batch_size')
+
+    def handle(self, *args, **options):
+        count = ErrorBucket.objects.prune(
+            days=options['days'], batch_size=options['batch_size'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Deleted {0} error records.'.format(count))
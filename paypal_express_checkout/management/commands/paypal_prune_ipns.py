@@ -0,0 +1,23 @@
+"""Deletes old IPN records."""
+from django.core.management.base import BaseCommand
+
+from ...ipn import prune_ipns
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the records of received IPNs and processed queued IPNs that'
+        ' are older than PAYPAL_IPN_RETENTION_DAYS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Overrides PAYPAL_IPN_RETENTION_DAYS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, dest='batch_size')
+
+    def handle(self, *args, **options):
+        count = prune_ipns(
+            days=options['days'], batch_size=options['batch_size'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Deleted {0} IPN records.'.format(count))
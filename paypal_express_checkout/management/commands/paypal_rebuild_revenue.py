@@ -0,0 +1,20 @@
+"""Rebuilds the daily revenue rollup."""
+from django.core.management.base import BaseCommand
+
+from ...models import DailyRevenue
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculates the DailyRevenue rollup from all purchased items. Use'
+        ' it after enabling PAYPAL_REVENUE_ROLLUP or to repair the rollup.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000, dest='chunk_size')
+
+    def handle(self, *args, **options):
+        DailyRevenue.objects.rebuild(chunk_size=options['chunk_size'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Rebuilt {0} daily revenue rows.'.format(
+                DailyRevenue.objects.count()))
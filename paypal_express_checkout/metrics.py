@@ -0,0 +1,299 @@
+"""
+In-process metrics of PayPal calls, IPNs and checkout steps.
+
+The app reports to the backend configured with ``PAYPAL_METRICS_BACKEND``:
+
+* ``paypal_api_request_duration_seconds{method}``: Histogram of the duration
+  of API calls, including retries.
+* ``paypal_api_requests_total{method, outcome}``: The ``ACK`` of the answer,
+  or ``timeout``, ``error`` or ``circuit_open`` if there was none.
+* ``paypal_errors_total``: Logged ``PaymentTransactionError`` objects.
+* ``paypal_ipn_duration_seconds{mode}``: Histogram of the IPN view.
+* ``paypal_ipns_total{payment_status, result}``: Received IPNs.
+* ``paypal_db_duration_seconds{step}``: Histogram of the time spent in
+  database queries per checkout step.
+
+"""
+import bisect
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.utils.module_loading import import_string
+
+from . import settings
+
+
+#: The content type of the Prometheus text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class BaseMetricsBackend(object):
+    """
+    Interface every metrics backend has to implement.
+
+    Backends are called on every PayPal call and IPN, so they should not do
+    any I/O in ``increment`` and ``observe``.
+
+    """
+    def increment(self, name, labels=None, value=1):
+        """Adds ``value`` to the counter ``name``."""
+        raise NotImplementedError
+
+    def observe(self, name, value, labels=None):
+        """Adds ``value`` to the histogram ``name``."""
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text format, or ``None`` if
+        the backend cannot be scraped.
+
+        """
+        return None
+
+
+class NullMetricsBackend(BaseMetricsBackend):
+    """Discards all metrics."""
+    def increment(self, name, labels=None, value=1):
+        pass
+
+    def observe(self, name, value, labels=None):
+        pass
+
+
+def get_label_key(labels):
+    if not labels:
+        return ()
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(label_key, extra=()):
+    label_key = label_key + extra
+    if not label_key:
+        return ''
+    return '{{{0}}}'.format(','.join(
+        '{0}="{1}"'.format(name, format_label_value(value))
+        for name, value in label_key))
+
+
+def format_label_value(value):
+    return unicode(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class LocalMetricsBackend(BaseMetricsBackend):
+    """
+    Keeps the metrics in the memory of the current process.
+
+    Updates take a lock and a dictionary lookup. Histograms count into fixed
+    buckets, so their size does not grow with the number of observations.
+
+    :param buckets: The upper bounds of the histogram buckets in seconds.
+      Defaults to ``PAYPAL_METRICS_BUCKETS``.
+
+    """
+    def __init__(self, buckets=None):
+        self.buckets = tuple(sorted(buckets or settings.METRICS_BUCKETS))
+        self.lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [count per bucket..., count above, sum]
+        self.histograms = {}
+
+    def increment(self, name, labels=None, value=1):
+        key = (name, get_label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, get_label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = [0] * (len(self.buckets) + 1) + [0.0]
+                self.histograms[key] = histogram
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def get_counter(self, name, labels=None):
+        """Returns the value of a counter."""
+        return self.counters.get((name, get_label_key(labels)), 0)
+
+    def get_histogram_count(self, name, labels=None):
+        """Returns the number of observations of a histogram."""
+        histogram = self.histograms.get((name, get_label_key(labels)))
+        return sum(histogram[:-1]) if histogram else 0
+
+    def render(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(histogram))
+                for key, histogram in self.histograms.items())
+        lines = []
+        for name, items in groupby(counters, lambda item: item[0][0]):
+            lines.append('# TYPE {0} counter'.format(name))
+            for (name, label_key), value in items:
+                lines.append('{0}{1} {2}'.format(
+                    name, format_labels(label_key), format_value(value)))
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for name, items in groupby(histograms, lambda item: item[0][0]):
+            lines.append('# TYPE {0} histogram'.format(name))
+            for (name, label_key), histogram in items:
+                count = 0
+                for bound, bucket_count in zip(bounds, histogram[:-1]):
+                    count += bucket_count
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, format_labels(label_key, (('le', bound),)),
+                        count))
+                labels = format_labels(label_key)
+                lines.append('{0}_sum{1} {2}'.format(
+                    name, labels, format_value(histogram[-1])))
+                lines.append('{0}_count{1} {2}'.format(name, labels, count))
+        return '\n'.join(lines) + '\n'
+
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the metrics backend of the current process.
+
+    The class is taken from the ``PAYPAL_METRICS_BACKEND`` setting. The
+    instance is re-created after a fork, so that worker processes do not
+    report the metrics of their parent.
+
+    """
+    global _backend, _backend_pid
+    pid = os.getpid()
+    if _backend is not None and _backend_pid == pid:
+        return _backend
+    with _backend_lock:
+        if _backend is None or _backend_pid != pid:
+            _backend = import_string(settings.METRICS_BACKEND)()
+            _backend_pid = pid
+        return _backend
+
+
+def increment(name, labels=None, value=1):
+    get_backend().increment(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    get_backend().observe(name, value, labels)
+
+
+class TimingCursorWrapper(CursorWrapper):
+    """Adds the duration of every query to a ``QueryTimer``."""
+    def __init__(self, cursor, db, timer):
+        super(TimingCursorWrapper, self).__init__(cursor, db)
+        self.timer = timer
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(TimingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.timer.add(time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return super(TimingCursorWrapper, self).executemany(
+                sql, param_list)
+        finally:
+            self.timer.add(time.time() - start)
+
+
+class QueryTimer(object):
+    """
+    Measures the database queries of the current thread between ``start``
+    and ``stop``.
+
+    The cursors created in between are wrapped with a
+    ``TimingCursorWrapper``. Unlike Django's debug cursor, it does not format
+    the SQL of the queries. Timers have to be stopped in the reverse order
+    they were started in.
+
+    """
+    cursor_factories = ('make_cursor', 'make_debug_cursor')
+
+    def __init__(self, using='default'):
+        self.connection = connections[using]
+        self.seconds = 0.0
+        self.queries = 0
+        self.patched = None
+
+    def add(self, seconds):
+        self.seconds += seconds
+        self.queries += 1
+
+    def wrap(self, make_cursor):
+        def _make_cursor(cursor):
+            return TimingCursorWrapper(make_cursor(cursor), self.connection,
+                                       self)
+        return _make_cursor
+
+    def start(self):
+        # connections are thread local, so the wrappers only see this thread
+        connection = self.connection
+        self.patched = dict(
+            (name, connection.__dict__.get(name))
+            for name in self.cursor_factories)
+        for name in self.cursor_factories:
+            setattr(connection, name, self.wrap(getattr(connection, name)))
+
+    def stop(self):
+        if self.patched is None:
+            return
+        for name, value in self.patched.items():
+            if value is None:
+                delattr(self.connection, name)
+            else:
+                setattr(self.connection, name, value)
+        self.patched = None
+
+
+@contextmanager
+def db_timer(step, using='default'):
+    """
+    Observes the time spent in database queries inside the block.
+
+    Nothing is measured if ``PAYPAL_METRICS_DB_TIME`` is ``False``.
+
+    :param step: The ``step`` label of ``paypal_db_duration_seconds``.
+
+    """
+    if not settings.METRICS_DB_TIME:
+        yield
+        return
+    timer = QueryTimer(using)
+    timer.start()
+    try:
+        yield
+    finally:
+        timer.stop()
+        observe('paypal_db_duration_seconds', timer.seconds, {'step': step})
+
+
+def get_error_outcome(error):
+    """Returns ``timeout`` or ``error`` for an exception of a PayPal call."""
+    if isinstance(error, socket.timeout) or isinstance(
+            getattr(error, 'reason', None), socket.timeout):
+        return 'timeout'
+    return 'error'
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# (fields, suffix) like Django would create them for ``db_index`` and
+# ``index_together``
+INDEXES = [
+    (['transaction_id'], ''),
+    (['user', 'transaction_id'], '_idx'),
+    (['status', 'creation_date'], '_idx'),
+]
+
+
+class CreateIndexes(migrations.operations.base.Operation):
+    """
+    Creates the indexes without locking the table on PostgreSQL.
+
+    ``CREATE INDEX CONCURRENTLY`` cannot run inside a transaction, which is
+    why this migration is not atomic. Other databases get a plain
+    ``CREATE INDEX``. The indexes get the names Django derives for them, so
+    that later migrations of the fields find them.
+
+    """
+    reversible = True
+
+    def __init__(self, model_name, indexes):
+        self.model_name = model_name
+        self.indexes = indexes
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def get_indexes(self, app_label, schema_editor, state):
+        """Returns a list of ``(name, columns)`` tuples."""
+        model = state.apps.get_model(app_label, self.model_name)
+        indexes = []
+        for field_names, suffix in self.indexes:
+            fields = [model._meta.get_field(name) for name in field_names]
+            columns = [field.column for field in fields]
+            indexes.append((
+                schema_editor._create_index_name(model, columns, suffix),
+                [schema_editor.quote_name(column) for column in columns]))
+            if (schema_editor.connection.vendor == 'postgresql' and
+                    len(fields) == 1 and fields[0].db_type(
+                        schema_editor.connection).startswith('varchar')):
+                # the extra index PostgreSQL gets for ``LIKE`` lookups
+                indexes.append((
+                    schema_editor._create_index_name(
+                        model, columns, '_like'),
+                    ['{0} varchar_pattern_ops'.format(
+                        schema_editor.quote_name(columns[0]))]))
+        return model._meta.db_table, indexes
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        connection = schema_editor.connection
+        concurrently = (
+            connection.vendor == 'postgresql' and
+            not connection.in_atomic_block)
+        table, indexes = self.get_indexes(app_label, schema_editor, to_state)
+        for name, columns in indexes:
+            schema_editor.execute('CREATE INDEX {0}{1} ON {2} ({3})'.format(
+                'CONCURRENTLY ' if concurrently else '',
+                schema_editor.quote_name(name),
+                schema_editor.quote_name(table), ', '.join(columns)))
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        connection = schema_editor.connection
+        table, indexes = self.get_indexes(
+            app_label, schema_editor, from_state)
+        for name, columns in indexes:
+            if connection.vendor == 'mysql':
+                sql = 'DROP INDEX {0} ON {1}'.format(
+                    schema_editor.quote_name(name),
+                    schema_editor.quote_name(table))
+            else:
+                sql = 'DROP INDEX {0}'.format(schema_editor.quote_name(name))
+            schema_editor.execute(sql)
+
+    def describe(self):
+        return 'Create indexes on {0}'.format(self.model_name)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('paypal_express_checkout', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                CreateIndexes('PaymentTransaction', INDEXES),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='paymenttransaction',
+                    name='transaction_id',
+                    field=models.CharField(db_index=True, max_length=32, verbose_name='Transaction ID'),
+                ),
+                migrations.AlterIndexTogether(
+                    name='paymenttransaction',
+                    index_together=set([('user', 'transaction_id'), ('status', 'creation_date')]),
+                ),
+            ],
+        ),
+    ]
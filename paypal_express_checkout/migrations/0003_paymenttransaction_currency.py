@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0002_paymenttransaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='currency',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Currency'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 12:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0003_paymenttransaction_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedIPN',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation time')),
+                ('transaction_id', models.CharField(db_index=True, max_length=32, verbose_name='Transaction ID')),
+                ('data', models.TextField(verbose_name='Data')),
+                ('processed', models.DateTimeField(blank=True, null=True, verbose_name='Processing time')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt', models.DateTimeField(blank=True, null=True, verbose_name='Next attempt')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='queuedipn',
+            index_together=set([('processed', 'next_attempt')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 12:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0004_queuedipn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceivedIPN',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Receiving time')),
+                ('txn_id', models.CharField(max_length=32, verbose_name='Transaction ID')),
+                ('payment_status', models.CharField(max_length=32, verbose_name='Payment status')),
+                ('ipn_track_id', models.CharField(blank=True, max_length=64, verbose_name='IPN track ID')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='receivedipn',
+            unique_together=set([('txn_id', 'payment_status', 'ipn_track_id')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 12:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0005_receivedipn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentStatusEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation time')),
+                ('status', models.CharField(choices=[(b'Checkout', b'Checkout'), (b'Pending', b'Pending'), (b'Canceled', b'Canceled'), (b'Completed', b'Completed'), (b'Canceled_Reversal', b'Canceled_Reversal'), (b'Created', b'Created'), (b'Denied', b'Denied'), (b'Expired', b'Expired'), (b'Failed', b'Failed'), (b'Refunded', b'Refunded'), (b'Reversed', b'Reversed'), (b'Processed', b'Processed'), (b'Voided', b'Voided')], max_length=16, verbose_name='Payment status')),
+                ('source', models.CharField(blank=True, max_length=32, verbose_name='Source')),
+                ('transaction', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='paypal_express_checkout.PaymentTransaction', verbose_name='Payment transaction')),
+            ],
+            options={
+                'ordering': ['created', 'pk'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='paymentstatusevent',
+            index_together=set([('transaction', 'created')]),
+        ),
+    ]
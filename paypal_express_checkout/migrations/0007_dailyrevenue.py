@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 13:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0006_paymentstatusevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('identifier', models.CharField(blank=True, max_length=256, verbose_name='Identifier')),
+                ('currency', models.CharField(blank=True, max_length=16, verbose_name='Currency')),
+                ('status', models.CharField(choices=[(b'Checkout', b'Checkout'), (b'Pending', b'Pending'), (b'Canceled', b'Canceled'), (b'Completed', b'Completed'), (b'Canceled_Reversal', b'Canceled_Reversal'), (b'Created', b'Created'), (b'Denied', b'Denied'), (b'Expired', b'Expired'), (b'Failed', b'Failed'), (b'Refunded', b'Refunded'), (b'Reversed', b'Reversed'), (b'Processed', b'Processed'), (b'Voided', b'Voided')], max_length=16, verbose_name='Payment status')),
+                ('quantity', models.BigIntegerField(default=0, verbose_name='Quantity')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Amount')),
+            ],
+            options={
+                'ordering': ['day', 'identifier', 'currency', 'status'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyrevenue',
+            unique_together=set([('day', 'identifier', 'currency', 'status')]),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 13:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0008_paymenttransaction_correlation_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ErrorBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('api_url', models.CharField(blank=True, max_length=255, verbose_name='Paypal API URL')),
+                ('error_code', models.CharField(max_length=64, verbose_name='Error code')),
+                ('minute', models.DateTimeField(verbose_name='Minute')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('last_seen', models.DateTimeField(verbose_name='Last seen')),
+            ],
+            options={
+                'ordering': ['-minute', 'api_url', 'error_code'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='errorbucket',
+            unique_together=set([('api_url', 'error_code', 'minute')]),
+        ),
+        migrations.AddField(
+            model_name='paymenttransactionerror',
+            name='bucket',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='paypal_express_checkout.ErrorBucket', verbose_name='Error bucket'),
+        ),
+        migrations.AlterField(
+            model_name='paymenttransactionerror',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Time'),
+        ),
+    ]
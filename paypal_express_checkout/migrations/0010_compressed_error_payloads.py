@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 13:19
+from __future__ import unicode_literals
+
+from django.db import migrations
+import paypal_express_checkout.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0009_errorbucket'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymenttransactionerror',
+            name='request_data',
+            field=paypal_express_checkout.fields.CompressedTextField(blank=True, verbose_name='Request data'),
+        ),
+        migrations.AlterField(
+            model_name='paymenttransactionerror',
+            name='response',
+            field=paypal_express_checkout.fields.CompressedTextField(blank=True, verbose_name='Response String'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 13:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal_express_checkout', '0010_compressed_error_payloads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedipn',
+            name='data',
+            field=models.BinaryField(verbose_name='Data'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 13:42
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations
+
+
+# the index for the keyset pagination of the admin is built like the ones of
+# 0002, without locking the table on PostgreSQL
+CreateIndexes = import_module(
+    'paypal_express_checkout.migrations.0002_paymenttransaction_indexes'
+).CreateIndexes
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('paypal_express_checkout', '0011_queuedipn_binary_data'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                CreateIndexes(
+                    'PaymentTransaction', [(['creation_date', 'id'], '_idx')]),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='paymenttransaction',
+                    index_together=set([('user', 'transaction_id'), ('creation_date', 'id'), ('status', 'creation_date')]),
+                ),
+            ],
+        ),
+    ]
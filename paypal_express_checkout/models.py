@@ -1,12 +1,32 @@
 """The models for the ``paypal_express_checkout`` app."""
+import codecs
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import IntegrityError, models
+from django.db.transaction import atomic
+from django.http import QueryDict
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 
-from .constants import STATUS_CHOICES
+from . import settings as app_settings
+from .constants import PAYMENT_STATUS_TRANSITIONS, STATUS_CHOICES
+from .fields import CompressedTextField
+from .signals import payment_statuses_updated
+from .utils import delete_in_batches
+
+
+def get_previous_statuses(status):
+    """Returns the statuses a transaction may change to ``status`` from."""
+    return [
+        previous for previous, statuses in PAYMENT_STATUS_TRANSITIONS.items()
+        if status in statuses]
 
 
 @python_2_unicode_compatible
@@ -54,6 +74,84 @@ class Item(models.Model):
         return u'{0} - {1} {2}'.format(self.name, self.value, self.currency)
 
 
+class PaymentTransactionManager(models.Manager):
+    """Custom manager for the ``PaymentTransaction`` model."""
+    def bulk_transition(self, pairs, source='', batch_size=500):
+        """
+        Changes the status of many transactions with a few set-based queries.
+
+        The pairs are handled in batches of ``batch_size``. Within a batch,
+        the transactions are grouped by their new status and every group is
+        changed with one ``SELECT ... FOR UPDATE``, one ``UPDATE`` and one
+        bulk ``INSERT`` of ``PaymentStatusEvent`` objects. Transactions whose
+        current status does not allow the change are skipped, just like with
+        ``PaymentTransaction.transition``. If a transaction appears in several
+        pairs, its changes are applied in the order of ``pairs``.
+
+        Instead of ``payment_status_updated`` for every transaction, the
+        ``payment_statuses_updated`` signal is sent once per batch with the
+        changed transactions. ``payment_completed`` is not sent.
+
+        Returns the number of changed transactions.
+
+        :param pairs: An iterable of ``(transaction_id, new_status)`` tuples.
+        :param source: Stored with the ``PaymentStatusEvent`` objects.
+        :param batch_size: The number of pairs handled per batch.
+
+        """
+        pairs = list(pairs)
+        count = 0
+        for start in range(0, len(pairs), batch_size):
+            transactions = self._transition_batch(
+                pairs[start:start + batch_size], source)
+            if transactions:
+                payment_statuses_updated.send(
+                    sender=self.model, transactions=transactions)
+            count += len(transactions)
+        return count
+
+    def _transition_batch(self, pairs, source):
+        # the n-th change of every transaction is made in the n-th round
+        rounds = []
+        changes = defaultdict(int)
+        for transaction_id, status in pairs:
+            index = changes[transaction_id]
+            changes[transaction_id] += 1
+            if index == len(rounds):
+                rounds.append(OrderedDict())
+            rounds[index].setdefault(status, []).append(transaction_id)
+        changed = OrderedDict()
+        with atomic():
+            for groups in rounds:
+                self._transition_round(groups, source, changed)
+        return list(changed.values())
+
+    def _transition_round(self, groups, source, changed):
+        for status, transaction_ids in groups.items():
+            previous_statuses = get_previous_statuses(status)
+            transactions = list(self.select_for_update().filter(
+                transaction_id__in=transaction_ids,
+                status__in=previous_statuses))
+            if not transactions:
+                continue
+            date = now()
+            self.filter(pk__in=[obj.pk for obj in transactions]).update(
+                status=status, date=date)
+            transitions = []
+            for transaction in transactions:
+                transitions.append((transaction, transaction.status))
+                transaction.status = status
+                transaction.date = date
+            PaymentStatusEvent.objects.bulk_create([
+                PaymentStatusEvent(
+                    transaction=transaction, status=status, source=source)
+                for transaction in transactions])
+            if app_settings.REVENUE_ROLLUP:
+                DailyRevenue.objects.record_transitions(transitions)
+            for transaction in transactions:
+                changed[transaction.pk] = transaction
+
+
 @python_2_unicode_compatible
 class PaymentTransaction(models.Model):
     """
@@ -66,8 +164,12 @@ class PaymentTransaction(models.Model):
     :date: The date this transaction was saved last time.
     :transaction_id: The unique identifier of the transaction generated by
       PayPal.
-    :value: The amount of the payment. Currency defaults to USD.
+    :value: The amount of the payment.
+    :currency: The currency of the payment, as sent to PayPal. Empty for
+      transactions created before this field existed.
     :status: The status of the transaction.
+    :correlation_id: The id of the tracing spans of this purchase, see
+      ``paypal_express_checkout.tracing``.
 
     """
     user = models.ForeignKey(
@@ -103,6 +205,7 @@ class PaymentTransaction(models.Model):
     transaction_id = models.CharField(
         max_length=32,
         verbose_name=_('Transaction ID'),
+        db_index=True,
     )
 
     value = models.DecimalField(
@@ -111,18 +214,133 @@ class PaymentTransaction(models.Model):
         verbose_name=_('Transaction value'),
     )
 
+    currency = models.CharField(
+        max_length=16,
+        verbose_name=_('Currency'),
+        blank=True,
+    )
+
     status = models.CharField(
         max_length=16,
         choices=STATUS_CHOICES,
         verbose_name=_('Payment status'),
     )
 
+    correlation_id = models.CharField(
+        max_length=32,
+        verbose_name=_('Correlation ID'),
+        blank=True,
+    )
+
+    objects = PaymentTransactionManager()
+
     class Meta:
         ordering = ['-creation_date', 'transaction_id', ]
+        index_together = [
+            ('user', 'transaction_id'),
+            ('status', 'creation_date'),
+            ('creation_date', 'id'),
+        ]
 
     def __str__(self):
         return self.transaction_id
 
+    def add_status_event(self, source=''):
+        """Records the current status in the status history."""
+        return PaymentStatusEvent.objects.create(
+            transaction=self, status=self.status, source=source)
+
+    def transition(self, status, source=''):
+        """
+        Changes the status to ``status`` if ``PAYMENT_STATUS_TRANSITIONS``
+        allows it.
+
+        The change is made with a single ``UPDATE`` that only matches while
+        the row still has one of the allowed previous statuses, so concurrent
+        changes cannot overwrite each other. Only ``status`` and ``date`` are
+        written, and a ``PaymentStatusEvent`` is inserted in the same
+        database transaction. Returns ``True`` if the status was changed.
+
+        If ``PAYPAL_REVENUE_ROLLUP`` is set, the row is locked and read first,
+        because ``DailyRevenue`` needs the previous status.
+
+        :param status: The new status.
+        :param source: Stored with the ``PaymentStatusEvent`` of the change.
+
+        """
+        date = now()
+        previous_statuses = get_previous_statuses(status)
+        with atomic():
+            if app_settings.REVENUE_ROLLUP:
+                locked = PaymentTransaction.objects.select_for_update()
+                previous_status = locked.filter(
+                    pk=self.pk, status__in=previous_statuses).values_list(
+                        'status', flat=True).first()
+                if previous_status is None:
+                    return False
+            updated = PaymentTransaction.objects.filter(
+                pk=self.pk, status__in=previous_statuses).update(
+                    status=status, date=date)
+            if not updated:
+                return False
+            self.status = status
+            self.date = date
+            self.add_status_event(source)
+            if app_settings.REVENUE_ROLLUP:
+                DailyRevenue.objects.record_transitions(
+                    [(self, previous_status)])
+        return True
+
+
+@python_2_unicode_compatible
+class PaymentStatusEvent(models.Model):
+    """
+    An entry in the status history of a ``PaymentTransaction``.
+
+    Events are only ever inserted, one for every status change, so the
+    timeline of a transaction can be read in order of ``created``.
+
+    :transaction: The transaction whose status changed.
+    :created: When the status changed.
+    :status: The new status.
+    :source: What changed the status, e.g. ``set_checkout``, ``do_checkout``
+      or ``ipn``.
+
+    """
+    transaction = models.ForeignKey(
+        PaymentTransaction,
+        verbose_name=_('Payment transaction'),
+        related_name='status_events',
+        # covered by the index on (transaction, created)
+        db_index=False,
+    )
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Creation time'),
+    )
+
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        verbose_name=_('Payment status'),
+    )
+
+    source = models.CharField(
+        max_length=32,
+        verbose_name=_('Source'),
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ['created', 'pk']
+        index_together = [
+            ('transaction', 'created'),
+        ]
+
+    def __str__(self):
+        return u'{0}: {1}'.format(self.transaction_id, self.status)
+
 
 @python_2_unicode_compatible
 class PurchasedItem(models.Model):
@@ -196,6 +414,111 @@ class PurchasedItem(models.Model):
             self.quantity, self.item, self.user.email, self.transaction)
 
 
+class ErrorBucketManager(models.Manager):
+    """Custom manager for the ``ErrorBucket`` model."""
+    def record(self, api_url, error_code, samples=None):
+        """
+        Counts a failed call in the bucket of its API URL, error code and
+        minute.
+
+        The counter is increased with a conditional ``UPDATE``, so that
+        concurrent failures do not overwrite each other. Returns the bucket
+        if the failure is one of its first ``samples`` (defaults to
+        ``PAYPAL_ERROR_SAMPLES``) and its payload should be kept, otherwise
+        ``None``.
+
+        """
+        if samples is None:
+            samples = app_settings.ERROR_SAMPLES
+        current_time = now()
+        lookup = {
+            'api_url': (api_url or '')[:255],
+            'error_code': error_code[:64],
+            'minute': current_time.replace(second=0, microsecond=0),
+        }
+        buckets = self.filter(**lookup)
+        changes = {'count': models.F('count') + 1, 'last_seen': current_time}
+        if buckets.filter(count__lt=samples).update(**changes):
+            return buckets.get()
+        if buckets.update(**changes):
+            return None
+        try:
+            with atomic():
+                bucket = self.create(
+                    count=1, last_seen=current_time, **lookup)
+        except IntegrityError:
+            # created by a concurrent failure in the meantime
+            return self.record(api_url, error_code, samples)
+        return bucket if samples > 0 else None
+
+    def prune(self, days=None, batch_size=1000):
+        """
+        Deletes buckets and ``PaymentTransactionError`` objects older than
+        ``days``, in batches of ``batch_size``.
+
+        ``days`` defaults to ``PAYPAL_ERROR_RETENTION_DAYS``. Returns the
+        number of deleted objects.
+
+        """
+        if days is None:
+            days = app_settings.ERROR_RETENTION_DAYS
+        before = now() - timedelta(days=days)
+        return (
+            delete_in_batches(PaymentTransactionError.objects.filter(
+                date__lt=before), batch_size) +
+            delete_in_batches(self.filter(minute__lt=before), batch_size))
+
+
+@python_2_unicode_compatible
+class ErrorBucket(models.Model):
+    """
+    The number of failed PayPal calls per API URL, error code and minute.
+
+    :api_url: The API endpoint that has been called.
+    :error_code: The PayPal error code, the HTTP status or the name of the
+      exception.
+    :minute: The start of the minute the errors occurred in.
+    :count: The number of errors.
+    :last_seen: When the last of the errors occurred.
+
+    """
+    api_url = models.CharField(
+        max_length=255,
+        verbose_name=_('Paypal API URL'),
+        blank=True,
+    )
+
+    error_code = models.CharField(
+        max_length=64,
+        verbose_name=_('Error code'),
+    )
+
+    minute = models.DateTimeField(
+        verbose_name=_('Minute'),
+    )
+
+    count = models.PositiveIntegerField(
+        verbose_name=_('Count'),
+        default=0,
+    )
+
+    last_seen = models.DateTimeField(
+        verbose_name=_('Last seen'),
+    )
+
+    objects = ErrorBucketManager()
+
+    class Meta:
+        ordering = ['-minute', 'api_url', 'error_code']
+        unique_together = [
+            ('api_url', 'error_code', 'minute'),
+        ]
+
+    def __str__(self):
+        return u'{0} {1} {2}: {3}'.format(
+            self.minute, self.api_url, self.error_code, self.count)
+
+
 @python_2_unicode_compatible
 class PaymentTransactionError(models.Model):
     """
@@ -205,16 +528,20 @@ class PaymentTransactionError(models.Model):
     :user: For which user the error occurred.
     :paypal_api_url: The API endpoint we have been calling, which has responded
       with the error.
-    :request_data: The data payload we have been sending to the API endpoint.
-    :response: The full response string from PayPal.
+    :request_data: The data payload we have been sending to the API endpoint,
+      without the API credentials. Stored compressed.
+    :response: The full response string from PayPal. Stored compressed.
     :transaction: If we send a request at a point in time where we already have
       a transaction, we can add a FK to that transaction for easier cross
       referencing.
+    :bucket: The ``ErrorBucket`` this error is a sample of. Empty if
+      ``PAYPAL_ERROR_LOGGING`` is ``rows``.
 
     """
     date = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_('Time'),
+        db_index=True,
     )
 
     user = models.ForeignKey(
@@ -228,12 +555,12 @@ class PaymentTransactionError(models.Model):
         blank=True,
     )
 
-    request_data = models.TextField(
+    request_data = CompressedTextField(
         verbose_name=_('Request data'),
         blank=True,
     )
 
-    response = models.TextField(
+    response = CompressedTextField(
         verbose_name=_('Response String'),
         blank=True,
     )
@@ -244,5 +571,338 @@ class PaymentTransactionError(models.Model):
         verbose_name=_('Payment transaction'),
     )
 
+    bucket = models.ForeignKey(
+        ErrorBucket,
+        blank=True, null=True,
+        verbose_name=_('Error bucket'),
+        related_name='samples',
+    )
+
     def __str__(self):
         return str(self.date)
+
+
+@python_2_unicode_compatible
+class QueuedIPN(models.Model):
+    """
+    An IPN that has been received but not processed yet.
+
+    Used if ``PAYPAL_IPN_MODE`` is ``queue``. The ``paypal_process_ipns``
+    command processes the messages in the order they were received.
+
+    :created: When the IPN was received.
+    :transaction_id: The id of the transaction the IPN refers to. For
+      refunds this is the id of the original transaction.
+    :data: The raw, urlencoded POST body of the IPN. It is stored as bytes,
+      because PayPal only verifies the exact body it sent.
+    :processed: When the IPN was processed or given up on. ``None`` while it
+      is waiting.
+    :attempts: How often processing has been attempted.
+    :next_attempt: The IPN is not processed before this time.
+    :error: The error of the last failed attempt.
+
+    """
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Creation time'),
+    )
+
+    transaction_id = models.CharField(
+        max_length=32,
+        verbose_name=_('Transaction ID'),
+        db_index=True,
+    )
+
+    data = models.BinaryField(
+        verbose_name=_('Data'),
+    )
+
+    processed = models.DateTimeField(
+        verbose_name=_('Processing time'),
+        blank=True, null=True,
+    )
+
+    attempts = models.PositiveIntegerField(
+        verbose_name=_('Attempts'),
+        default=0,
+    )
+
+    next_attempt = models.DateTimeField(
+        verbose_name=_('Next attempt'),
+        blank=True, null=True,
+    )
+
+    error = models.TextField(
+        verbose_name=_('Error'),
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ['pk']
+        index_together = [
+            ('processed', 'next_attempt'),
+        ]
+
+    def __str__(self):
+        return u'{0} ({1})'.format(self.transaction_id, self.created)
+
+    def get_body(self):
+        """Returns the raw body of the IPN as a byte string."""
+        return bytes(self.data)
+
+    def get_data(self):
+        """
+        Returns the IPN data as a ``QueryDict``.
+
+        The values are decoded with the ``charset`` of the IPN, which is
+        ``windows-1252`` unless configured otherwise in the PayPal account.
+
+        """
+        body = self.get_body()
+        # the name of the charset is ASCII, so any 8 bit encoding finds it
+        charset = QueryDict(body, encoding='iso-8859-1').get('charset')
+        try:
+            codecs.lookup(charset)
+        except (LookupError, TypeError):
+            charset = None
+        return QueryDict(body, encoding=charset)
+
+
+@python_2_unicode_compatible
+class ReceivedIPN(models.Model):
+    """
+    Remembers the IPNs that have been applied, to detect repeated deliveries.
+
+    PayPal sends an IPN again until it got an answer, so the same message can
+    arrive several times. A message is identified by its ``txn_id``,
+    ``payment_status`` and ``ipn_track_id``.
+
+    :received: When the IPN was applied. Used to prune old records.
+    :txn_id: The ``txn_id`` of the IPN.
+    :payment_status: The ``payment_status`` of the IPN.
+    :ipn_track_id: The ``ipn_track_id`` of the IPN.
+
+    """
+    received = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Receiving time'),
+        db_index=True,
+    )
+
+    txn_id = models.CharField(
+        max_length=32,
+        verbose_name=_('Transaction ID'),
+    )
+
+    payment_status = models.CharField(
+        max_length=32,
+        verbose_name=_('Payment status'),
+    )
+
+    ipn_track_id = models.CharField(
+        max_length=64,
+        verbose_name=_('IPN track ID'),
+        blank=True,
+    )
+
+    class Meta:
+        unique_together = [
+            ('txn_id', 'payment_status', 'ipn_track_id'),
+        ]
+
+    def __str__(self):
+        return u'{0} {1} ({2})'.format(
+            self.txn_id, self.payment_status, self.ipn_track_id)
+
+
+class DailyRevenueManager(models.Manager):
+    """Custom manager for the ``DailyRevenue`` model."""
+    def get_day(self, transaction):
+        date = transaction.creation_date or transaction.date
+        if timezone.is_aware(date):
+            date = timezone.localtime(date)
+        return date.date()
+
+    def get_deltas(self, transitions):
+        """
+        Returns the changes of the rollup caused by ``transitions``.
+
+        Reads the purchased items of all transactions with one query. Returns
+        a dictionary of ``{(day, identifier, currency, status): [quantity,
+        amount]}``.
+
+        :param transitions: A list of ``(transaction, previous_status)``
+          tuples. ``transaction.status`` is the new status and
+          ``previous_status`` is ``None`` for new transactions.
+
+        """
+        transactions = dict(
+            (transaction.pk, (transaction, previous_status))
+            for transaction, previous_status in transitions)
+        items = PurchasedItem.objects.filter(
+            transaction__in=transactions.keys()).values_list(
+                'transaction_id', 'identifier', 'price', 'item__value',
+                'item__currency', 'quantity')
+        deltas = defaultdict(lambda: [0, Decimal('0')])
+        for (transaction_id, identifier, price, value, item_currency,
+                quantity) in items:
+            transaction, previous_status = transactions[transaction_id]
+            if price:
+                value = Decimal(repr(price))
+            amount = (value or Decimal('0')) * quantity
+            day = self.get_day(transaction)
+            currency = transaction.currency or item_currency or ''
+            if previous_status is not None:
+                delta = deltas[(day, identifier, currency, previous_status)]
+                delta[0] -= quantity
+                delta[1] -= amount
+            delta = deltas[(day, identifier, currency, transaction.status)]
+            delta[0] += quantity
+            delta[1] += amount
+        return deltas
+
+    def apply_deltas(self, deltas):
+        """Adds ``deltas`` to the rollup rows, creating missing rows."""
+        for (day, identifier, currency, status), (quantity, amount) in sorted(
+                deltas.items()):
+            if not quantity and not amount:
+                continue
+            lookup = {
+                'day': day, 'identifier': identifier, 'currency': currency,
+                'status': status}
+            updated = self.filter(**lookup).update(
+                quantity=models.F('quantity') + quantity,
+                amount=models.F('amount') + amount)
+            if updated:
+                continue
+            try:
+                with atomic():
+                    self.create(quantity=quantity, amount=amount, **lookup)
+            except IntegrityError:
+                # created by a concurrent transition in the meantime
+                self.filter(**lookup).update(
+                    quantity=models.F('quantity') + quantity,
+                    amount=models.F('amount') + amount)
+
+    def record_transitions(self, transitions):
+        """
+        Moves the purchased items of the transactions to their new status.
+
+        :param transitions: See ``get_deltas``.
+
+        """
+        self.apply_deltas(self.get_deltas(transitions))
+
+    def rebuild(self, chunk_size=1000):
+        """
+        Recalculates the whole rollup from the purchased items.
+
+        Transactions are read in chunks of ``chunk_size`` and the rollup is
+        replaced in one database transaction.
+
+        """
+        with atomic():
+            self.all().delete()
+            last_pk = 0
+            while True:
+                transactions = list(PaymentTransaction.objects.filter(
+                    pk__gt=last_pk).order_by('pk').only(
+                        'creation_date', 'date', 'currency', 'status')[
+                            :chunk_size])
+                if not transactions:
+                    return
+                self.record_transitions([
+                    (transaction, None) for transaction in transactions])
+                last_pk = transactions[-1].pk
+
+    def revenue(self, date_from=None, date_to=None, identifier=None,
+                currency=None, status='Completed',
+                group_by=('day', 'identifier', 'currency')):
+        """
+        Returns the summed ``quantity`` and ``amount`` per ``group_by``.
+
+        ::
+
+            DailyRevenue.objects.revenue(
+                date_from=date(2017, 1, 1), group_by=['identifier'])
+
+        """
+        queryset = self.all()
+        if date_from:
+            queryset = queryset.filter(day__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(day__lte=date_to)
+        if identifier is not None:
+            queryset = queryset.filter(identifier=identifier)
+        if currency is not None:
+            queryset = queryset.filter(currency=currency)
+        if status is not None:
+            queryset = queryset.filter(status=status)
+        return queryset.values(*group_by).annotate(
+            quantity_sum=models.Sum('quantity'),
+            amount_sum=models.Sum('amount'),
+        ).order_by(*group_by)
+
+
+@python_2_unicode_compatible
+class DailyRevenue(models.Model):
+    """
+    The purchased items per day, identifier, currency and status.
+
+    Kept up to date by status transitions if ``PAYPAL_REVENUE_ROLLUP`` is set
+    and rebuilt with the ``paypal_rebuild_revenue`` command.
+
+    :day: The day the transactions were created.
+    :identifier: The identifier of the purchased items.
+    :currency: The currency of the transactions.
+    :status: The status of the transactions.
+    :quantity: The sum of the purchased quantities.
+    :amount: The sum of price times quantity.
+
+    """
+    day = models.DateField(
+        verbose_name=_('Day'),
+    )
+
+    identifier = models.CharField(
+        max_length=256,
+        verbose_name=_('Identifier'),
+        blank=True,
+    )
+
+    currency = models.CharField(
+        max_length=16,
+        verbose_name=_('Currency'),
+        blank=True,
+    )
+
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        verbose_name=_('Payment status'),
+    )
+
+    quantity = models.BigIntegerField(
+        verbose_name=_('Quantity'),
+        default=0,
+    )
+
+    amount = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        verbose_name=_('Amount'),
+        default=0,
+    )
+
+    objects = DailyRevenueManager()
+
+    class Meta:
+        ordering = ['day', 'identifier', 'currency', 'status']
+        unique_together = [
+            ('day', 'identifier', 'currency', 'status'),
+        ]
+
+    def __str__(self):
+        return u'{0} {1} {2} {3}: {4}'.format(
+            self.day, self.identifier, self.currency, self.status,
+            self.amount)
@@ -0,0 +1,230 @@
+"""
+Profiling of the payment views against latency and query budgets.
+
+Requests to the views of this app are profiled by ``ProfilingMiddleware``,
+or by decorating single views with ``profile_view``. The wall time of a
+request is split into the time spent waiting for PayPal, in database queries
+and rendering templates. A warning is logged if a request takes longer than
+``PAYPAL_PROFILING_LATENCY_BUDGET`` seconds or makes more than
+``PAYPAL_PROFILING_QUERY_BUDGET`` queries. Set a budget to ``None`` to turn
+it off.
+
+Only the share ``PAYPAL_PROFILING_SAMPLE_RATE`` of the requests is profiled.
+
+"""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from . import settings
+from .metrics import QueryTimer
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # Django < 1.10
+    MiddlewareMixin = object
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Profile(object):
+    """
+    The measurements of a single request.
+
+    :param request: The profiled request.
+    :param view_name: The dotted path of the view.
+
+    """
+    def __init__(self, request, view_name):
+        self.request = request
+        self.view_name = view_name
+        self.query_timer = QueryTimer()
+        self.paypal_seconds = 0.0
+        self.template_seconds = 0.0
+        self.fields = {}
+        self.start_time = None
+        self.seconds = None
+
+    def start(self):
+        previous = get_current_profile()
+        if previous is not None:
+            # a request that was not stopped, e.g. after an exception in a
+            # middleware
+            previous.stop()
+        _local.profile = self
+        self.start_time = time.time()
+        self.query_timer.start()
+
+    def stop(self):
+        if get_current_profile() is self:
+            _local.profile = None
+        if self.seconds is None:
+            self.query_timer.stop()
+            self.seconds = time.time() - self.start_time
+
+    def time_render(self, response):
+        """Adds the rendering time of a ``TemplateResponse`` to the profile."""
+        render = response.render
+
+        def _render():
+            start = time.time()
+            try:
+                return render()
+            finally:
+                self.template_seconds += time.time() - start
+                # the instance attribute would make the response unpicklable
+                del response.render
+        response.render = _render
+
+    def get_exceeded_budgets(self):
+        """Returns the names of the budgets that are exceeded."""
+        exceeded = []
+        latency_budget = settings.PROFILING_LATENCY_BUDGET
+        if latency_budget is not None and self.seconds > latency_budget:
+            exceeded.append('latency')
+        query_budget = settings.PROFILING_QUERY_BUDGET
+        if (query_budget is not None and
+                self.query_timer.queries > query_budget):
+            exceeded.append('queries')
+        return exceeded
+
+    def as_dict(self):
+        data = {
+            'method': self.request.method,
+            'path': self.request.path,
+            'view': self.view_name,
+            'seconds': self.seconds,
+            'paypal_seconds': self.paypal_seconds,
+            'db_seconds': self.query_timer.seconds,
+            'template_seconds': self.template_seconds,
+            'other_seconds': max(0.0, self.seconds - self.paypal_seconds -
+                                 self.query_timer.seconds -
+                                 self.template_seconds),
+            'queries': self.query_timer.queries,
+            'transaction_id': None,
+        }
+        data.update(self.fields)
+        return data
+
+    def report(self, status_code=None):
+        """Logs a warning if the request exceeded a budget."""
+        exceeded = self.get_exceeded_budgets()
+        if not exceeded:
+            return
+        data = self.as_dict()
+        data['status_code'] = status_code
+        data['exceeded'] = exceeded
+        logger.warning(
+            'Payment request over budget ({0}): {1}'.format(
+                ', '.join(exceeded), ' '.join(
+                    '{0}={1}'.format(key, format_field(value))
+                    for key, value in sorted(data.items())
+                    if key != 'exceeded')),
+            extra={'paypal_profile': data})
+
+
+def format_field(value):
+    if isinstance(value, float):
+        return '{0:.3f}'.format(value)
+    return value
+
+
+def get_current_profile():
+    """Returns the ``Profile`` of the current thread, or ``None``."""
+    return getattr(_local, 'profile', None)
+
+
+def annotate(**fields):
+    """
+    Adds ``fields`` to the report of the current request, if it is profiled.
+
+    The forms and IPN handling of this app add the ``transaction_id``.
+
+    """
+    profile = get_current_profile()
+    if profile is not None:
+        profile.fields.update(fields)
+
+
+def add_paypal_time(seconds):
+    """Adds the duration of a call to PayPal to the current profile."""
+    profile = get_current_profile()
+    if profile is not None:
+        profile.paypal_seconds += seconds
+
+
+def should_profile():
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate >= 1 or random.random() < rate
+
+
+def get_view_name(view_func):
+    return '{0}.{1}'.format(
+        view_func.__module__, getattr(view_func, '__name__', ''))
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Profiles the requests to the views of ``PAYPAL_PROFILING_VIEW_MODULES``.
+
+    Queries made by middlewares before the view are not counted.
+
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func.__module__ not in settings.PROFILING_VIEW_MODULES:
+            return None
+        if not should_profile():
+            return None
+        request.paypal_profile = Profile(request, get_view_name(view_func))
+        request.paypal_profile.start()
+        return None
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'paypal_profile', None)
+        if profile is not None:
+            profile.time_render(response)
+        return response
+
+    def process_exception(self, request, exception):
+        profile = getattr(request, 'paypal_profile', None)
+        if profile is not None:
+            profile.stop()
+        return None
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'paypal_profile', None)
+        if profile is not None:
+            profile.stop()
+            profile.report(response.status_code)
+        return response
+
+
+def profile_view(view_func):
+    """
+    Profiles a view like ``ProfilingMiddleware``.
+
+    Template responses are rendered by the decorator, so that the rendering
+    time is included. Use ``method_decorator`` for class based views.
+
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not should_profile():
+            return view_func(request, *args, **kwargs)
+        profile = Profile(request, get_view_name(view_func))
+        profile.start()
+        try:
+            response = view_func(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                profile.time_render(response)
+                response.render()
+        finally:
+            profile.stop()
+        profile.report(response.status_code)
+        return response
+    return _wrapped_view
@@ -0,0 +1,91 @@
+"""Retry policy for calls to the PayPal API."""
+import httplib
+import logging
+import random
+import socket
+import time
+import urllib2
+
+from . import settings
+from .transport import HTTPStatusError
+
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy(object):
+    """
+    Retries failed PayPal calls with exponential backoff and full jitter.
+
+    Only calls that are safe to repeat are retried: API operations listed in
+    ``PAYPAL_RETRY_METHODS`` and calls carrying a ``MSGSUBID`` idempotency
+    key. ``SetExpressCheckout`` is safe, because it only creates a token at
+    PayPal and the ``PaymentTransaction`` is created from the one response we
+    finally receive.
+
+    :param max_attempts: The maximum number of attempts, including the first
+      one.
+    :param backoff: The base delay in seconds.
+    :param backoff_max: The upper bound of a single delay in seconds.
+    :param budget: The maximum amount of seconds all attempts of one call may
+      take. No further attempt is made if it would exceed the budget.
+
+    """
+    def __init__(self, max_attempts=None, backoff=None, backoff_max=None,
+                 budget=None, methods=None):
+        self.max_attempts = max_attempts or settings.RETRY_MAX_ATTEMPTS
+        self.backoff = settings.RETRY_BACKOFF if backoff is None else backoff
+        self.backoff_max = (
+            settings.RETRY_BACKOFF_MAX if backoff_max is None
+            else backoff_max)
+        self.budget = settings.RETRY_BUDGET if budget is None else budget
+        self.methods = (
+            settings.RETRY_METHODS if methods is None else methods)
+
+    def is_retryable(self, post_data):
+        """Returns ``True`` if the call in ``post_data`` may be repeated."""
+        return (
+            post_data.get('METHOD') in self.methods or
+            bool(post_data.get('MSGSUBID')))
+
+    def is_transient(self, exception):
+        """Returns ``True`` if ``exception`` might go away on a retry."""
+        if isinstance(exception, HTTPStatusError):
+            return exception.status >= 500
+        if isinstance(exception, urllib2.HTTPError):
+            return exception.code >= 500
+        return isinstance(exception, (
+            urllib2.URLError, httplib.HTTPException, socket.error))
+
+    def get_delay(self, attempt):
+        """Returns the seconds to wait after the given failed attempt."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls ``func`` until it succeeds or the policy gives up.
+
+        Pass ``retry=False`` to call ``func`` exactly once. The exception of
+        the last attempt is re-raised.
+
+        """
+        retry = kwargs.pop('retry', True)
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as ex:
+                if (not retry or attempt >= self.max_attempts or
+                        not self.is_transient(ex)):
+                    raise
+                delay = self.get_delay(attempt)
+                if time.time() - start + delay > self.budget:
+                    raise
+                logger.warning(
+                    'PayPal call failed (attempt {0}/{1}), retrying in'
+                    ' {2:.2f}s: {3!r}'.format(
+                        attempt, self.max_attempts, delay, ex))
+                time.sleep(delay)
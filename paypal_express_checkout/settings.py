@@ -17,3 +17,121 @@ API_URL = getattr(
 ALLOW_ANONYMOUS_CHECKOUT = getattr(
     settings, 'PAYPAL_ALLOW_ANONYMOUS_CHECKOUT',
     False)
+
+TRANSPORT = getattr(
+    settings, 'PAYPAL_TRANSPORT',
+    'paypal_express_checkout.transport.PooledTransport')
+
+POOL_MAXSIZE = getattr(settings, 'PAYPAL_POOL_MAXSIZE', 10)
+
+POOL_IDLE_TIMEOUT = getattr(settings, 'PAYPAL_POOL_IDLE_TIMEOUT', 60)
+
+CONNECT_TIMEOUT = getattr(settings, 'PAYPAL_CONNECT_TIMEOUT', 5)
+
+READ_TIMEOUT = getattr(settings, 'PAYPAL_READ_TIMEOUT', 30)
+
+RETRY_MAX_ATTEMPTS = getattr(settings, 'PAYPAL_RETRY_MAX_ATTEMPTS', 3)
+
+RETRY_BACKOFF = getattr(settings, 'PAYPAL_RETRY_BACKOFF', 0.2)
+
+RETRY_BACKOFF_MAX = getattr(settings, 'PAYPAL_RETRY_BACKOFF_MAX', 2)
+
+RETRY_BUDGET = getattr(settings, 'PAYPAL_RETRY_BUDGET', 10)
+
+RETRY_METHODS = getattr(
+    settings, 'PAYPAL_RETRY_METHODS',
+    ['SetExpressCheckout', 'GetExpressCheckoutDetails'])
+
+RETRY_IDEMPOTENCY_KEY = getattr(
+    settings, 'PAYPAL_RETRY_IDEMPOTENCY_KEY', False)
+
+CIRCUIT_BREAKER_ENABLED = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_ENABLED', False)
+
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)
+
+CIRCUIT_BREAKER_WINDOW = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_WINDOW', 60)
+
+CIRCUIT_BREAKER_RESET_TIMEOUT = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_RESET_TIMEOUT', 30)
+
+CIRCUIT_BREAKER_PROBES = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_PROBES', 1)
+
+CIRCUIT_BREAKER_CACHE = getattr(
+    settings, 'PAYPAL_CIRCUIT_BREAKER_CACHE', 'default')
+
+CLIENT_THREADS = getattr(settings, 'PAYPAL_CLIENT_THREADS', POOL_MAXSIZE)
+
+IPN_MODE = getattr(settings, 'PAYPAL_IPN_MODE', 'sync')
+
+IPN_QUEUE_MAX_ATTEMPTS = getattr(settings, 'PAYPAL_IPN_QUEUE_MAX_ATTEMPTS', 10)
+
+IPN_QUEUE_RETRY_DELAY = getattr(settings, 'PAYPAL_IPN_QUEUE_RETRY_DELAY', 60)
+
+IPN_RETENTION_DAYS = getattr(settings, 'PAYPAL_IPN_RETENTION_DAYS', 30)
+
+IPN_VERIFY = getattr(settings, 'PAYPAL_IPN_VERIFY', False)
+
+IPN_VERIFY_URL = getattr(
+    settings, 'PAYPAL_IPN_VERIFY_URL',
+    'https://ipnpb.paypal.com/cgi-bin/webscr')
+
+IPN_VERIFY_TIMEOUT = getattr(settings, 'PAYPAL_IPN_VERIFY_TIMEOUT', 10)
+
+IPN_VERIFY_CACHE = getattr(settings, 'PAYPAL_IPN_VERIFY_CACHE', 'default')
+
+IPN_VERIFY_CACHE_TIMEOUT = getattr(
+    settings, 'PAYPAL_IPN_VERIFY_CACHE_TIMEOUT', 3600)
+
+SIGNAL_EXECUTOR = getattr(settings, 'PAYPAL_SIGNAL_EXECUTOR', 'thread')
+
+SIGNAL_EXECUTORS = getattr(settings, 'PAYPAL_SIGNAL_EXECUTORS', {})
+
+SIGNAL_THREADS = getattr(settings, 'PAYPAL_SIGNAL_THREADS', 4)
+
+SIGNAL_PROCESSES = getattr(settings, 'PAYPAL_SIGNAL_PROCESSES', 2)
+
+SIGNAL_MAX_PENDING = getattr(settings, 'PAYPAL_SIGNAL_MAX_PENDING', 100)
+
+ADMIN_LARGE_TABLES = getattr(settings, 'PAYPAL_ADMIN_LARGE_TABLES', False)
+
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = getattr(
+    settings, 'PAYPAL_ADMIN_APPROXIMATE_COUNT_THRESHOLD', 10000)
+
+REVENUE_ROLLUP = getattr(settings, 'PAYPAL_REVENUE_ROLLUP', False)
+
+METRICS_BACKEND = getattr(
+    settings, 'PAYPAL_METRICS_BACKEND',
+    'paypal_express_checkout.metrics.LocalMetricsBackend')
+
+METRICS_BUCKETS = getattr(
+    settings, 'PAYPAL_METRICS_BUCKETS',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+METRICS_DB_TIME = getattr(settings, 'PAYPAL_METRICS_DB_TIME', True)
+
+METRICS_TOKEN = getattr(settings, 'PAYPAL_METRICS_TOKEN', None)
+
+TRACING_EXPORTER = getattr(settings, 'PAYPAL_TRACING_EXPORTER', None)
+
+PROFILING_SAMPLE_RATE = getattr(settings, 'PAYPAL_PROFILING_SAMPLE_RATE', 1.0)
+
+PROFILING_LATENCY_BUDGET = getattr(
+    settings, 'PAYPAL_PROFILING_LATENCY_BUDGET', 1.0)
+
+PROFILING_QUERY_BUDGET = getattr(settings, 'PAYPAL_PROFILING_QUERY_BUDGET', 20)
+
+PROFILING_VIEW_MODULES = getattr(
+    settings, 'PAYPAL_PROFILING_VIEW_MODULES',
+    ['paypal_express_checkout.views'])
+
+ERROR_LOGGING = getattr(settings, 'PAYPAL_ERROR_LOGGING', 'buckets')
+
+ERROR_SAMPLES = getattr(settings, 'PAYPAL_ERROR_SAMPLES', 5)
+
+ERROR_RETENTION_DAYS = getattr(settings, 'PAYPAL_ERROR_RETENTION_DAYS', 90)
+
+PAYLOAD_MAX_LENGTH = getattr(settings, 'PAYPAL_PAYLOAD_MAX_LENGTH', 10000)
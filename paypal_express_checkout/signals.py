@@ -5,3 +5,7 @@ from django.dispatch import Signal
 # A signal that arrives, when an IPN is received with status 'Completed'
 payment_completed = Signal(providing_args=['transaction'])
 payment_status_updated = Signal(providing_args=['transaction'])
+
+# Sent once per batch by ``PaymentTransaction.objects.bulk_transition``
+# instead of ``payment_status_updated`` for every transaction
+payment_statuses_updated = Signal(providing_args=['transactions'])
@@ -0,0 +1,143 @@
+"""Tests for the admins of the ``paypal_express_checkout`` app."""
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_libs.tests.factories import UserFactory
+from mock import patch
+
+from .factories import (
+    ItemFactory,
+    PaymentTransactionFactory,
+    PurchasedItemFactory,
+)
+from ..admin import PaymentTransactionAdmin
+from ..models import PaymentTransaction, PaymentTransactionError
+
+
+class ChangeListQueriesTestCase(TestCase):
+    """Tests for the number of queries of the admin changelists."""
+    longMessage = True
+
+    def setUp(self):
+        self.admin = UserFactory(is_staff=True, is_superuser=True)
+        self.admin.set_password('test123')
+        self.admin.save()
+        self.client.login(username=self.admin.username, password='test123')
+
+    def create_objects(self, count):
+        item = ItemFactory()
+        for i in range(count):
+            transaction = PaymentTransactionFactory()
+            PurchasedItemFactory(
+                transaction=transaction, user=transaction.user, item=item,
+                price=None, quantity=2)
+            PaymentTransactionError.objects.create(
+                user=transaction.user, transaction=transaction,
+                response='Error')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def test_changelists(self):
+        urls = [
+            reverse('admin:paypal_express_checkout_purchaseditem_changelist'),
+            reverse(
+                'admin:paypal_express_checkout_paymenttransaction_changelist'),
+            reverse('admin:paypal_express_checkout_'
+                    'paymenttransactionerror_changelist'),
+        ]
+        self.create_objects(2)
+        small = [self.count_queries(url) for url in urls]
+        self.create_objects(20)
+        large = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, large, msg=(
+            'Should not need more queries for more rows.'))
+
+    def test_subtotal(self):
+        self.create_objects(1)
+        url = reverse(
+            'admin:paypal_express_checkout_purchaseditem_changelist')
+        resp = self.client.get(url, {'o': '-9'})
+        self.assertEqual(resp.status_code, 200)
+        subtotal = resp.context['cl'].result_list[0]._subtotal
+        self.assertEqual(subtotal, 20, msg=(
+            'Should fall back to the value of the item.'))
+
+
+@patch('paypal_express_checkout.changelist.settings.ADMIN_LARGE_TABLES', True)
+class LargeTableAdminTestCase(TestCase):
+    """Tests for the admins with ``PAYPAL_ADMIN_LARGE_TABLES``."""
+    longMessage = True
+
+    def setUp(self):
+        self.admin = UserFactory(is_staff=True, is_superuser=True)
+        self.admin.set_password('test123')
+        self.admin.save()
+        self.client.login(username=self.admin.username, password='test123')
+        self.transactions = [PaymentTransactionFactory() for i in range(5)]
+        # several transactions share the same creation date
+        PaymentTransaction.objects.filter(pk__in=[
+            obj.pk for obj in self.transactions[1:4]]).update(
+                creation_date=self.transactions[0].creation_date)
+        self.url = reverse(
+            'admin:paypal_express_checkout_paymenttransaction_changelist')
+
+    @patch.object(PaymentTransactionAdmin, 'list_per_page', 2)
+    def test_keyset_pagination(self):
+        seen = []
+        url = self.url
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            cl = resp.context['cl']
+            self.assertTrue(cl.keyset)
+            self.assertEqual(cl.result_count, 5)
+            seen.extend(obj.pk for obj in cl.result_list)
+            url = cl.next_cursor and self.url + cl.next_page_url()
+        expected = list(PaymentTransaction.objects.order_by(
+            '-creation_date', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected, msg=(
+            'Should show every transaction once and in order.'))
+
+    @patch.object(PaymentTransactionAdmin, 'list_per_page', 2)
+    def test_keyset_pagination_null_dates(self):
+        PaymentTransaction.objects.filter(pk__in=[
+            obj.pk for obj in self.transactions[2:5]]).update(
+                creation_date=None)
+        seen = []
+        url = self.url
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            cl = resp.context['cl']
+            seen.extend(obj.pk for obj in cl.result_list)
+            url = cl.next_cursor and self.url + cl.next_page_url()
+        expected = [obj.pk for obj in self.transactions[1::-1]] + [
+            obj.pk for obj in self.transactions[4:1:-1]]
+        self.assertEqual(seen, expected, msg=(
+            'Should list the transactions without a date last.'))
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(self.url, {'cursor': 'foo'})
+        self.assertEqual(resp.status_code, 302)
+
+    def test_date_filter(self):
+        resp = self.client.get(self.url)
+        self.assertIsNone(resp.context['cl'].date_hierarchy, msg=(
+            'Should not use the date hierarchy.'))
+        self.assertEqual(
+            resp.context['cl'].filter_specs[0].field_path, 'creation_date')
+
+    @patch('paypal_express_checkout.changelist.get_table_estimate')
+    def test_approximate_count(self, estimate_mock):
+        estimate_mock.return_value = 1000000
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.context['cl'].result_count, 1000000)
+        resp = self.client.get(self.url, {'status__exact': 'Pending'})
+        self.assertEqual(resp.context['cl'].result_count, 5, msg=(
+            'Should count filtered lists exactly.'))
@@ -0,0 +1,86 @@
+"""Tests for the benchmark of the ``paypal_express_checkout`` app."""
+import json
+import os
+import tempfile
+from StringIO import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from mock import patch
+
+from ..benchmark import CheckoutBenchmark, percentile
+from ..models import Item, PaymentTransaction
+
+
+class PercentileTestCase(TestCase):
+    """Tests for the ``percentile`` function."""
+    longMessage = True
+
+    def test_function(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+
+class CheckoutBenchmarkTestCase(TestCase):
+    """Tests for the ``CheckoutBenchmark`` class."""
+    longMessage = True
+
+    def setUp(self):
+        cache.clear()
+
+    def test_run(self):
+        report = CheckoutBenchmark(customers=2).run()
+        self.assertEqual(report['customers'], 2)
+        for step in ['checkout', 'confirm', 'ipn']:
+            self.assertEqual(report['steps'][step]['count'], 2, msg=(
+                'Should measure every step of every customer.'))
+            self.assertEqual(report['steps'][step]['errors'], 0, msg=(
+                'Should complete step {0} without errors.'.format(step)))
+            self.assertTrue(report['steps'][step]['queries_max'] > 0)
+        self.assertEqual(
+            PaymentTransaction.objects.filter(status='Completed').count(), 2,
+            msg='Should run the full lifecycle.')
+
+    def test_setup(self):
+        CheckoutBenchmark(customers=2).setup()
+        benchmark = CheckoutBenchmark(customers=3)
+        benchmark.setup()
+        self.assertEqual(len(benchmark.users), 3)
+        self.assertEqual(Item.objects.count(), 1, msg=(
+            'Should reuse the item and users of an earlier run.'))
+
+
+@patch('paypal_express_checkout.management.commands.paypal_benchmark'
+       '.teardown_test_environment')
+@patch('paypal_express_checkout.management.commands.paypal_benchmark'
+       '.setup_test_environment')
+class PaypalBenchmarkCommandTestCase(TestCase):
+    """Tests for the ``paypal_benchmark`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        cache.clear()
+
+    @patch.object(connection.creation, 'destroy_test_db')
+    @patch.object(connection.creation, 'create_test_db')
+    def test_command(self, create_mock, destroy_mock, *args):
+        out = StringIO()
+        call_command('paypal_benchmark', customers=2, keepdb=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['steps']['ipn']['count'], 2)
+        self.assertTrue(create_mock.call_args[1]['keepdb'])
+        self.assertTrue(destroy_mock.call_args[1]['keepdb'], msg=(
+            'Should keep the test database if asked to.'))
+
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('paypal_benchmark', customers=2, output=path)
+        with open(path) as output_file:
+            self.assertEqual(json.load(output_file)['customers'], 2)
@@ -0,0 +1,130 @@
+"""Tests for the circuit breaker of the ``paypal_express_checkout`` app."""
+import json
+import socket
+from StringIO import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from django_libs.tests.factories import UserFactory
+from mock import Mock, patch
+
+from ..circuit_breaker import CircuitBreaker
+from ..forms import SetExpressCheckoutItemForm
+from ..models import PaymentTransactionError
+from ..transport import HTTPStatusError
+from .factories import ItemFactory
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Tests for the ``CircuitBreaker`` class."""
+    longMessage = True
+
+    def setUp(self):
+        cache.clear()
+        self.circuit_breaker = CircuitBreaker(
+            enabled=True, failure_threshold=2, window=60, reset_timeout=30,
+            probes=1)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_circuit(self):
+        self.assertTrue(self.circuit_breaker.allow_request())
+        self.circuit_breaker.record_failure()
+        self.assertEqual(self.circuit_breaker.get_state(), 'closed', msg=(
+            'Should stay closed below the failure threshold.'))
+        self.circuit_breaker.record_failure()
+        self.assertEqual(self.circuit_breaker.get_state(), 'open', msg=(
+            'Should open once the failure threshold is reached.'))
+        self.assertFalse(self.circuit_breaker.allow_request())
+
+        opened_at = cache.get(self.circuit_breaker.get_key('opened_at'))
+        with patch('paypal_express_checkout.circuit_breaker.time.time',
+                   return_value=opened_at + 31):
+            self.assertEqual(self.circuit_breaker.get_state(), 'half-open')
+            self.assertTrue(self.circuit_breaker.allow_request(), msg=(
+                'Should let a probe request through when half-open.'))
+            self.assertFalse(self.circuit_breaker.allow_request(), msg=(
+                'Should only let the configured number of probes through.'))
+            self.circuit_breaker.record_failure()
+        self.assertEqual(self.circuit_breaker.get_state(), 'open', msg=(
+            'Should open again if a probe fails.'))
+
+        opened_at = cache.get(self.circuit_breaker.get_key('opened_at'))
+        with patch('paypal_express_checkout.circuit_breaker.time.time',
+                   return_value=opened_at + 31):
+            self.assertTrue(self.circuit_breaker.allow_request())
+            self.circuit_breaker.record_success()
+        self.assertEqual(self.circuit_breaker.get_state(), 'closed', msg=(
+            'Should close if a probe succeeds.'))
+
+    def test_is_failure(self):
+        self.assertTrue(self.circuit_breaker.is_failure(
+            HTTPStatusError(503, 'Service Unavailable')))
+        self.assertTrue(self.circuit_breaker.is_failure(socket.timeout()))
+        self.assertFalse(self.circuit_breaker.is_failure(
+            HTTPStatusError(400, 'Bad Request')), msg=(
+                'Should not count errors caused by the request.'))
+
+    def test_disabled(self):
+        circuit_breaker = CircuitBreaker(enabled=False, failure_threshold=1)
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.allow_request(), msg=(
+            'Should allow every request if disabled.'))
+        circuit_breaker.record_success()
+        self.assertEqual(circuit_breaker.get_status()['state'], 'closed')
+
+    def test_command(self):
+        self.circuit_breaker.failure_threshold = 1
+        self.circuit_breaker.record_failure()
+        out = StringIO()
+        call_command('paypal_circuit_breaker', '--reset', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['state'], 'closed', msg=(
+            'Should reset the circuit and print its state.'))
+
+
+class CircuitBreakerFormTestCase(TestCase):
+    """Tests for the circuit breaker integration of the forms."""
+    longMessage = True
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.item = ItemFactory()
+        self.data = {'item': self.item.pk, 'quantity': 1}
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('paypal_express_checkout.client.get_transport')
+    def test_fast_fail(self, get_transport_mock):
+        CircuitBreaker(enabled=True, failure_threshold=1).record_failure()
+        form = SetExpressCheckoutItemForm(user=self.user, data=self.data)
+        self.assertTrue(form.is_valid())
+        with patch.object(form, 'get_circuit_breaker',
+                          return_value=CircuitBreaker(enabled=True)):
+            resp = form.set_checkout()
+        self.assertEqual(resp['Location'], reverse('paypal_error'), msg=(
+            'Should redirect to the error view if the circuit is open.'))
+        post_mock = get_transport_mock.return_value.post
+        self.assertEqual(post_mock.call_count, 0, msg=(
+            'Should not call PayPal if the circuit is open.'))
+        self.assertEqual(PaymentTransactionError.objects.count(), 0, msg=(
+            'Should not log an error if the circuit is open.'))
+
+    @patch('paypal_express_checkout.client.get_transport')
+    def test_records_outcome(self, get_transport_mock):
+        get_transport_mock.return_value = Mock(
+            post=Mock(return_value='ACK=Success&TOKEN=abc'))
+        circuit_breaker = Mock()
+        circuit_breaker.allow_request.return_value = True
+        form = SetExpressCheckoutItemForm(user=self.user, data=self.data)
+        self.assertTrue(form.is_valid())
+        with patch.object(form, 'get_circuit_breaker',
+                          return_value=circuit_breaker):
+            form.set_checkout()
+        self.assertEqual(circuit_breaker.record_success.call_count, 1, msg=(
+            'Should record a successful call.'))
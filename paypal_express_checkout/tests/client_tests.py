@@ -0,0 +1,82 @@
+"""Tests for the PayPal client of the ``paypal_express_checkout`` app."""
+import socket
+import urllib2
+
+from django.test import TestCase
+
+from mock import Mock
+
+from ..client import (
+    CircuitOpenError,
+    PayPalClient,
+    get_error_code,
+    get_thread_pool,
+)
+from ..retry import RetryPolicy
+from ..settings import API_URL
+from ..transport import HTTPStatusError
+
+
+class PayPalClientTestCase(TestCase):
+    """Tests for the ``PayPalClient`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.transport = Mock()
+        self.transport.post.return_value = 'ACK=Success&TOKEN=abc123'
+        self.circuit_breaker = Mock()
+        self.circuit_breaker.allow_request.return_value = True
+        self.client = PayPalClient(
+            transport=self.transport, retry_policy=RetryPolicy(methods=[]),
+            circuit_breaker=self.circuit_breaker)
+
+    def test_call(self):
+        response = self.client.call(API_URL, {'METHOD': 'SetExpressCheckout'})
+        self.assertEqual(response, {'ACK': ['Success'], 'TOKEN': ['abc123']},
+                         msg='Should return the parsed response.')
+        self.transport.post.assert_called_once_with(
+            API_URL, 'METHOD=SetExpressCheckout')
+
+        self.transport.post.side_effect = socket.error
+        self.assertRaises(socket.error, self.client.call, API_URL, {})
+        self.assertEqual(self.circuit_breaker.record_failure.call_count, 1,
+                         msg='Should record the failure.')
+
+        self.circuit_breaker.allow_request.return_value = False
+        self.assertRaises(CircuitOpenError, self.client.call, API_URL, {})
+
+    def test_call_async(self):
+        callback = Mock()
+        result = self.client.call_async(API_URL, {}, callback=callback)
+        self.assertEqual(result.get(timeout=5)['ACK'], ['Success'], msg=(
+            'Should return the parsed response asynchronously.'))
+        callback.assert_called_once_with(result.get())
+
+        results = self.client.call_many([(API_URL, {}), (API_URL, {})])
+        self.assertEqual(
+            [async_result.get(timeout=5)['TOKEN'] for async_result in results],
+            [['abc123'], ['abc123']], msg='Should make all calls.')
+
+        self.transport.post.side_effect = socket.error
+        result = self.client.call_async(API_URL, {})
+        self.assertRaises(socket.error, result.get, 5)
+        self.assertIs(get_thread_pool(), get_thread_pool())
+
+
+class GetErrorCodeTestCase(TestCase):
+    """Tests for the ``get_error_code`` function."""
+    longMessage = True
+
+    def test_function(self):
+        self.assertEqual(get_error_code(
+            {'ACK': ['Failure'], 'L_ERRORCODE0': ['10001']}), '10001')
+        self.assertEqual(get_error_code({'ACK': ['Failure']}), 'unknown')
+        self.assertEqual(
+            get_error_code(HTTPStatusError(503, 'Unavailable')), 'HTTP 503')
+        self.assertEqual(get_error_code(urllib2.HTTPError(
+            API_URL, 500, 'Error', {}, None)), 'HTTP 500')
+        self.assertEqual(
+            get_error_code(urllib2.URLError(socket.timeout())), 'timeout',
+            msg='Should use the reason of URL errors.')
+        self.assertEqual(get_error_code(socket.error()), 'error')
+        self.assertEqual(get_error_code('foo'), 'unknown')
@@ -0,0 +1,146 @@
+"""Tests for the ``dispatch`` module of the ``paypal_express_checkout`` app."""
+import os
+import shutil
+import tempfile
+import threading
+
+from django.db import DatabaseError
+from django.db.transaction import atomic
+from django.dispatch import Signal
+from django.test import TestCase, TransactionTestCase
+
+from mock import Mock, patch
+
+from .. import dispatch
+
+
+test_signal = Signal(providing_args=['value'])
+received = []
+called = threading.Event()
+
+
+def receiver(sender, value, **kwargs):
+    received.append((sender, value, threading.current_thread()))
+    called.set()
+
+
+def failing_receiver(sender, **kwargs):
+    raise ValueError('Oops')
+
+
+def file_receiver(sender, path, **kwargs):
+    with open(path, 'w') as f:
+        f.write('{0} {1}'.format(sender.__name__, os.getpid()))
+
+
+class Sender(object):
+    pass
+
+
+class ConnectAsyncTestCase(TransactionTestCase):
+    """Tests for the ``connect_async`` function."""
+    longMessage = True
+
+    def setUp(self):
+        del received[:]
+        called.clear()
+
+    def tearDown(self):
+        test_signal.disconnect(dispatch_uid=dispatch.get_receiver_path(
+            receiver))
+
+    def test_thread(self):
+        dispatch.connect_async(test_signal, receiver, executor='thread')
+        with atomic():
+            test_signal.send(sender=Sender, value=1)
+            self.assertEqual(received, [], msg=(
+                'Should not call the receiver before the commit.'))
+        self.assertTrue(called.wait(5))
+        self.assertEqual(received[0][:2], (Sender, 1))
+        self.assertNotEqual(received[0][2], threading.current_thread(), msg=(
+            'Should call the receiver on another thread.'))
+
+    @patch('paypal_express_checkout.dispatch.settings.SIGNAL_EXECUTORS', {
+        'paypal_express_checkout.tests.dispatch_tests.receiver': 'sync'})
+    def test_per_receiver_setting(self):
+        dispatch.connect_async(test_signal, receiver, executor='thread')
+        test_signal.send(sender=Sender, value=2)
+        self.assertEqual(received[0][2], threading.current_thread(), msg=(
+            'Should use the executor from PAYPAL_SIGNAL_EXECUTORS.'))
+
+    def test_process(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'out')
+            executor = dispatch.get_executor('process')
+            executor.submit(file_receiver, Sender(), {'path': path})
+            executor.pool.close()
+            executor.pool.join()
+            with open(path) as f:
+                name, pid = f.read().split()
+        finally:
+            shutil.rmtree(directory)
+            dispatch._executors.pop('process', None)
+        self.assertEqual(name, 'Sender', msg=(
+            'Should pass the class of the sender.'))
+        self.assertNotEqual(int(pid), os.getpid())
+
+
+class PoolExecutorTestCase(TestCase):
+    """Tests for the ``PoolExecutor`` class."""
+    longMessage = True
+
+    def setUp(self):
+        del received[:]
+
+    def test_backpressure(self):
+        executor = dispatch.PoolExecutor(Mock(), max_pending=1)
+        executor.submit(receiver, Sender, {'value': 1})
+        self.assertEqual(executor.pool.apply_async.call_count, 1)
+        executor.submit(receiver, Sender, {'value': 2})
+        self.assertEqual(executor.pool.apply_async.call_count, 1, msg=(
+            'Should not submit more than max_pending calls.'))
+        self.assertEqual(received[0][:2], (Sender, 2), msg=(
+            'Should call the receiver inline if the pool is busy.'))
+        executor.release(True)
+        executor.submit(receiver, Sender, {'value': 3})
+        self.assertEqual(executor.pool.apply_async.call_count, 2)
+
+    def test_error_capture(self):
+        self.assertFalse(dispatch.call_receiver(failing_receiver, Sender, {}))
+        executor = dispatch.ProcessPoolExecutor(Mock(), max_pending=1)
+        executor.submit(receiver, Sender, {'value': threading.Lock()})
+        self.assertEqual(executor.pool.apply_async.call_count, 0, msg=(
+            'Should not submit calls that cannot be pickled.'))
+        self.assertTrue(executor.slots.acquire(False), msg=(
+            'Should free the slot again.'))
+
+    def test_releases_slot(self):
+        pool = Mock()
+        pool.apply_async.side_effect = lambda func: func()
+        executor = dispatch.PoolExecutor(pool, max_pending=1)
+        with patch('paypal_express_checkout.dispatch.run_receiver',
+                   side_effect=SystemExit):
+            self.assertRaises(
+                SystemExit, executor.submit, receiver, Sender, {'value': 1})
+        self.assertTrue(executor.slots.acquire(False), msg=(
+            'Should free the slot even if the call fails.'))
+
+    @patch('paypal_express_checkout.dispatch.close_old_connections')
+    def test_process_pool_releases_slot(self, close_old_connections_mock):
+        close_old_connections_mock.side_effect = DatabaseError
+        pool = Mock()
+        pool.apply_async.side_effect = (
+            lambda func, args, callback: callback(func(*args)))
+        executor = dispatch.ProcessPoolExecutor(pool, max_pending=1)
+        executor.submit(receiver, Sender, {'value': 1})
+        self.assertTrue(executor.slots.acquire(False), msg=(
+            'Should free the slot even if the worker fails.'))
+        self.assertFalse(dispatch.run_pickled_receiver('garbage'), msg=(
+            'Should not raise if the arguments cannot be unpickled.'))
+
+    @patch('paypal_express_checkout.dispatch.close_old_connections')
+    def test_run_receiver(self, close_old_connections_mock):
+        self.assertTrue(dispatch.run_receiver(receiver, Sender, {'value': 1}))
+        self.assertEqual(close_old_connections_mock.call_count, 2, msg=(
+            'Should close old connections before and after the receiver.'))
@@ -0,0 +1,92 @@
+"""Tests for the exports of the ``paypal_express_checkout`` app."""
+import json
+from datetime import date
+from StringIO import StringIO
+
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_libs.tests.factories import UserFactory
+
+from .. import export
+from ..models import PaymentTransaction, PaymentTransactionError, PurchasedItem
+from .factories import PaymentTransactionFactory, PurchasedItemFactory
+
+
+class ExportTestCase(TestCase):
+    """Tests for the ``export`` module."""
+    longMessage = True
+
+    def setUp(self):
+        self.transactions = [PaymentTransactionFactory() for i in range(5)]
+        PaymentTransactionFactory(status='Completed')
+        PurchasedItemFactory(
+            transaction=self.transactions[0], identifier='shirt')
+
+    def test_iterate_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export.iterate_rows(
+                PaymentTransaction.objects.all(), ['transaction_id'],
+                chunk_size=2))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(queries), 4, msg=(
+            'Should read the rows in chunks.'))
+
+    def test_filter_queryset(self):
+        qs = PaymentTransaction.objects.all()
+        self.assertEqual(export.filter_queryset(
+            qs, status='Completed').count(), 1)
+        self.assertEqual(
+            export.filter_queryset(qs, identifier='shirt').get(),
+            self.transactions[0])
+        self.assertEqual(export.filter_queryset(
+            PurchasedItem.objects.all(), identifier='shirt').count(), 1)
+        self.assertEqual(export.filter_queryset(
+            qs, date_from='2000-01-01', date_to='2000-12-31').count(), 0)
+        today = date.today()
+        self.assertEqual(export.filter_queryset(
+            qs, date_from=today, date_to=today).count(), 6, msg=(
+                'Should include the whole last day.'))
+
+    def test_filter_queryset_invalid_date(self):
+        qs = PaymentTransaction.objects.all()
+        for value in ['2017/01/01', '01-31-2017', '2017-02-30']:
+            self.assertRaises(
+                ValueError, export.filter_queryset, qs, date_from=value)
+            self.assertRaises(
+                ValueError, export.filter_queryset, qs, date_to=value)
+        self.assertRaises(
+            CommandError, call_command, 'paypal_export', 'transactions',
+            date_from='2017/01/01', stdout=StringIO())
+
+    def test_csv(self):
+        lines = list(export.export_lines(PaymentTransaction.objects.all()))
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[0].startswith('id,transaction_id,'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            'paypal_export', 'transactions', export_format='jsonl',
+            status='Completed', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['status'] for row in rows], ['Completed'])
+
+    def test_admin_action(self):
+        admin = UserFactory(is_staff=True, is_superuser=True)
+        PaymentTransactionError.objects.create(
+            user=admin, request_data='PWD=secret', response='Error')
+        admin.set_password('test123')
+        admin.save()
+        self.client.login(username=admin.username, password='test123')
+        resp = self.client.post(reverse(
+            'admin:paypal_express_checkout_paymenttransactionerror_changelist'
+        ), {'action': 'export_csv', '_selected_action': [
+            PaymentTransactionError.objects.get().pk]})
+        content = ''.join(resp.streaming_content)
+        self.assertIn('Error', content)
+        self.assertNotIn('secret', content, msg=(
+            'Should not export the request data.'))
@@ -23,6 +23,8 @@ class PaymentTransactionFactory(factory.DjangoModelFactory):
     user = factory.SubFactory(UserFactory)
     transaction_id = factory.Sequence(lambda x: '123abc{0}'.format(x))
     value = Decimal('10.00')
+    currency = 'USD'
+    status = 'Pending'
 
 
 class PurchasedItemFactory(factory.DjangoModelFactory):
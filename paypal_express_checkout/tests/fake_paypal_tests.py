@@ -0,0 +1,142 @@
+"""Tests for the fake PayPal server of the ``paypal_express_checkout`` app."""
+import threading
+import time
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from mock import patch
+
+from ..circuit_breaker import CircuitBreaker
+from ..client import PayPalClient
+from ..fake_paypal import FakePayPalServer
+from ..retry import RetryPolicy
+from ..transport import HTTPStatusError, PooledTransport
+
+
+class FakePayPalServerTestCase(TestCase):
+    """Tests for the ``FakePayPalServer`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.server = FakePayPalServer(send_ipn=False).start()
+        self.client = PayPalClient(
+            transport=PooledTransport(),
+            retry_policy=RetryPolicy(methods=[]),
+            circuit_breaker=CircuitBreaker(enabled=False))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def call(self, **data):
+        return self.client.call(self.server.url, data)
+
+    @patch.object(FakePayPalServer, 'post_ipn')
+    def test_checkout(self, post_ipn_mock):
+        response = self.call(
+            METHOD='SetExpressCheckout', PAYMENTREQUEST_0_AMT='10.00')
+        self.assertEqual(response['ACK'], ['Success'])
+        token = response['TOKEN'][0]
+
+        response = self.call(METHOD='GetExpressCheckoutDetails', TOKEN=token)
+        self.assertEqual(response['PAYMENTREQUEST_0_AMT'], ['10.00'])
+
+        self.server.send_ipn = True
+        response = self.call(
+            METHOD='DoExpressCheckoutPayment', TOKEN=token,
+            PAYMENTREQUEST_0_NOTIFYURL='http://localhost/ipn/')
+        self.assertEqual(response['ACK'], ['Success'])
+        transaction_id = response['PAYMENTINFO_0_TRANSACTIONID'][0]
+        for i in range(100):
+            if post_ipn_mock.called:
+                break
+            time.sleep(0.01)
+        notify_url, ipn = post_ipn_mock.call_args[0]
+        self.assertEqual(notify_url, 'http://localhost/ipn/')
+        self.assertEqual(ipn['txn_id'], transaction_id, msg=(
+            'Should post an IPN for the payment.'))
+        self.assertEqual(ipn['payment_status'], 'Completed')
+
+        response = self.call(METHOD='DoExpressCheckoutPayment', TOKEN='foo')
+        self.assertEqual(response['L_ERRORCODE0'], ['10410'], msg=(
+            'Should reject unknown tokens.'))
+        response = self.call(METHOD='Foo')
+        self.assertEqual(response['ACK'], ['Failure'])
+
+    @patch('paypal_express_checkout.fake_paypal.urllib2.urlopen')
+    def test_post_ipn(self, urlopen_mock):
+        self.server.post_ipn('http://localhost/ipn/', {'txn_id': 'abc'})
+        urlopen_mock.assert_called_once_with(
+            'http://localhost/ipn/', data='txn_id=abc', timeout=10)
+
+        urlopen_mock.side_effect = IOError
+        self.server.post_ipn('http://localhost/ipn/', {'txn_id': 'abc'})
+        self.assertEqual(self.server.calls['ipn_error'], 1, msg=(
+            'Should count IPNs that could not be delivered.'))
+
+    def test_notify_validate(self):
+        body = self.client.transport.post(
+            self.server.url, 'cmd=_notify-validate&txn_id=abc')
+        self.assertEqual(body, 'VERIFIED')
+
+    def test_injected_errors(self):
+        self.server.failure_rate = 1
+        response = self.call(METHOD='SetExpressCheckout')
+        self.assertEqual(response['ACK'], ['Failure'], msg=(
+            'Should inject ACK=Failure responses.'))
+
+        self.server.error_rate = 1
+        self.assertRaises(
+            HTTPStatusError, self.call, METHOD='SetExpressCheckout')
+        self.assertEqual(self.server.calls['http_error'], 1)
+
+
+class PaypalFakeServerCommandTestCase(TestCase):
+    """Tests for the ``paypal_fake_server`` management command."""
+    longMessage = True
+
+    def setUp(self):
+        self.servers = []
+        self.started = threading.Event()
+
+    def create_server(self, *args, **kwargs):
+        server = FakePayPalServer(*args, **kwargs)
+        self.servers.append(server)
+        self.started.set()
+        return server
+
+    def test_command(self):
+        out = StringIO()
+        with patch('paypal_express_checkout.management.commands'
+                   '.paypal_fake_server.FakePayPalServer',
+                   side_effect=self.create_server):
+            thread = threading.Thread(target=call_command, args=[
+                'paypal_fake_server'], kwargs={
+                    'port': 0, 'send_ipn': False, 'stdout': out})
+            thread.start()
+            self.assertTrue(self.started.wait(5))
+            server = self.servers[0]
+            try:
+                response = PayPalClient(
+                    transport=PooledTransport(),
+                    retry_policy=RetryPolicy(methods=[]),
+                    circuit_breaker=CircuitBreaker(enabled=False),
+                ).call(server.url, {
+                    'METHOD': 'SetExpressCheckout',
+                    'PAYMENTREQUEST_0_AMT': '10.00'})
+            finally:
+                server.shutdown()
+                thread.join(5)
+        self.assertEqual(response['ACK'], ['Success'])
+        self.assertIn(server.url, out.getvalue(), msg=(
+            'Should print the URL to use as PAYPAL_API_URL.'))
+        self.assertFalse(thread.is_alive())
+
+    @patch.object(FakePayPalServer, 'server_close')
+    @patch.object(FakePayPalServer, 'serve_forever')
+    def test_keyboard_interrupt(self, serve_forever_mock, server_close_mock):
+        serve_forever_mock.side_effect = KeyboardInterrupt
+        call_command('paypal_fake_server', port=0, stdout=StringIO())
+        self.assertEqual(server_close_mock.call_count, 1, msg=(
+            'Should close the socket when stopped with Ctrl+C.'))
@@ -0,0 +1,60 @@
+"""Tests for the model fields of the ``paypal_express_checkout`` app."""
+from django.db import connection
+from django.test import TestCase
+
+from django_libs.tests.factories import UserFactory
+from mock import patch
+
+from ..fields import COMPRESSED_PREFIX, compress_text, decompress_text
+from ..models import PaymentTransactionError
+
+
+class CompressTextTestCase(TestCase):
+    """Tests for the ``compress_text`` and ``decompress_text`` functions."""
+    longMessage = True
+
+    def test_functions(self):
+        value = u'METHOD=SetExpressCheckout&L_PAYMENTREQUEST_0_NAME0=\xe4' * 20
+        compressed = compress_text(value)
+        self.assertTrue(compressed.startswith(COMPRESSED_PREFIX))
+        self.assertLess(len(compressed), len(value))
+        self.assertEqual(decompress_text(compressed), value)
+
+        self.assertEqual(compress_text(u'ACK'), u'ACK', msg=(
+            'Should not compress values that would not get smaller.'))
+        self.assertEqual(decompress_text(u'ACK'), u'ACK')
+        self.assertEqual(decompress_text(compress_text(COMPRESSED_PREFIX)),
+                         COMPRESSED_PREFIX)
+        self.assertIsNone(compress_text(None))
+
+        self.assertEqual(
+            decompress_text(compress_text(value, max_length=10)),
+            value[:10] + u'[truncated]', msg='Should cap the length.')
+
+
+class CompressedTextFieldTestCase(TestCase):
+    """Tests for the ``CompressedTextField`` field."""
+    longMessage = True
+
+    @patch('paypal_express_checkout.fields.settings.PAYLOAD_MAX_LENGTH', 500)
+    def test_field(self):
+        request_data = 'METHOD=DoExpressCheckoutPayment&TOKEN=abc123' * 20
+        error = PaymentTransactionError.objects.create(
+            user=UserFactory(), request_data=request_data,
+            response={'ACK': ['Failure']})
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT request_data, response FROM {0} WHERE id = %s'.format(
+                    PaymentTransactionError._meta.db_table), [error.pk])
+            stored_request_data, stored_response = cursor.fetchone()
+        self.assertTrue(stored_request_data.startswith(COMPRESSED_PREFIX),
+                        msg='Should store the value compressed.')
+        self.assertEqual(stored_response, u"{'ACK': ['Failure']}")
+
+        error = PaymentTransactionError.objects.get(pk=error.pk)
+        self.assertEqual(
+            error.request_data, request_data[:500] + '[truncated]')
+        self.assertEqual(
+            PaymentTransactionError.objects.values_list(
+                'request_data', flat=True).get(),
+            error.request_data, msg='Should decompress values lists.')
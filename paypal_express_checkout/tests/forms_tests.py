@@ -4,8 +4,10 @@ from httplib import HTTPException
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.http import Http404
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from django_libs.tests.factories import UserFactory
 
@@ -15,10 +17,20 @@ from ..forms import (
     SetExpressCheckoutFormMixin,
     SetExpressCheckoutItemForm,
 )
-from ..models import PurchasedItem
+from ..models import (
+    ErrorBucket,
+    PaymentStatusEvent,
+    PaymentTransaction,
+    PaymentTransactionError,
+    PurchasedItem,
+)
 from ..constants import PAYPAL_DEFAULTS
 from ..settings import API_URL
-from .factories import ItemFactory, PaymentTransactionFactory
+from .factories import (
+    ItemFactory,
+    PaymentTransactionFactory,
+    PurchasedItemFactory,
+)
 from ..settings import LOGIN_URL
 
 
@@ -30,23 +42,57 @@ class PayPalFormMixinTestCase(TestCase):
         super(PayPalFormMixinTestCase, self).setUp()
         self.paypal_response = 'ACK=Success&TOKEN=abc123'
 
-    @patch('paypal_express_checkout.forms.urllib2')
-    def test_call_paypal(self, urllib2_mock):
+    @patch('paypal_express_checkout.client.get_transport')
+    def test_call_paypal(self, get_transport_mock):
         mixin = PayPalFormMixin()
 
-        response_mock = Mock()
-        response_mock.read = Mock(return_value=self.paypal_response)
-        urllib2_mock.urlopen.return_value = response_mock
+        transport_mock = Mock()
+        transport_mock.post = Mock(return_value=self.paypal_response)
+        get_transport_mock.return_value = transport_mock
         response = mixin.call_paypal(API_URL, {})
         self.assertEqual(response['ACK'], ['Success'], msg=(
             'Should parse the response from paypal and return it as a dict'))
 
         with patch.object(mixin, 'log_error') as log_error_mock:
-            urllib2_mock.urlopen = PropertyMock(side_effect=HTTPException)
+            transport_mock.post = PropertyMock(side_effect=HTTPException)
             mixin.call_paypal(API_URL, {})
             self.assertEqual(log_error_mock.call_count, 1, msg=(
                 'Should log an error if calling the PayPal API fails.'))
 
+    def test_get_api_url(self):
+        self.assertEqual(PayPalFormMixin().get_api_url(), API_URL)
+        with override_settings(PAYPAL_API_URL='http://127.0.0.1/nvp'):
+            self.assertEqual(
+                PayPalFormMixin().get_api_url(), 'http://127.0.0.1/nvp',
+                msg='Should read the setting on every call.')
+
+    @patch('paypal_express_checkout.models.app_settings.ERROR_SAMPLES', 2)
+    def test_log_error(self):
+        mixin = PayPalFormMixin()
+        mixin.user = UserFactory()
+        response = {'ACK': ['Failure'], 'L_ERRORCODE0': ['10001']}
+        errors = [
+            mixin.log_error(response, API_URL, request_data='')
+            for i in range(3)]
+        self.assertIsNone(errors[2], msg=(
+            'Should only save the first errors of a bucket.'))
+        self.assertEqual(PaymentTransactionError.objects.count(), 2)
+        bucket = ErrorBucket.objects.get()
+        self.assertEqual(
+            (bucket.api_url, bucket.error_code, bucket.count),
+            (API_URL, '10001', 3), msg='Should count every error.')
+        self.assertEqual(errors[0].bucket, bucket)
+
+        with patch('paypal_express_checkout.forms.ERROR_LOGGING', 'rows'):
+            error = mixin.log_error(
+                response, API_URL,
+                request_data='USER=user&PWD=secret&SIGNATURE=sig&METHOD=Set')
+        self.assertIsNone(error.bucket, msg=(
+            'Should save every error without a bucket in rows mode.'))
+        self.assertEqual(error.request_data, 'METHOD=Set', msg=(
+            'Should not store the API credentials.'))
+        self.assertEqual(ErrorBucket.objects.get().count, 3)
+
 
 class DoExpressCheckoutFormTestCase(TestCase):
     """Tests for the ``DoExpressCheckoutForm`` form class."""
@@ -81,6 +127,52 @@ class DoExpressCheckoutFormTestCase(TestCase):
         self.assertRaises(Http404, DoExpressCheckoutForm,
                           **{'user': self.user, 'data': self.valid_data})
 
+    @patch.object(PayPalFormMixin, 'call_paypal')
+    def test_do_checkout_keeps_ipn_status(self, call_paypal_mock):
+        call_paypal_mock.return_value = self.valid_response
+        form = DoExpressCheckoutForm(user=self.user, data=self.valid_data)
+        PaymentTransaction.objects.filter(pk=self.transaction.pk).update(
+            status='Completed')
+        form.do_checkout()
+        self.assertEqual(PaymentTransaction.objects.get(
+            pk=self.transaction.pk).status, 'Completed', msg=(
+                'Should not overwrite the status an IPN has set.'))
+
+    def test_transaction_kwarg(self):
+        with self.assertNumQueries(0):
+            form = DoExpressCheckoutForm(
+                user=self.user, data=self.valid_data,
+                transaction=self.transaction)
+            post_data = form.get_post_data()
+        self.assertEqual(form.transaction, self.transaction)
+        self.assertEqual(post_data['PAYMENTREQUEST_0_CURRENCYCODE'], 'USD',
+                         msg='Should use the currency of the transaction.')
+
+    def test_get_currency_legacy_transaction(self):
+        self.transaction.currency = ''
+        self.transaction.save()
+        PurchasedItemFactory(
+            transaction=self.transaction, user=self.user,
+            item=ItemFactory(currency='EUR'))
+        form = DoExpressCheckoutForm(user=self.user, data=self.valid_data)
+        self.assertEqual(form.get_currency(), 'EUR', msg=(
+            'Should fall back to the currency of the purchased items.'))
+
+    @patch.object(PayPalFormMixin, 'call_paypal')
+    def test_do_checkout_failed_call(self, call_paypal_mock):
+        call_paypal_mock.return_value = None
+        form = DoExpressCheckoutForm(user=self.user, data=self.valid_data)
+        resp = form.do_checkout()
+        self.assertEqual(resp['Location'], reverse('paypal_error'), msg=(
+            'Should redirect to the error view if PayPal could not be'
+            ' reached.'))
+
+    @patch('paypal_express_checkout.forms.RETRY_IDEMPOTENCY_KEY', True)
+    def test_get_post_data_idempotency_key(self):
+        form = DoExpressCheckoutForm(user=self.user, data=self.valid_data)
+        self.assertEqual(form.get_post_data()['MSGSUBID'], self.token, msg=(
+            'Should use the token as idempotency key.'))
+
 
 class SetExpressCheckoutFormMixinTestCase(TestCase):
     """Tests for the ``SetExpressCheckoutFormMixin`` mixin."""
@@ -133,6 +225,34 @@ class SetExpressCheckoutFormMixinTestCase(TestCase):
 
         SetExpressCheckoutFormMixin.get_items_and_quantities = old_item_and_qty
 
+    @patch.object(PayPalFormMixin, 'call_paypal')
+    def test_set_checkout_queries(self, call_paypal_mock):
+        call_paypal_mock.return_value = self.valid_response
+
+        def count_queries(item_quantity_list):
+            form = SetExpressCheckoutFormMixin(self.user)
+            form.get_items_and_quantities = Mock(
+                return_value=item_quantity_list)
+            with CaptureQueriesContext(connection) as queries:
+                form.set_checkout()
+            return len(queries)
+
+        small_cart = [(self.item1, 1, self.user), (self.item2, 2, None)]
+        large_cart = [
+            (self.item1, 1, self.user) for i in range(50)] + [
+            (self.item2, 2, None) for i in range(50)]
+        self.assertEqual(
+            count_queries(small_cart), count_queries(large_cart), msg=(
+                'Should not need more queries for more cart lines.'))
+        self.assertEqual(PurchasedItem.objects.count(), 102)
+        purchased_item = PurchasedItem.objects.filter(
+            object_id__isnull=False)[0]
+        self.assertEqual(purchased_item.content_object, self.user, msg=(
+            'Should save the content object.'))
+        self.assertEqual(set(PaymentStatusEvent.objects.values_list(
+            'status', 'source')), set([('Checkout', 'set_checkout')]),
+            msg='Should record the status in the status history.')
+
 
 class SetExpressCheckoutItemFormTestCase(TestCase):
     """Tests for the ``SetExpressCheckoutItemForm`` form class."""
@@ -195,6 +315,9 @@ class SetExpressCheckoutItemFormTestCase(TestCase):
         self.assertEqual(PurchasedItem.objects.all().count(), 1, msg=(
             'Should create a PurchasedItem object when saving the'
             ' transaction'))
+        self.assertEqual(
+            PaymentTransaction.objects.get().currency, 'USD', msg=(
+                'Should store the currency on the transaction.'))
 
         self.paypal_response.update({
             'ACK': ['Failure']})
@@ -1,4 +1,6 @@
 """Tests for the views of the ``paypal_express_checkout`` app."""
+import socket
+
 from mock import Mock, patch
 
 from django.conf import settings
@@ -13,9 +15,9 @@ from ..factories import (
     PaymentTransactionFactory,
 )
 from ...forms import PayPalFormMixin
-from ...models import PaymentTransaction
+from ...models import PaymentTransaction, QueuedIPN
 from ...signals import payment_completed
-from ... import views
+from ... import metrics, views
 
 
 class DoExpressCheckoutViewTestCase(ViewRequestFactoryTestMixin, TestCase):
@@ -60,6 +62,17 @@ class DoExpressCheckoutViewTestCase(ViewRequestFactoryTestMixin, TestCase):
                          to_url_name='paypal_success')
         self.is_not_callable(user=self.user)
 
+    def test_confirm_queries(self):
+        # One SELECT for the transaction, one UPDATE when saving it, and the
+        # conditional UPDATE of the status with one INSERT for the status
+        # history in a savepoint. The purchased items are not needed to
+        # confirm the payment.
+        with self.assertNumQueries(6):
+            resp = self.post(user=self.user, data=self.get_post_data())
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(list(self.transaction.status_events.values_list(
+            'status', 'source')), [('Pending', 'do_checkout')])
+
 
 class PaymentCancelViewTestCase(ViewRequestFactoryTestMixin, TestCase):
     """Tests for the ``PaymentCancelView`` view class."""
@@ -186,7 +199,54 @@ class IPNListenerViewTestCase(ViewRequestFactoryTestMixin, TestCase):
             'When the IPNListenerView is called, it should send a signal.'))
         self.is_not_callable()
 
+    def test_illegal_transition(self):
+        PaymentTransaction.objects.filter(pk=self.transaction.pk).update(
+            status='Completed')
+        self.received_transaction = None
+        self.valid_data['payment_status'] = 'Pending'
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.assertEqual(
+            PaymentTransaction.objects.get(pk=self.transaction.pk).status,
+            'Completed', msg='Should not go back from Completed to Pending.')
+        self.assertIsNone(self.received_transaction, msg=(
+            'Should not send signals for an illegal transition.'))
+
+    @patch('paypal_express_checkout.views.settings.IPN_VERIFY', True)
+    @patch('paypal_express_checkout.views.IPNVerifier.verify')
+    def test_verification(self, verify_mock):
+        verify_mock.return_value = False
+        self.received_transaction = None
+        resp = self.client.post(self.get_url(), data=self.valid_data)
+        self.assertEqual(resp.status_code, 400, msg=(
+            'Should reject IPNs that PayPal does not verify.'))
+        self.assertIsNone(self.received_transaction)
+        verify_mock.side_effect = socket.timeout
+        resp = self.client.post(self.get_url(), data=self.valid_data)
+        self.assertEqual(resp.status_code, 503, msg=(
+            'Should ask PayPal to resend the IPN if it could not be'
+            ' verified.'))
+        verify_mock.side_effect = None
+        verify_mock.return_value = True
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.assertEqual(self.received_transaction, self.transaction)
+
+    def test_repeated_delivery(self):
+        self.valid_data['ipn_track_id'] = 'abc123'
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.received_transaction = None
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.assertIsNone(self.received_transaction, msg=(
+            'Should not send the signal again for a repeated IPN.'))
+        PaymentTransaction.objects.filter(pk=self.transaction.pk).update(
+            status='Pending')
+        self.valid_data['ipn_track_id'] = 'def456'
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.assertEqual(self.received_transaction, self.transaction, msg=(
+            'Should apply an IPN with a new ipn_track_id.'))
+
     def test_refund_transaction(self):
+        PaymentTransaction.objects.filter(pk=self.transaction.pk).update(
+            status='Completed')
         self.valid_data = {
             'txn_id': 'SOME_NEW_ID',
             'parent_txn_id': self.transaction.transaction_id,
@@ -197,3 +257,59 @@ class IPNListenerViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.assertEqual(transaction.status, 'Refunded', msg=(
             'When the IPNListenerView is called, it should set the'
             ' to the Refunded status.'))
+
+    @patch('paypal_express_checkout.views.settings.IPN_MODE', 'queue')
+    def test_queue_mode(self):
+        self.received_transaction = None
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.assertEqual(QueuedIPN.objects.get().transaction_id,
+                         self.transaction.transaction_id, msg=(
+                             'Should store the IPN in the queue.'))
+        self.assertIsNone(self.received_transaction, msg=(
+            'Should not send signals before the IPN is processed.'))
+        self.assertEqual(
+            PaymentTransaction.objects.get(pk=self.transaction.pk).status,
+            self.transaction.status, msg='Should not apply the IPN yet.')
+        self.assertEqual(self.get().status_code, 405)
+
+    @patch('paypal_express_checkout.metrics.get_backend')
+    def test_metrics(self, get_backend_mock):
+        backend = get_backend_mock.return_value = metrics.LocalMetricsBackend()
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.is_postable(data=self.valid_data, ajax=True)
+        self.valid_data['txn_id'] = 'unknown'
+        self.valid_data['payment_status'] = 'Foo'
+        self.client.post(self.get_url(), data=self.valid_data)
+        for status, result in [('Completed', 'applied'),
+                               ('Completed', 'ignored'),
+                               ('other', 'unknown_transaction')]:
+            self.assertEqual(backend.get_counter('paypal_ipns_total', {
+                'payment_status': status, 'result': result}), 1, msg=(
+                    'Should count the {0} IPN.'.format(result)))
+        self.assertEqual(backend.get_histogram_count(
+            'paypal_ipn_duration_seconds', {'mode': 'sync'}), 3)
+        self.assertEqual(backend.get_histogram_count(
+            'paypal_db_duration_seconds', {'step': 'ipn'}), 2)
+
+
+class MetricsViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the ``MetricsView`` view class."""
+    view_class = views.MetricsView
+
+    def get_view_name(self):
+        return 'paypal_metrics'
+
+    @patch('paypal_express_checkout.views.settings.METRICS_TOKEN', 'secret')
+    def test_view(self):
+        self.assertEqual(self.client.get(self.get_url()).status_code, 403)
+        resp = self.client.get(
+            self.get_url(), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(resp.status_code, 403)
+        metrics.increment('paypal_errors_total')
+        resp = self.client.get(
+            self.get_url(), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(resp.status_code, 200, msg=(
+            'Should render the metrics for the token.'))
+        self.assertEqual(resp['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('# TYPE paypal_errors_total counter', resp.content)
+        self.is_callable(user=UserFactory(is_staff=True))
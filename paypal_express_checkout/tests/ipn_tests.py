@@ -0,0 +1,249 @@
+"""Tests for the IPN processing of the ``paypal_express_checkout`` app."""
+import socket
+import urllib
+from datetime import timedelta
+from StringIO import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from django.utils.timezone import now
+
+from mock import patch
+
+from .. import ipn
+from ..fake_paypal import FakePayPalServer
+from ..ipn import IPNVerifier
+from ..models import PaymentTransaction, QueuedIPN, ReceivedIPN
+from ..signals import payment_completed
+from ..transport import get_transport
+from .factories import PaymentTransactionFactory
+
+
+def queue_ipn(transaction_id, payment_status, **kwargs):
+    kwargs.update({'txn_id': transaction_id, 'payment_status': payment_status})
+    return QueuedIPN.objects.create(
+        transaction_id=ipn.get_transaction_id(kwargs),
+        data=urllib.urlencode(kwargs))
+
+
+class IPNVerifierTestCase(TestCase):
+    """Tests for the ``IPNVerifier`` class."""
+    longMessage = True
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakePayPalServer().start()
+
+    def tearDown(self):
+        get_transport().close()
+        self.server.stop()
+
+    def test_verify(self):
+        verifier = IPNVerifier(url=self.server.url)
+        self.assertTrue(verifier.verify('txn_id=a&payment_status=Completed'))
+        self.assertTrue(verifier.verify('txn_id=a&payment_status=Completed'))
+        self.assertEqual(self.server.calls['_notify-validate'], 1, msg=(
+            'Should not verify the same IPN twice.'))
+        self.server.ipn_verification = 'INVALID'
+        self.assertFalse(verifier.verify('txn_id=b&payment_status=Completed'))
+        self.assertFalse(verifier.verify('txn_id=b&payment_status=Completed'))
+        self.assertEqual(self.server.calls['_notify-validate'], 3, msg=(
+            'Should not cache invalid IPNs.'))
+
+
+class GetTransactionIdTestCase(TestCase):
+    """Tests for the ``get_transaction_id`` function."""
+    longMessage = True
+
+    def test_function(self):
+        self.assertEqual(ipn.get_transaction_id(
+            {'txn_id': 'a', 'payment_status': 'Completed'}), 'a')
+        self.assertEqual(ipn.get_transaction_id(
+            {'txn_id': 'b', 'parent_txn_id': 'a',
+             'payment_status': 'Refunded'}), 'a', msg=(
+                'Should use the parent transaction for refunds.'))
+
+
+class RecordIPNTestCase(TestCase):
+    """Tests for the ``record_ipn`` function."""
+    longMessage = True
+
+    def test_function(self):
+        data = {'txn_id': 'a', 'payment_status': 'Completed',
+                'ipn_track_id': 'b'}
+        self.assertTrue(ipn.record_ipn(data))
+        self.assertFalse(ipn.record_ipn(data), msg=(
+            'Should detect a repeated IPN.'))
+        self.assertTrue(ipn.record_ipn(dict(data, payment_status='Refunded')))
+        self.assertEqual(ReceivedIPN.objects.count(), 2)
+
+
+class PruneIPNsTestCase(TestCase):
+    """Tests for the ``prune_ipns`` function."""
+    longMessage = True
+
+    def setUp(self):
+        old = now() - timedelta(days=31)
+        for i in range(3):
+            ReceivedIPN.objects.create(txn_id=str(i), payment_status='Done')
+        ReceivedIPN.objects.filter(txn_id__in=['0', '1']).update(received=old)
+        queue_ipn('a', 'Completed')
+        QueuedIPN.objects.update(processed=old)
+        queue_ipn('b', 'Completed')
+
+    def test_function(self):
+        self.assertEqual(ipn.prune_ipns(batch_size=1), 3)
+        self.assertEqual(list(ReceivedIPN.objects.values_list(
+            'txn_id', flat=True)), ['2'], msg=(
+                'Should only delete records older than the retention.'))
+        self.assertEqual(QueuedIPN.objects.get().transaction_id, 'b', msg=(
+            'Should keep unprocessed IPNs.'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('paypal_prune_ipns', days=40, stdout=out)
+        self.assertIn('Deleted 0 IPN records', out.getvalue())
+
+
+class ProcessIPNQueueTestCase(TestCase):
+    """Tests for the ``process_ipn_queue`` function."""
+    longMessage = True
+
+    def receive(self, signal, sender, transaction):
+        self.received.append(transaction.transaction_id)
+
+    def setUp(self):
+        self.transaction = PaymentTransactionFactory(status='Pending')
+        self.other_transaction = PaymentTransactionFactory(status='Pending')
+        self.received = []
+        payment_completed.connect(self.receive)
+
+    def tearDown(self):
+        payment_completed.disconnect(self.receive)
+
+    def test_process(self):
+        queue_ipn(self.transaction.transaction_id, 'Completed')
+        queue_ipn(self.other_transaction.transaction_id, 'Completed')
+        self.assertEqual(ipn.process_ipn_queue(), 2)
+        self.assertEqual(self.received, [
+            self.transaction.transaction_id,
+            self.other_transaction.transaction_id], msg=(
+                'Should process the IPNs in order and send the signals.'))
+        self.assertEqual(
+            PaymentTransaction.objects.get(pk=self.transaction.pk).status,
+            'Completed')
+        self.assertFalse(QueuedIPN.objects.filter(
+            processed__isnull=True).exists(), msg=(
+                'Should mark the IPNs as processed.'))
+        self.assertEqual(ipn.process_ipn_queue(), 0)
+
+    def test_keeps_order_per_transaction(self):
+        first = queue_ipn('UNKNOWN', 'Pending')
+        second = queue_ipn('UNKNOWN', 'Completed')
+        other = queue_ipn(self.other_transaction.transaction_id, 'Completed')
+        self.assertEqual(ipn.process_ipn_queue(), 2)
+        first = QueuedIPN.objects.get(pk=first.pk)
+        self.assertEqual(first.attempts, 1)
+        self.assertIsNone(first.processed, msg=(
+            'Should retry IPNs of unknown transactions.'))
+        self.assertTrue(first.next_attempt > now())
+        self.assertEqual(QueuedIPN.objects.get(pk=second.pk).attempts, 0,
+                         msg=('Should not process later IPNs of a transaction'
+                              ' while an earlier one is waiting.'))
+        self.assertIsNotNone(QueuedIPN.objects.get(pk=other.pk).processed)
+
+        self.assertEqual(ipn.process_ipn_queue(), 0, msg=(
+            'Should not retry before the next attempt is due.'))
+
+        PaymentTransactionFactory(transaction_id='UNKNOWN')
+        QueuedIPN.objects.filter(pk=first.pk).update(
+            next_attempt=now() - timedelta(seconds=1))
+        self.assertEqual(ipn.process_ipn_queue(), 2)
+        self.assertEqual(
+            PaymentTransaction.objects.get(transaction_id='UNKNOWN').status,
+            'Completed', msg='Should apply the IPNs in order.')
+
+    def test_failing_receiver(self):
+        def fail(signal, sender, transaction):
+            raise ValueError('receiver failed')
+        payment_completed.connect(fail)
+        try:
+            message = queue_ipn(self.transaction.transaction_id, 'Completed')
+            ipn.process_ipn_queue()
+        finally:
+            payment_completed.disconnect(fail)
+        self.assertEqual(
+            PaymentTransaction.objects.get(pk=self.transaction.pk).status,
+            'Completed', msg='Should not roll back the IPN.')
+        self.assertIsNotNone(QueuedIPN.objects.get(pk=message.pk).processed,
+                             msg='Should not process the IPN again.')
+        self.assertEqual(self.received, [self.transaction.transaction_id])
+
+    @patch('paypal_express_checkout.ipn.settings.IPN_VERIFY', True)
+    @patch('paypal_express_checkout.ipn.IPNVerifier.verify')
+    def test_windows_1252(self, verify_mock):
+        verify_mock.return_value = True
+        body = 'txn_id={0}&payment_status=Completed&first_name=J\xf6rg&' \
+            'item_name=Caf%E9&charset=windows-1252'.format(
+                self.transaction.transaction_id)
+        ipn.enqueue_ipn(RequestFactory().post(
+            '/', body, content_type='application/x-www-form-urlencoded'))
+        message = QueuedIPN.objects.get()
+        self.assertEqual(message.get_body(), body, msg=(
+            'Should store the body without changing a byte.'))
+        self.assertEqual(message.get_data()['first_name'], u'J\xf6rg')
+        self.assertEqual(message.get_data()['item_name'], u'Caf\xe9', msg=(
+            'Should decode the data with the charset of the IPN.'))
+        ipn.process_ipn_queue()
+        self.assertEqual(verify_mock.call_args[0][0], body, msg=(
+            'Should post back exactly the bytes PayPal sent.'))
+        self.assertEqual(self.received, [self.transaction.transaction_id])
+
+    def test_long_transaction_id(self):
+        request = RequestFactory().post('/', {
+            'txn_id': 'x' * 40, 'payment_status': 'Completed'})
+        self.assertEqual(ipn.enqueue_ipn(request).transaction_id, 'x' * 32,
+                         msg='Should truncate the transaction id.')
+
+    def test_gives_up(self):
+        message = queue_ipn('UNKNOWN', 'Completed')
+        ipn.process_ipn_queue(max_attempts=1)
+        message = QueuedIPN.objects.get(pk=message.pk)
+        self.assertIsNotNone(message.processed, msg=(
+            'Should give up after the maximum number of attempts.'))
+        self.assertIn('DoesNotExist', message.error)
+
+    @patch('paypal_express_checkout.ipn.settings.IPN_VERIFY', True)
+    @patch('paypal_express_checkout.ipn.IPNVerifier.verify')
+    def test_verification(self, verify_mock):
+        verify_mock.return_value = False
+        message = queue_ipn(self.transaction.transaction_id, 'Completed')
+        ipn.process_ipn_queue()
+        message = QueuedIPN.objects.get(pk=message.pk)
+        self.assertIsNotNone(message.processed, msg=(
+            'Should give up on invalid IPNs right away.'))
+        self.assertIn('InvalidIPN', message.error)
+        self.assertEqual(self.received, [])
+        verify_mock.side_effect = socket.timeout
+        message = queue_ipn(self.transaction.transaction_id, 'Completed')
+        ipn.process_ipn_queue()
+        self.assertIsNone(QueuedIPN.objects.get(pk=message.pk).processed,
+                          msg='Should retry if PayPal could not be reached.')
+        verify_mock.side_effect = None
+        verify_mock.return_value = True
+        QueuedIPN.objects.update(next_attempt=None)
+        ipn.process_ipn_queue()
+        self.assertEqual(self.received, [self.transaction.transaction_id])
+        self.assertEqual(verify_mock.call_args[0][0], message.get_body())
+
+    @patch('paypal_express_checkout.management.commands.paypal_process_ipns'
+           '.time.sleep', side_effect=KeyboardInterrupt)
+    def test_command(self, sleep_mock):
+        queue_ipn(self.transaction.transaction_id, 'Completed')
+        out = StringIO()
+        call_command('paypal_process_ipns', stdout=out)
+        self.assertIn('Processed 1 IPNs', out.getvalue())
+        self.assertRaises(
+            KeyboardInterrupt, call_command, 'paypal_process_ipns',
+            loop=True, stdout=out)
@@ -0,0 +1,113 @@
+"""Tests for the metrics of the ``paypal_express_checkout`` app."""
+import socket
+import urllib2
+
+from django.test import TestCase
+
+from mock import Mock, patch
+
+from .factories import PaymentTransactionFactory
+from .. import metrics
+from ..client import CircuitOpenError, PayPalClient
+from ..models import PaymentTransaction
+from ..retry import RetryPolicy
+from ..settings import API_URL
+
+
+class LocalMetricsBackendTestCase(TestCase):
+    """Tests for the ``LocalMetricsBackend`` class."""
+    longMessage = True
+
+    def test_render(self):
+        backend = metrics.LocalMetricsBackend(buckets=[0.1, 1])
+        self.assertEqual(backend.render(), '\n')
+        backend.increment('calls_total', {'method': 'Set"Express'})
+        backend.increment('calls_total', {'method': 'Set"Express'}, value=2)
+        backend.increment('errors_total')
+        backend.observe('duration_seconds', 0.1, {'method': 'a'})
+        backend.observe('duration_seconds', 0.5, {'method': 'a'})
+        backend.observe('duration_seconds', 5, {'method': 'a'})
+        self.assertEqual(
+            backend.get_counter('calls_total', {'method': 'Set"Express'}), 3)
+        self.assertEqual(
+            backend.get_histogram_count('duration_seconds', {'method': 'a'}),
+            3)
+        self.assertEqual(backend.render().splitlines(), [
+            '# TYPE calls_total counter',
+            'calls_total{method="Set\\"Express"} 3',
+            '# TYPE errors_total counter',
+            'errors_total 1',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{method="a",le="0.1"} 1',
+            'duration_seconds_bucket{method="a",le="1"} 2',
+            'duration_seconds_bucket{method="a",le="+Inf"} 3',
+            'duration_seconds_sum{method="a"} 5.6',
+            'duration_seconds_count{method="a"} 3',
+        ], msg='Should render the Prometheus text format.')
+
+    def test_get_backend(self):
+        backend = metrics.get_backend()
+        self.assertIsInstance(backend, metrics.LocalMetricsBackend)
+        self.assertIs(metrics.get_backend(), backend, msg=(
+            'Should return the same backend in the same process.'))
+        with patch('paypal_express_checkout.metrics._backend_pid', 0):
+            self.assertIsNot(metrics.get_backend(), backend, msg=(
+                'Should create a new backend after a fork.'))
+
+
+@patch('paypal_express_checkout.metrics.get_backend')
+class MetricsTestCase(TestCase):
+    """Tests for the instrumentation of the app."""
+    longMessage = True
+
+    def setUp(self):
+        self.backend = metrics.LocalMetricsBackend()
+
+    def test_db_timer(self, get_backend_mock):
+        get_backend_mock.return_value = self.backend
+        labels = {'step': 'test'}
+        with metrics.db_timer('test'):
+            PaymentTransactionFactory()
+            list(PaymentTransaction.objects.all())
+        self.assertEqual(self.backend.get_histogram_count(
+            'paypal_db_duration_seconds', labels), 1)
+        self.assertGreater(self.backend.histograms[(
+            'paypal_db_duration_seconds', (('step', 'test'),))][-1], 0, msg=(
+                'Should sum the time of the queries.'))
+        with patch('paypal_express_checkout.metrics.settings.METRICS_DB_TIME',
+                   False):
+            with metrics.db_timer('test'):
+                list(PaymentTransaction.objects.all())
+        self.assertEqual(self.backend.get_histogram_count(
+            'paypal_db_duration_seconds', labels), 1, msg=(
+                'Should not measure if PAYPAL_METRICS_DB_TIME is False.'))
+
+    def test_client(self, get_backend_mock):
+        get_backend_mock.return_value = self.backend
+        transport = Mock()
+        transport.post.return_value = 'ACK=Failure'
+        circuit_breaker = Mock()
+        client = PayPalClient(
+            transport=transport, retry_policy=RetryPolicy(methods=[]),
+            circuit_breaker=circuit_breaker)
+        post_data = {'METHOD': 'SetExpressCheckout'}
+
+        client.call(API_URL, dict(post_data))
+        transport.post.side_effect = urllib2.URLError(socket.timeout())
+        self.assertRaises(urllib2.URLError, client.call, API_URL,
+                          dict(post_data))
+        transport.post.side_effect = socket.error
+        self.assertRaises(socket.error, client.call, API_URL, dict(post_data))
+        circuit_breaker.allow_request.return_value = False
+        self.assertRaises(CircuitOpenError, client.call, API_URL,
+                          dict(post_data))
+
+        for outcome in ('Failure', 'timeout', 'error', 'circuit_open'):
+            self.assertEqual(self.backend.get_counter(
+                'paypal_api_requests_total',
+                {'method': 'SetExpressCheckout', 'outcome': outcome}), 1,
+                msg='Should count the outcome {0}.'.format(outcome))
+        self.assertEqual(self.backend.get_histogram_count(
+            'paypal_api_request_duration_seconds',
+            {'method': 'SetExpressCheckout'}), 3, msg=(
+                'Should time every call that reached the transport.'))
@@ -1,7 +1,15 @@
 """Tests for the models of the ``paypal_express_checkout`` app."""
+from datetime import timedelta
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 
 from .. import models
+from ..signals import payment_statuses_updated
 from . import factories
 
 
@@ -14,6 +22,147 @@ class PaymentTransactionTestCase(TestCase):
         transaction = models.PaymentTransaction()
         self.assertTrue(transaction)
 
+    def test_transition(self):
+        transaction = factories.PaymentTransactionFactory(status='Pending')
+        self.assertTrue(transaction.transition('Pending'), msg=(
+            'Should apply the Pending IPN PayPal sends after the checkout.'))
+        transaction.status_events.all().delete()
+        stale = models.PaymentTransaction.objects.get(pk=transaction.pk)
+        # savepoint, UPDATE, INSERT of the event, release
+        with self.assertNumQueries(4):
+            self.assertTrue(transaction.transition('Completed', source='x'))
+        self.assertEqual(transaction.status, 'Completed')
+        self.assertEqual(list(transaction.status_events.values_list(
+            'status', 'source')), [('Completed', 'x')], msg=(
+                'Should record the change in the status history.'))
+        self.assertFalse(stale.transition('Failed'), msg=(
+            'Should check the status in the database, not the one of the'
+            ' instance.'))
+        self.assertFalse(transaction.transition('Pending'))
+        self.assertEqual(transaction.status_events.count(), 1, msg=(
+            'Should not record rejected transitions.'))
+        self.assertEqual(models.PaymentTransaction.objects.get(
+            pk=transaction.pk).status, 'Completed')
+
+
+class PaymentTransactionManagerTestCase(TestCase):
+    """Tests for the ``PaymentTransactionManager`` class."""
+    longMessage = True
+
+    def receive(self, signal, sender, transactions):
+        self.received.append(transactions)
+
+    def setUp(self):
+        self.received = []
+        payment_statuses_updated.connect(self.receive)
+
+    def tearDown(self):
+        payment_statuses_updated.disconnect(self.receive)
+
+    def test_bulk_transition(self):
+        pending = factories.PaymentTransactionFactory(status='Pending')
+        other = factories.PaymentTransactionFactory(status='Pending')
+        completed = factories.PaymentTransactionFactory(status='Completed')
+        count = models.PaymentTransaction.objects.bulk_transition([
+            (pending.transaction_id, 'Completed'),
+            (other.transaction_id, 'Failed'),
+            (completed.transaction_id, 'Pending'),
+            (completed.transaction_id, 'Refunded'),
+            ('UNKNOWN', 'Completed'),
+        ], source='reconciliation')
+        self.assertEqual(count, 3)
+        expected = {
+            pending.transaction_id: 'Completed',
+            other.transaction_id: 'Failed',
+            completed.transaction_id: 'Refunded',
+        }
+        self.assertEqual(dict(models.PaymentTransaction.objects.values_list(
+            'transaction_id', 'status')), expected, msg=(
+                'Should only apply allowed transitions.'))
+        self.assertEqual(models.PaymentStatusEvent.objects.filter(
+            source='reconciliation').count(), 3)
+        self.assertEqual(len(self.received), 1, msg=(
+            'Should send one signal per batch.'))
+        self.assertEqual(
+            set(obj.status for obj in self.received[0]),
+            set(['Completed', 'Failed', 'Refunded']))
+
+    def test_bulk_transition_order(self):
+        first = factories.PaymentTransactionFactory(status='Pending')
+        second = factories.PaymentTransactionFactory(status='Completed')
+        count = models.PaymentTransaction.objects.bulk_transition([
+            (second.transaction_id, 'Refunded'),
+            (first.transaction_id, 'Completed'),
+            (first.transaction_id, 'Refunded'),
+        ])
+        self.assertEqual(count, 2)
+        self.assertEqual(list(first.status_events.values_list(
+            'status', flat=True).order_by('pk')), ['Completed', 'Refunded'],
+            msg='Should apply the changes of a transaction in order.')
+        self.assertEqual(models.PaymentTransaction.objects.get(
+            pk=first.pk).status, 'Refunded')
+        self.assertEqual(
+            [transaction.pk for transaction in self.received[0]],
+            [second.pk, first.pk], msg=(
+                'Should send every changed transaction once.'))
+
+    def test_bulk_transition_queries(self):
+        def count_queries(size):
+            pairs = [
+                (factories.PaymentTransactionFactory().transaction_id,
+                 'Completed') for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                models.PaymentTransaction.objects.bulk_transition(pairs)
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(50), msg=(
+            'Should not need more queries for more transactions.'))
+        self.assertEqual(len(self.received), 2)
+
+
+class ErrorBucketManagerTestCase(TestCase):
+    """Tests for the ``ErrorBucketManager`` class."""
+    longMessage = True
+
+    def test_record(self):
+        record = models.ErrorBucket.objects.record
+        self.assertIsNotNone(record('https://api', '10001', samples=2))
+        self.assertIsNotNone(record('https://api', '10001', samples=2))
+        self.assertIsNone(record('https://api', '10001', samples=2), msg=(
+            'Should only sample the first errors of a bucket.'))
+        self.assertIsNotNone(record('https://api', 'HTTP 503', samples=2))
+        self.assertIsNone(record('https://api', 'HTTP 503', samples=0))
+        self.assertEqual(
+            dict(models.ErrorBucket.objects.values_list(
+                'error_code', 'count')),
+            {'10001': 3, 'HTTP 503': 2}, msg=(
+                'Should count all errors per code and minute.'))
+
+    def test_prune(self):
+        user = factories.UserFactory()
+        bucket = models.ErrorBucket.objects.record('https://api', '10001')
+        old = models.ErrorBucket.objects.record('https://api', '10002')
+        models.ErrorBucket.objects.filter(pk=old.pk).update(
+            minute=now() - timedelta(days=100))
+        models.PaymentTransactionError.objects.create(user=user, bucket=old)
+        error = models.PaymentTransactionError.objects.create(user=user)
+        models.PaymentTransactionError.objects.filter(pk=error.pk).update(
+            date=now() - timedelta(days=100))
+        models.PaymentTransactionError.objects.create(
+            user=user, bucket=bucket)
+
+        out = StringIO()
+        call_command('paypal_prune_errors', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue(), 'Deleted 2 error records.\n')
+        self.assertEqual(
+            list(models.ErrorBucket.objects.all()), [bucket], msg=(
+                'Should only delete buckets older than the retention.'))
+        self.assertEqual(
+            list(models.PaymentTransactionError.objects.values_list(
+                'bucket', flat=True)), [bucket.pk], msg=(
+                    'Should delete old errors and the samples of old'
+                    ' buckets.'))
+
 
 class PaymentTransactionErrorTestCase(TestCase):
     """Tests for the ``PaymentTransactionError`` model."""
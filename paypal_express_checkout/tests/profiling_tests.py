@@ -0,0 +1,92 @@
+"""Tests for the profiling of the ``paypal_express_checkout`` app."""
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+from django.template.response import TemplateResponse
+
+from django_libs.tests.factories import UserFactory
+from mock import Mock, patch
+
+from .. import profiling
+from ..ipn import IPNVerifier
+
+
+@profiling.profile_view
+def success_view(request):
+    list(User.objects.all())
+    profiling.annotate(transaction_id='abc123')
+    profiling.add_paypal_time(0.5)
+    return TemplateResponse(request, 'paypal_express_checkout/success.html')
+
+
+@override_settings(MIDDLEWARE_CLASSES=[
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'paypal_express_checkout.profiling.ProfilingMiddleware',
+])
+@patch('paypal_express_checkout.profiling.settings.PROFILING_QUERY_BUDGET', 0)
+@patch('paypal_express_checkout.profiling.logger')
+class ProfilingTestCase(TestCase):
+    """Tests for the ``ProfilingMiddleware`` and ``profile_view``."""
+    longMessage = True
+
+    def get_report(self, logger_mock):
+        self.assertEqual(logger_mock.warning.call_count, 1, msg=(
+            'Should log one warning for the request.'))
+        return logger_mock.warning.call_args[1]['extra']['paypal_profile']
+
+    def test_middleware(self, logger_mock):
+        user = UserFactory()
+        user.set_password('test123')
+        user.save()
+        self.client.login(username=user.username, password='test123')
+        self.assertEqual(
+            self.client.get(reverse('paypal_success')).status_code, 200)
+        report = self.get_report(logger_mock)
+        self.assertEqual(
+            report['view'], 'paypal_express_checkout.views.PaymentSuccessView')
+        self.assertEqual(report['exceeded'], ['queries'])
+        self.assertEqual(report['status_code'], 200)
+        self.assertGreater(report['queries'], 0, msg=(
+            'Should count the queries of the view, e.g. for the user.'))
+        self.assertGreater(report['template_seconds'], 0, msg=(
+            'Should measure the template rendering.'))
+        self.assertIsNone(profiling.get_current_profile(), msg=(
+            'Should stop the profile with the request.'))
+
+        with patch('paypal_express_checkout.profiling.settings.'
+                   'PROFILING_SAMPLE_RATE', 0):
+            self.client.get(reverse('paypal_success'))
+        self.assertEqual(logger_mock.warning.call_count, 1, msg=(
+            'Should not profile requests that are not sampled.'))
+
+        self.client.get(reverse('dummy_home'))
+        self.assertEqual(logger_mock.warning.call_count, 1, msg=(
+            'Should only profile the views of this app.'))
+
+    def test_profile_view(self, logger_mock):
+        with patch('paypal_express_checkout.profiling.settings.'
+                   'PROFILING_QUERY_BUDGET', None):
+            success_view(RequestFactory().get('/'))
+        self.assertEqual(logger_mock.warning.call_count, 0, msg=(
+            'Should not warn within the budgets.'))
+
+        response = success_view(RequestFactory().get('/'))
+        self.assertTrue(response.is_rendered)
+        report = self.get_report(logger_mock)
+        self.assertEqual(report['queries'], 1)
+        self.assertEqual(report['transaction_id'], 'abc123')
+        self.assertEqual(report['paypal_seconds'], 0.5)
+        self.assertGreater(report['template_seconds'], 0)
+        self.assertIn('transaction_id=abc123',
+                      logger_mock.warning.call_args[0][0])
+
+    @patch('paypal_express_checkout.ipn.profiling.add_paypal_time')
+    def test_verification_time(self, add_paypal_time_mock, logger_mock):
+        transport = Mock()
+        transport.post.return_value = 'VERIFIED'
+        IPNVerifier(transport=transport).verify('txn_id=profiling')
+        self.assertEqual(add_paypal_time_mock.call_count, 1, msg=(
+            'Should add the time of the IPN postback to the profile.'))
@@ -0,0 +1,66 @@
+"""Tests for the retry policy of the ``paypal_express_checkout`` app."""
+import socket
+
+from django.test import TestCase
+
+from mock import Mock, patch
+
+from ..retry import RetryPolicy
+from ..transport import HTTPStatusError
+
+
+class RetryPolicyTestCase(TestCase):
+    """Tests for the ``RetryPolicy`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.policy = RetryPolicy(
+            max_attempts=3, backoff=0.1, backoff_max=1, budget=10,
+            methods=['SetExpressCheckout'])
+
+    def test_is_retryable(self):
+        self.assertTrue(self.policy.is_retryable(
+            {'METHOD': 'SetExpressCheckout'}), msg=(
+                'Should retry operations listed in the retry methods.'))
+        self.assertFalse(self.policy.is_retryable(
+            {'METHOD': 'DoExpressCheckoutPayment'}), msg=(
+                'Should not retry payments without an idempotency key.'))
+        self.assertTrue(self.policy.is_retryable(
+            {'METHOD': 'DoExpressCheckoutPayment', 'MSGSUBID': 'abc'}), msg=(
+                'Should retry payments with an idempotency key.'))
+
+    def test_is_transient(self):
+        self.assertTrue(self.policy.is_transient(socket.timeout()))
+        self.assertTrue(self.policy.is_transient(HTTPStatusError(503, '')))
+        self.assertFalse(self.policy.is_transient(HTTPStatusError(400, '')),
+                         msg='Should not retry client errors.')
+        self.assertFalse(self.policy.is_transient(ValueError()))
+
+    def test_get_delay(self):
+        for attempt in range(1, 10):
+            delay = self.policy.get_delay(attempt)
+            self.assertTrue(0 <= delay <= 1, msg=(
+                'Should never exceed the maximum backoff.'))
+
+    @patch('paypal_express_checkout.retry.time.sleep')
+    def test_call(self, sleep_mock):
+        func = Mock(side_effect=[socket.timeout(), 'ACK=Success'])
+        self.assertEqual(self.policy.call(func, 'a'), 'ACK=Success')
+        self.assertEqual(func.call_count, 2, msg=(
+            'Should retry after a transient error.'))
+
+        func = Mock(side_effect=socket.timeout())
+        self.assertRaises(socket.timeout, self.policy.call, func)
+        self.assertEqual(func.call_count, 3, msg=(
+            'Should give up after the maximum number of attempts.'))
+
+        func = Mock(side_effect=socket.timeout())
+        self.assertRaises(socket.timeout, self.policy.call, func, retry=False)
+        self.assertEqual(func.call_count, 1, msg=(
+            'Should not retry if retrying is disabled.'))
+
+        self.policy.budget = 0
+        func = Mock(side_effect=socket.timeout())
+        self.assertRaises(socket.timeout, self.policy.call, func)
+        self.assertEqual(func.call_count, 1, msg=(
+            'Should not retry once the retry budget is used up.'))
@@ -0,0 +1,94 @@
+"""Tests for the revenue rollup of the ``paypal_express_checkout`` app."""
+from decimal import Decimal
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from mock import patch
+
+from ..forms import DoExpressCheckoutForm
+from ..models import DailyRevenue, PaymentTransaction
+from .factories import (
+    ItemFactory,
+    PaymentTransactionFactory,
+    PurchasedItemFactory,
+)
+
+
+@patch('paypal_express_checkout.models.app_settings.REVENUE_ROLLUP', True)
+class DailyRevenueTestCase(TestCase):
+    """Tests for the ``DailyRevenue`` model and its manager."""
+    longMessage = True
+
+    def setUp(self):
+        self.item = ItemFactory(value=Decimal('5.00'))
+        self.transaction = PaymentTransactionFactory(status='Checkout')
+        PurchasedItemFactory(
+            transaction=self.transaction, identifier='shirt', item=self.item,
+            price=None, quantity=2)
+        PurchasedItemFactory(
+            transaction=self.transaction, identifier='cap', item=self.item,
+            price=1.5, quantity=4)
+        DailyRevenue.objects.record_transitions([(self.transaction, None)])
+
+    def get_rollup(self):
+        return dict(
+            ((row.identifier, row.status), (row.quantity, row.amount))
+            for row in DailyRevenue.objects.all() if row.quantity)
+
+    def test_transition(self):
+        self.assertTrue(self.transaction.transition('Completed'))
+        self.assertEqual(self.get_rollup(), {
+            ('shirt', 'Completed'): (2, Decimal('10.00')),
+            ('cap', 'Completed'): (4, Decimal('6.00')),
+        }, msg='Should move the items to the new status.')
+
+    def test_bulk_transition(self):
+        PaymentTransaction.objects.bulk_transition(
+            [(self.transaction.transaction_id, 'Completed')])
+        self.assertEqual(self.get_rollup()[('shirt', 'Completed')],
+                         (2, Decimal('10.00')))
+
+    def test_revenue(self):
+        self.transaction.transition('Completed')
+        rows = list(DailyRevenue.objects.revenue(group_by=['identifier']))
+        self.assertEqual(rows, [
+            {'identifier': 'cap', 'quantity_sum': 4,
+             'amount_sum': Decimal('6.00')},
+            {'identifier': 'shirt', 'quantity_sum': 2,
+             'amount_sum': Decimal('10.00')},
+        ])
+        self.assertEqual(list(DailyRevenue.objects.revenue(
+            identifier='shirt', status='Pending')), [])
+
+    def test_rebuild(self):
+        self.transaction.transition('Completed')
+        expected = self.get_rollup()
+        DailyRevenue.objects.update(quantity=0, amount=0)
+        out = StringIO()
+        call_command('paypal_rebuild_revenue', chunk_size=1, stdout=out)
+        self.assertEqual(self.get_rollup(), expected)
+        self.assertIn('Rebuilt 2', out.getvalue())
+
+    def test_do_checkout(self):
+        form = DoExpressCheckoutForm(
+            user=self.transaction.user, transaction=self.transaction,
+            data={'token': self.transaction.transaction_id, 'PayerID': 'x'})
+        form.save_status('Pending')
+        self.assertEqual(self.get_rollup()[('cap', 'Pending')],
+                         (4, Decimal('6.00')))
+        self.assertNotIn(('cap', 'Checkout'), self.get_rollup())
+
+    def test_do_checkout_after_ipn(self):
+        form = DoExpressCheckoutForm(
+            user=self.transaction.user, transaction=self.transaction,
+            data={'token': self.transaction.transaction_id, 'PayerID': 'x'})
+        # an IPN completes the transaction while the form holds the old row
+        PaymentTransaction.objects.get(pk=self.transaction.pk).transition(
+            'Completed')
+        self.assertFalse(form.save_status('Pending'))
+        self.assertEqual(self.get_rollup(), {
+            ('shirt', 'Completed'): (2, Decimal('10.00')),
+            ('cap', 'Completed'): (4, Decimal('6.00')),
+        }, msg='Should not count the revenue twice.')
@@ -0,0 +1,104 @@
+"""Tests for the tracing of the ``paypal_express_checkout`` app."""
+from django.test import TestCase
+
+from django_libs.tests.factories import UserFactory
+from mock import Mock, patch
+
+from .factories import ItemFactory
+from .. import tracing
+from ..forms import DoExpressCheckoutForm, SetExpressCheckoutItemForm
+from ..ipn import handle_ipn
+from ..models import PaymentTransaction
+
+
+class SpanTestCase(TestCase):
+    """Tests for the ``span`` context manager."""
+    longMessage = True
+
+    def setUp(self):
+        self.exporter = tracing.InMemorySpanExporter()
+
+    def test_span(self):
+        self.assertIsNone(tracing.get_exporter(), msg=(
+            'Should not export spans by default.'))
+        with patch('paypal_express_checkout.tracing.get_exporter',
+                   Mock(return_value=self.exporter)):
+            with tracing.span('outer', token='abc') as outer:
+                self.assertIs(tracing.get_current_span(), outer)
+                with tracing.span('inner') as inner:
+                    inner.set_tag('ack', 'Success')
+                try:
+                    with tracing.span('failing', 'other'):
+                        raise ValueError('foo')
+                except ValueError:
+                    pass
+        self.assertIsNone(tracing.get_current_span())
+        self.assertEqual(
+            [span.name for span in self.exporter.get_spans()],
+            ['inner', 'failing', 'outer'], msg='Should export finished spans.')
+        self.assertEqual(outer.tags, {'token': 'abc'})
+        self.assertEqual(len(outer.correlation_id), 32)
+        self.assertEqual(inner.correlation_id, outer.correlation_id, msg=(
+            'Child spans should inherit the correlation id.'))
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertGreaterEqual(inner.duration, 0)
+        failing = self.exporter.get_spans('failing')[0]
+        self.assertEqual(failing.correlation_id, 'other')
+        self.assertEqual(failing.error, "ValueError('foo',)", msg=(
+            'Should record the exception of the block.'))
+
+    def test_exporter_error(self):
+        self.exporter.export = Mock(side_effect=IOError)
+        with patch('paypal_express_checkout.tracing.get_exporter',
+                   Mock(return_value=self.exporter)):
+            with tracing.span('step'):
+                pass
+        self.assertEqual(self.exporter.export.call_count, 1, msg=(
+            'Should not raise errors of the exporter.'))
+
+
+class PurchaseTracingTestCase(TestCase):
+    """Tests for the spans of a whole purchase."""
+    longMessage = True
+
+    def get_response(self, api_url, data, **kwargs):
+        if 'METHOD=SetExpressCheckout' in data:
+            return 'ACK=Success&TOKEN=abc123'
+        return 'ACK=Success&PAYMENTINFO_0_TRANSACTIONID=TXN123'
+
+    @patch('paypal_express_checkout.tracing.get_exporter')
+    @patch('paypal_express_checkout.client.get_transport')
+    def test_purchase(self, get_transport_mock, get_exporter_mock):
+        exporter = get_exporter_mock.return_value = (
+            tracing.InMemorySpanExporter())
+        get_transport_mock.return_value.post.side_effect = self.get_response
+        user = UserFactory()
+        item = ItemFactory()
+
+        form = SetExpressCheckoutItemForm(
+            user=user, data={'item': item.pk, 'quantity': 1})
+        self.assertTrue(form.is_valid())
+        form.set_checkout()
+        transaction = PaymentTransaction.objects.get()
+        form = DoExpressCheckoutForm(user=user, data={
+            'token': 'abc123', 'PayerID': 'PAYER123'})
+        self.assertTrue(form.is_valid())
+        form.do_checkout()
+        transaction = PaymentTransaction.objects.get()
+        handle_ipn(transaction, {
+            'txn_id': 'TXN123', 'payment_status': 'Completed'}, sender=None)
+
+        spans = exporter.get_spans()
+        self.assertEqual([span.name for span in spans], [
+            'call_paypal', 'set_checkout', 'call_paypal', 'do_checkout', 'ipn',
+        ], msg='Should trace every step and every call to PayPal.')
+        self.assertEqual(
+            set(span.correlation_id for span in spans),
+            set([transaction.correlation_id]), msg=(
+                'Should correlate all spans via the transaction.'))
+        self.assertEqual(spans[0].tags, {
+            'method': 'SetExpressCheckout', 'ack': 'Success'})
+        self.assertEqual(spans[1].tags['token'], 'abc123')
+        self.assertEqual(spans[2].tags['token'], 'abc123')
+        self.assertEqual(spans[3].tags['transaction_id'], 'TXN123')
+        self.assertEqual(spans[4].tags['applied'], True)
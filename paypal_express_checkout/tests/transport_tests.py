@@ -0,0 +1,125 @@
+"""Tests for the transports of the ``paypal_express_checkout`` app."""
+import httplib
+import socket
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from django.test import TestCase
+
+from mock import patch
+
+from .. import transport
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Echoes the posted body and keeps the connection open."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.connections.add(self.client_address)
+        status = 500 if body == 'fail' else 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return
+
+
+class PooledTransportTestCase(TestCase):
+    """Tests for the ``PooledTransport`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}/nvp'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post(self):
+        pooled_transport = transport.PooledTransport(maxsize=2)
+        self.assertEqual(pooled_transport.post(self.url, 'ACK=Success'),
+                         'ACK=Success', msg=(
+                             'Should return the response body.'))
+        pooled_transport.post(self.url, 'ACK=Success')
+        self.assertEqual(len(self.server.connections), 1, msg=(
+            'Should reuse the kept-alive connection.'))
+
+        self.assertRaises(
+            httplib.HTTPException, pooled_transport.post, self.url, 'fail')
+        pooled_transport.close()
+
+    def test_read_timeout(self):
+        pooled_transport = transport.PooledTransport(read_timeout=0.01)
+        with patch.object(KeepAliveHandler, 'do_POST',
+                          lambda handler: time.sleep(0.5)):
+            self.assertRaises(
+                socket.timeout, pooled_transport.post, self.url, 'ACK')
+
+    def test_idle_timeout(self):
+        pooled_transport = transport.PooledTransport(idle_timeout=0)
+        pool = pooled_transport.get_pool('http', '127.0.0.1', 1)
+        connection, reused = pool.get()
+        self.assertFalse(reused, msg='Should open a new connection.')
+        pool.put(connection)
+        with patch.object(transport.time, 'time', return_value=1e12):
+            connection, reused = pool.get()
+        self.assertFalse(reused, msg=(
+            'Should not reuse connections that exceeded the idle timeout.'))
+        pool.discard(connection)
+
+    def test_reconnects_stale_connection(self):
+        pooled_transport = transport.PooledTransport()
+        pooled_transport.post(self.url, 'ACK=Success')
+        pool = pooled_transport.get_pool(
+            'http', '127.0.0.1', self.server.server_port)
+        pool._idle[0][0].sock.close()
+        self.assertEqual(pooled_transport.post(self.url, 'ACK=Success'),
+                         'ACK=Success', msg=(
+                             'Should retry once on a fresh connection.'))
+
+    def test_does_not_resend_sent_request(self):
+        pooled_transport = transport.PooledTransport()
+        pooled_transport.post(self.url, 'ACK=Success')
+        requests = []
+
+        def close_without_answer(handler):
+            handler.rfile.read(int(handler.headers['Content-Length']))
+            requests.append(handler.client_address)
+            handler.close_connection = True
+
+        with patch.object(KeepAliveHandler, 'do_POST', close_without_answer):
+            self.assertRaises(httplib.BadStatusLine, pooled_transport.post,
+                              self.url, 'METHOD=DoExpressCheckoutPayment')
+        self.assertEqual(len(requests), 1, msg=(
+            'Should not resend a request that reached the server.'))
+
+
+class GetTransportTestCase(TestCase):
+    """Tests for the ``get_transport`` function."""
+    longMessage = True
+
+    def test_function(self):
+        self.assertIsInstance(
+            transport.get_transport(), transport.PooledTransport, msg=(
+                'Should return an instance of the configured transport.'))
+        self.assertIs(transport.get_transport(), transport.get_transport(),
+                      msg='Should return the same instance per process.')
+        old_transport = transport.get_transport()
+        with patch.object(transport.os, 'getpid', return_value=-1):
+            self.assertIsNot(transport.get_transport(), old_transport, msg=(
+                'Should create a new instance after a fork.'))
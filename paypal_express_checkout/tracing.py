@@ -0,0 +1,187 @@
+"""
+Tracing spans for the steps of a purchase.
+
+A purchase spans several requests: ``set_checkout``, the redirect to PayPal,
+``do_checkout`` and the IPN. The spans of all of them carry the same
+correlation id, which is stored as ``PaymentTransaction.correlation_id``.
+Calls to PayPal are recorded as child spans of the step they belong to.
+
+Finished spans are handed to the exporter of ``PAYPAL_TRACING_EXPORTER``.
+There is none by default, so spans only cost a few attribute assignments.
+
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.utils.module_loading import import_string
+
+from . import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex
+
+
+class Span(object):
+    """
+    A timed step of a purchase.
+
+    :param name: The name of the step, e.g. ``do_checkout``.
+    :param correlation_id: The id shared by all spans of a purchase.
+    :param parent: The ``Span`` this span was started in.
+    :param tags: A dictionary of e.g. the token or the PayPal ``METHOD``.
+
+    """
+    def __init__(self, name, correlation_id, parent=None, tags=None):
+        self.name = name
+        self.correlation_id = correlation_id
+        self.span_id = '{0:016x}'.format(random.getrandbits(64))
+        self.parent_id = parent.span_id if parent is not None else None
+        self.tags = tags or {}
+        self.error = None
+        self.start = time.time()
+        self.end = None
+
+    def __repr__(self):
+        return '<Span {0} {1}>'.format(self.name, self.correlation_id)
+
+    @property
+    def duration(self):
+        """The duration in seconds, or ``None`` while the span is open."""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set_tag(self, key, value):
+        self.tags[key] = value
+
+
+class BaseSpanExporter(object):
+    """
+    Interface every span exporter has to implement.
+
+    ``export`` is called in the thread of the request when a span ends, so
+    exporters that send spans over the network should queue them.
+
+    """
+    def export(self, span):
+        raise NotImplementedError
+
+
+class InMemorySpanExporter(BaseSpanExporter):
+    """Keeps the finished spans in a list. Meant for tests."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self.lock:
+            self.spans = []
+
+    def get_spans(self, name=None):
+        """Returns the finished spans, optionally only those of ``name``."""
+        return [
+            span for span in self.spans if name is None or span.name == name]
+
+
+class LoggingSpanExporter(BaseSpanExporter):
+    """Logs every finished span as one line."""
+    def export(self, span):
+        logger.info(
+            'span={0} correlation_id={1} span_id={2} parent_id={3}'
+            ' duration={4:.6f} error={5!r} {6}'.format(
+                span.name, span.correlation_id, span.span_id, span.parent_id,
+                span.duration, span.error, ' '.join(
+                    '{0}={1!r}'.format(key, value)
+                    for key, value in sorted(span.tags.items()))))
+
+
+_local = threading.local()
+
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """
+    Returns the span exporter of the current process, or ``None``.
+
+    The class is taken from the ``PAYPAL_TRACING_EXPORTER`` setting.
+
+    """
+    global _exporter, _exporter_pid
+    if not settings.TRACING_EXPORTER:
+        return None
+    pid = os.getpid()
+    if _exporter is not None and _exporter_pid == pid:
+        return _exporter
+    with _exporter_lock:
+        if _exporter is None or _exporter_pid != pid:
+            _exporter = import_string(settings.TRACING_EXPORTER)()
+            _exporter_pid = pid
+        return _exporter
+
+
+def get_current_span():
+    """Returns the innermost open span of the current thread, or ``None``."""
+    spans = getattr(_local, 'spans', None)
+    return spans[-1] if spans else None
+
+
+def get_correlation_id():
+    """Returns the correlation id of the current span, or ``None``."""
+    current = get_current_span()
+    return current.correlation_id if current is not None else None
+
+
+@contextmanager
+def span(name, correlation_id=None, **tags):
+    """
+    Opens a ``Span`` for the block and exports it when the block ends.
+
+    ::
+
+        with span('do_checkout', transaction.correlation_id,
+                  token=transaction.transaction_id) as current:
+            ...
+            current.set_tag('ack', 'Success')
+
+    :param correlation_id: Defaults to the correlation id of the current
+      span, or a new one if there is no current span.
+
+    """
+    parent = get_current_span()
+    if not correlation_id:
+        correlation_id = (
+            parent.correlation_id if parent is not None
+            else new_correlation_id())
+    current = Span(name, correlation_id, parent, tags)
+    spans = _local.__dict__.setdefault('spans', [])
+    spans.append(current)
+    try:
+        yield current
+    except Exception as ex:
+        current.error = repr(ex)
+        raise
+    finally:
+        spans.pop()
+        current.end = time.time()
+        exporter = get_exporter()
+        if exporter is not None:
+            try:
+                exporter.export(current)
+            except Exception:
+                logger.exception('Could not export {0!r}.'.format(current))
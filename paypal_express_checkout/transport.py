@@ -0,0 +1,272 @@
+"""HTTP transports for talking to the PayPal API."""
+import httplib
+import os
+import select
+import ssl
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from collections import deque
+
+from django.utils.module_loading import import_string
+
+from . import settings
+
+
+class HTTPStatusError(httplib.HTTPException):
+    """Raised when the API answers with a HTTP error status."""
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+        super(HTTPStatusError, self).__init__(
+            'HTTP Error {0}: {1}'.format(status, reason))
+
+
+class BaseTransport(object):
+    """
+    Interface every PayPal transport has to implement.
+
+    A transport only moves bytes: it posts an already encoded NVP payload to
+    an URL and returns the raw response body. Encoding and parsing stays in
+    ``PayPalFormMixin.call_paypal``.
+
+    """
+    def post(self, url, data, timeout=None):
+        """
+        Posts ``data`` to ``url`` and returns the response body as a string.
+
+        ``timeout`` overrides the seconds to wait for the response of this
+        request. Should raise ``httplib.HTTPException``, ``urllib2.URLError``
+        or ``socket.error`` (which includes ``socket.timeout``) if the request
+        fails.
+
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases all resources held by this transport."""
+        return
+
+
+class UrllibTransport(BaseTransport):
+    """Opens a new connection for every request, using ``urllib2``."""
+    def post(self, url, data, timeout=None):
+        return urllib2.urlopen(
+            url, data=data, timeout=timeout or settings.READ_TIMEOUT).read()
+
+
+def is_connection_dropped(connection):
+    """
+    Returns ``True`` if the server has closed an idle ``connection``.
+
+    An idle kept-alive socket only becomes readable when the server sent EOF
+    (or garbage), so it must not be used for another request.
+
+    """
+    if connection.sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
+
+
+class ConnectionPool(object):
+    """
+    A thread safe pool of persistent connections to a single host.
+
+    :param scheme: ``http`` or ``https``.
+    :param host: The host to connect to.
+    :param port: The port to connect to.
+    :param maxsize: The maximum number of connections that may be open (idle
+      or in use) at the same time. Callers block until a connection is
+      returned to the pool.
+    :param idle_timeout: Connections that have been idle for longer than this
+      amount of seconds are closed instead of being reused.
+    :param ssl_context: The ``ssl.SSLContext`` shared by all connections of
+      this pool.
+    :param connect_timeout: Seconds to wait for a connection to be
+      established.
+    :param read_timeout: Seconds to wait for the server to send data on an
+      established connection.
+
+    """
+    def __init__(self, scheme, host, port=None, maxsize=10, idle_timeout=60,
+                 ssl_context=None, connect_timeout=None, read_timeout=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout,
+                context=self.ssl_context)
+        return httplib.HTTPConnection(
+            self.host, self.port, timeout=self.connect_timeout)
+
+    def connect(self, connection):
+        """Connects ``connection`` and switches it to the read timeout."""
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+
+    def _evict_idle(self, now):
+        """Closes idle connections that exceeded ``idle_timeout``."""
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            self._idle.popleft()[0].close()
+
+    def get(self):
+        """
+        Returns a tuple of ``(connection, reused)``.
+
+        ``reused`` is ``True`` if the connection has been used before and
+        might therefore have been closed by the server in the meantime.
+
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._evict_idle(time.time())
+            while self._idle:
+                connection = self._idle.pop()[0]
+                if is_connection_dropped(connection):
+                    connection.close()
+                    continue
+                return connection, True
+        return self._new_connection(), False
+
+    def put(self, connection):
+        """Returns a healthy connection to the pool."""
+        with self._lock:
+            self._idle.append((connection, time.time()))
+        self._slots.release()
+
+    def discard(self, connection):
+        """Closes a broken connection and frees its slot."""
+        connection.close()
+        self._slots.release()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.popleft()[0].close()
+
+
+class PooledTransport(BaseTransport):
+    """
+    Keeps persistent HTTP/1.1 connections to the PayPal API.
+
+    One ``ConnectionPool`` is created per host. All HTTPS connections share
+    one ``ssl.SSLContext``, so certificates are only loaded once per process
+    and a kept-alive connection skips both the TCP and the TLS handshake.
+
+    """
+    def __init__(self, maxsize=None, idle_timeout=None, connect_timeout=None,
+                 read_timeout=None):
+        self.maxsize = maxsize or settings.POOL_MAXSIZE
+        self.idle_timeout = (
+            settings.POOL_IDLE_TIMEOUT if idle_timeout is None
+            else idle_timeout)
+        self.connect_timeout = connect_timeout or settings.CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.READ_TIMEOUT
+        self.ssl_context = ssl.create_default_context()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = ConnectionPool(
+                    scheme, host, port, maxsize=self.maxsize,
+                    idle_timeout=self.idle_timeout,
+                    ssl_context=self.ssl_context,
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout)
+            return self._pools[key]
+
+    def post(self, url, data, timeout=None):
+        parsed_url = urlparse.urlsplit(url)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path = '{0}?{1}'.format(path, parsed_url.query)
+        pool = self.get_pool(
+            parsed_url.scheme, parsed_url.hostname, parsed_url.port)
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Connection': 'keep-alive',
+        }
+        while True:
+            connection, reused = pool.get()
+            try:
+                if connection.sock is None:
+                    pool.connect(connection)
+                connection.sock.settimeout(timeout or self.read_timeout)
+                connection.request('POST', path, data, headers)
+            except socket.timeout:
+                pool.discard(connection)
+                raise
+            except socket.error:
+                pool.discard(connection)
+                if reused:
+                    # The server has closed the kept-alive connection, so
+                    # the request could not be sent and is safe to resend.
+                    continue
+                raise
+            except Exception:
+                pool.discard(connection)
+                raise
+            try:
+                response = connection.getresponse()
+                body = response.read()
+            except Exception:
+                # PayPal might have processed the request already, so only
+                # the ``RetryPolicy`` may decide to repeat it.
+                pool.discard(connection)
+                raise
+            if response.will_close:
+                pool.discard(connection)
+            else:
+                pool.put(connection)
+            if response.status >= 400:
+                raise HTTPStatusError(response.status, response.reason)
+            return body
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Returns the transport instance of the current process.
+
+    The class is taken from the ``PAYPAL_TRANSPORT`` setting. The instance is
+    re-created after a fork, so that worker processes never share sockets.
+
+    """
+    global _transport, _transport_pid
+    pid = os.getpid()
+    with _transport_lock:
+        if _transport is None or _transport_pid != pid:
+            _transport = import_string(settings.TRANSPORT)()
+            _transport_pid = pid
+        return _transport
@@ -4,6 +4,7 @@ from django.conf.urls import url
 from paypal_express_checkout.views import (
     DoExpressCheckoutView,
     IPNListenerView,
+    MetricsView,
     PaymentCancelView,
     PaymentErrorView,
     PaymentSuccessView,
@@ -47,4 +48,10 @@ urlpatterns = [
         IPNListenerView.as_view(),
         name='ipn_listener',
     ),
+
+    url(
+        r'^metrics/$',
+        MetricsView.as_view(),
+        name='paypal_metrics',
+    ),
 ]
@@ -1,8 +1,40 @@
 """Utilities for the paypal_express_checkout app."""
 import urllib
+import urlparse
+
+from .constants import CREDENTIAL_FIELDS
 
 
 def urlencode(data):
     for key, value in data.iteritems():
         data[key] = str(value).encode('utf-8')
     return urllib.urlencode(data)
+
+
+def strip_credentials(data, fields=CREDENTIAL_FIELDS):
+    """Removes the API credentials from the urlencoded NVP string ``data``."""
+    if not data:
+        return data
+    return urllib.urlencode([
+        (key, value)
+        for key, value in urlparse.parse_qsl(data, keep_blank_values=True)
+        if key not in fields])
+
+
+def delete_in_batches(queryset, batch_size=1000):
+    """
+    Deletes the objects of ``queryset`` in batches of ``batch_size``.
+
+    Every batch is deleted by primary key in its own short statement, so that
+    pruning large tables does not hold long locks. Returns the number of
+    deleted objects.
+
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list(
+            'pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
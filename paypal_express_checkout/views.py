@@ -1,19 +1,29 @@
 """Views for the ``paypal_express_checkout`` app."""
+import logging
+import time
+
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+)
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import FormView, TemplateView, View
 from django.utils.decorators import method_decorator
 
 from django_libs.utils.decorators import conditional_decorator
 
-from . import settings
+from . import metrics, settings
+from .client import CALL_ERRORS
 from .constants import PAYMENT_STATUS
 from .forms import (
     DoExpressCheckoutForm,
 )
+from .ipn import IPNVerifier, enqueue_ipn, get_transaction_id, handle_ipn
 from .models import PaymentTransaction
-from .signals import payment_completed, payment_status_updated
 from .settings import SET_CHECKOUT_FORM
 
 
@@ -23,6 +33,8 @@ module_name = '.'.join(SET_CHECKOUT_FORM.split('.')[:-1])
 module = __import__(module_name, fromlist=[class_name])
 SetExpressCheckoutForm = getattr(module, class_name)
 
+logger = logging.getLogger(__name__)
+
 
 class PaymentViewMixin(object):
     """A Mixin to combine common methods of several payment related views."""
@@ -75,7 +87,8 @@ class DoExpressCheckoutView(PaymentViewMixin, FormView):
 
     def form_valid(self, form):
         """When the form is valid, the form should handle the PayPal call."""
-        return form.do_checkout()
+        with metrics.db_timer('do_checkout'):
+            return form.do_checkout()
 
     def get_context_data(self, **kwargs):
         ctx = super(DoExpressCheckoutView, self).get_context_data(**kwargs)
@@ -88,7 +101,7 @@ class DoExpressCheckoutView(PaymentViewMixin, FormView):
 
     def get_form_kwargs(self):
         kwargs = super(DoExpressCheckoutView, self).get_form_kwargs()
-        kwargs.update({'user': self.user})
+        kwargs.update({'user': self.user, 'transaction': self.transaction})
         # PayPal makes a GET request with the data, so we check if the GET data
         # is populated and overwrite form data with it.
         if any(self.request.GET):
@@ -124,7 +137,8 @@ class SetExpressCheckoutView(PaymentViewMixin, FormView):
 
     def form_valid(self, form):
         """When the form is valid, the form should handle the PayPal call."""
-        return form.set_checkout()
+        with metrics.db_timer('set_checkout'):
+            return form.set_checkout()
 
     def get_form_kwargs(self):
         kwargs = super(SetExpressCheckoutView, self).get_form_kwargs()
@@ -133,31 +147,95 @@ class SetExpressCheckoutView(PaymentViewMixin, FormView):
 
 
 class IPNListenerView(View):
-    """This view handles an IPN from PayPal."""
+    """
+    This view handles an IPN from PayPal.
+
+    If ``PAYPAL_IPN_MODE`` is ``queue``, the IPN is only stored as a
+    ``QueuedIPN`` and acknowledged right away. The ``paypal_process_ipns``
+    command verifies and applies it later. Otherwise the IPN is verified with
+    PayPal here, if ``PAYPAL_IPN_VERIFY`` is set.
+
+    The outcome is counted in the ``result`` label of the
+    ``paypal_ipns_total`` metric.
+
+    """
     @csrf_exempt
     def dispatch(self, request, *args, **kwargs):
-        payment_status = request.POST.get('payment_status')
-
-        # In case of a refund, we will not create a new transaction. We will
-        # alter the status of the original transaction instead.
-        if payment_status == PAYMENT_STATUS['refunded']:
-            transaction_id = request.POST.get('parent_txn_id')
-        else:
-            transaction_id = request.POST.get('txn_id')
+        if request.method != 'POST':
+            return self.handle(request, *args, **kwargs)
+        self.result = 'error'
+        start = time.time()
+        try:
+            return self.handle(request, *args, **kwargs)
+        finally:
+            metrics.observe(
+                'paypal_ipn_duration_seconds', time.time() - start,
+                {'mode': settings.IPN_MODE})
+            status = request.POST.get('payment_status')
+            if status not in PAYMENT_STATUS.values():
+                # the label values have to be bounded
+                status = 'other'
+            metrics.increment('paypal_ipns_total', {
+                'payment_status': status, 'result': self.result})
+
+    def handle(self, request, *args, **kwargs):
+        if settings.IPN_MODE == 'queue':
+            if request.method != 'POST':
+                return self.http_method_not_allowed(request, *args, **kwargs)
+            enqueue_ipn(request)
+            self.result = 'queued'
+            return HttpResponse()
+
+        if settings.IPN_VERIFY and request.method == 'POST':
+            try:
+                verified = IPNVerifier().verify(request.body)
+            except CALL_ERRORS as ex:
+                logger.warning('IPN verification failed: {0!r}'.format(ex))
+                self.result = 'verification_error'
+                # PayPal resends the IPN if we do not answer with 200
+                return HttpResponse(status=503)
+            if not verified:
+                logger.warning('Received an IPN that PayPal did not verify.')
+                self.result = 'unverified'
+                return HttpResponseBadRequest()
 
         try:
             self.payment_transaction = PaymentTransaction.objects.get(
-                transaction_id=transaction_id)
+                transaction_id=get_transaction_id(request.POST))
         except PaymentTransaction.DoesNotExist:
+            self.result = 'unknown_transaction'
             raise Http404
 
         return super(IPNListenerView, self).dispatch(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
-        payment_status = request.POST.get('payment_status')
-        self.payment_transaction.status = payment_status
-        self.payment_transaction.save()
-        if payment_status == PAYMENT_STATUS['completed']:
-            payment_completed.send(self, transaction=self.payment_transaction)
-        payment_status_updated.send(self, transaction=self.payment_transaction)
+        with metrics.db_timer('ipn'):
+            applied = handle_ipn(
+                self.payment_transaction, request.POST, sender=self)
+        self.result = 'applied' if applied else 'ignored'
         return HttpResponse()
+
+
+class MetricsView(View):
+    """
+    Renders the metrics of the current process for Prometheus.
+
+    Staff users may always see them. Scrapers have to send the
+    ``PAYPAL_METRICS_TOKEN`` as ``Authorization: Bearer <token>`` header.
+
+    """
+    def get(self, request, *args, **kwargs):
+        if not self.is_authorized(request):
+            return HttpResponseForbidden()
+        text = metrics.get_backend().render()
+        if text is None:
+            raise Http404
+        return HttpResponse(text, content_type=metrics.CONTENT_TYPE)
+
+    def is_authorized(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and user.is_staff:
+            return True
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(settings.METRICS_TOKEN) and constant_time_compare(
+            authorization, 'Bearer {0}'.format(settings.METRICS_TOKEN))